@@ -1,7 +1,8 @@
 import warnings
-import logging as log
-
-log.basicConfig(level=log.INFO)
+import tracing
+import registry
+from emit import ClassEmitter
+from context import current
 
 TYPE, SYNTAX = range(2)
 
@@ -12,13 +13,16 @@ def ASTError(which: int, msg: str):
         raise SyntaxError(f"ASTError: " + msg)
     exit(1)
 
+def branch_on_value(node, label: str, when: bool) -> None:
+    # any Bool expression: compute it and jump on the result
+    node.evaluate()
+    current().emitter.instr("jump_if" if when else "jump_ifnot", label)
+
 class Obj():
     """
     Main Object class for Quack. This shouldn't ever be called directly.
     """
-    ASM_FILE = "out.asm"
-
-    methods: list[str] = ["string", "print", "equals"]
+    __slots__ = ("val", "type")
 
     def __init__(self, value: None):
         self.val = value
@@ -27,42 +31,61 @@ class Obj():
     def get_type(self) -> str:
         return self.type
 
-    def check(self):
+    def typecheck(self):
         return self.type
 
     def evaluate(self):
         # with open(Obj.ASM_FILE, "a+") as f:
         #     print(f"\tconst {self.val}", file=f)
         # f.close()
-        ASTNode.buffer += f"\tconst {self.val}\n"
+        current().emitter.instr("const", self.val)
         return self.type
 
+    def branch(self, label: str, when: bool) -> None:
+        """
+        Code for a Bool used as a condition: jump to label if it is `when`, otherwise fall through.
+        """
+        branch_on_value(self, label, when)
+
     def __str__(self):
         return f"{self.type}: {self.val}"
     
 class Int(Obj):
-    methods: list[str] = ["string", "print", "equals", "plus", "minus", "times", "divide", "less"]
+    __slots__ = ()
+
+    # literals are never modified once parsed, so every occurrence of a small Int shares one node
+    SMALL = range(-128, 1024)
+    _interned: dict[int, "Int"] = {}
+
+    def __new__(cls, value: int):
+        if cls is not Int or value not in Int.SMALL:
+            return super().__new__(cls)
+        node = Int._interned.get(value)
+        if node is None:
+            node = Int._interned.setdefault(value, super().__new__(cls))
+        return node
 
     def __init__(self, value: int):
-        super().__init__(value)
+        # no super().__init__: a shared node must never be seen with a half-set type
         self.val = value
         self.type = "Int"
 
     def evaluate(self):
-        if self.val < 0:
+        if self.val < 0 and current().opt_level == 0:
             # print(f"\tconst 0", file=f)
             # print(f"\tconst {abs(self.val)}", file=f)
             # print(f"\tcall Int:minus", file=f)
-            ASTNode.buffer += f"\tconst 0\n\tconst {abs(self.val)}\n\tcall Int:minus\n"
+            current().emitter.instr("const", 0)
+            current().emitter.instr("const", abs(self.val))
+            current().emitter.instr("call", "Int:minus")
         else:
             # print(f"\tconst {self.val}", file=f)
-            ASTNode.buffer += f"\tconst {self.val}\n"
+            current().emitter.instr("const", self.val)
         return self.type
 
 
 class String(Obj):
-    # list of methods for the String class
-    methods: list[str] = ["print"]
+    __slots__ = ()
 
     def __init__(self, value: str):
         super().__init__(value)
@@ -70,11 +93,18 @@ class String(Obj):
         self.type = "String"
 
 class Bool(Obj):
-    # list of methods for the Bool class
-    methods: list[str] = ["print", "string", "and", "or"]
+    __slots__ = ("true_false",)
+
+    # true and false are one node each, shared by every occurrence
+    _interned: dict[str, "Bool"] = {}
+
+    def __new__(cls, value: str):
+        node = Bool._interned.get(value)
+        if node is None:
+            node = Bool._interned.setdefault(value, super().__new__(cls))
+        return node
 
     def __init__(self, value: str):
-        super().__init__(value)
         self.val = value
         if self.val == "true":
             self.true_false = True
@@ -86,12 +116,24 @@ class Bool(Obj):
         # with open(Obj.ASM_FILE, "a") as f:
         #     print(f"\tconst {self.val}", file=f)
         # f.close()
-        ASTNode.buffer += f"\tconst {self.val}\n"
+        current().emitter.instr("const", self.val)
         return self.type
 
+    def branch(self, label: str, when: bool) -> None:
+        # known at compile time: an unconditional jump or nothing
+        if self.true_false == when:
+            current().emitter.instr("jump", label)
+
 class Nothing(Obj):
-    
-    methods: list[str] = []
+    __slots__ = ()
+
+    # there is only one nothing
+    _instance: "Nothing" = None
+
+    def __new__(cls):
+        if Nothing._instance is None:
+            Nothing._instance = super().__new__(cls)
+        return Nothing._instance
 
     def __init__(self):
         self.val = None
@@ -104,10 +146,12 @@ class Nothing(Obj):
         # with open(Obj.ASM_FILE, "a") as f:
         #     print(f"\tconst none", file=f)
         # f.close()
-        ASTNode.buffer += f"\tconst none\n"
+        current().emitter.instr("const", "nothing")
         return self.type
 
 class Variable(Obj):
+    __slots__ = ("name",)
+
     def __init__(self, var_name: str, decl_type: str = None):
         self.name = var_name
         self.type = decl_type
@@ -124,24 +168,27 @@ class Variable(Obj):
     def __str__(self):
         return f"Variable: {self.type} {self.name}"
     
-    def store(self) -> None:
-        log.info(f"{self}")
+    def declare(self) -> None:
+        # assignment target: the variable is live from here on
+        tracing.checker.info("%s", self)
         ASTNode.add_var(self.name, self.type)
+
+    def store(self) -> None:
         # with open(Obj.ASM_FILE, "a") as f:
         #     print(f"\tstore {self.name}", file=f)
         # f.close()
-        ASTNode.buffer += f"\tstore {self.name}\n"
+        current().emitter.instr("store", self.name)
         return self.type
 
-    def check(self):
-        # check that the variable exists on evaluate()
+    def typecheck(self):
+        # check that the variable exists at this point of the program
         tpe = ASTNode.locate_var(self.name) 
         if tpe is None:
             ASTError(SYNTAX, f"Uninitialized variable {self.name}")
+        return self.type
 
     def evaluate(self) -> None:
-        self.check()
-        ASTNode.buffer += f"\tload {self.name}\n"
+        current().emitter.instr("load", self.name)
         return self.type
 
 
@@ -149,130 +196,150 @@ class Variable(Obj):
 Base class. Mainly used for generating loop/cond labels
 """
 class ASTNode():
-    if_stmts = 0
-    elif_stmts = 0
-    else_stmts = 0
-    loops = 0
-    block_label = 0
-    boolcomp_label = 0
-    typecase_label = 0
-    typecase_gen_label = 0
-
     """
+    The checker and code generator keep their state in the current CompilationContext (context.py):
     scope & block_level contain the live set information for variables
     each block has a level, the live set is the union of the current level and 
     all previous levels up to 0. When a block ends, it is popped off the scope.
 
     Variable name conflicts prioritize the more local scope
-    """
-    scope: dict[str: str] = {}
 
-    args: list[str] = {}
-    block_level = 0
+    Compiling is two passes over the tree. typecheck() walks it once, in program order, keeping
+    the scope, checking every node and annotating it with its type (and whatever else code
+    generation needs, like a method's locals); every parent type checks each child exactly once,
+    so the pass is linear in the size of the tree. It returns what the node leaves as the value
+    of a block (the type of an expression, None for most statements). evaluate() then generates
+    code from those annotations and never checks anything again.
 
-    buffer = f""
-    program = f""
+    A Bool expression used as a condition (if, elif, while, the operands of and/or/not) is
+    generated with branch(label, when) instead, which jumps to label when the condition is
+    `when` and falls through otherwise. Comparisons, and/or and not jump on their result
+    directly, without pushing a Bool to test it again.
 
-    parsing_class = None
+    Nodes are slotted: a program has tens of thousands of them, and a __slots__ instance
+    is a fraction of the size of one with a __dict__. Every subclass lists its attributes.
+    """
+    __slots__ = ()
 
-    def __init__(self):
-        self.ret_type = "Nothing"
-    
-    def gen_if_label():
-        ret = f"{ASTNode.if_stmts}"
-        ASTNode.if_stmts += 1
-        return ret
-    
     def gen_elif_label():
-        ret = f"{ASTNode.elif_stmts}"
-        ASTNode.elif_stmts += 1
+        ctx = current()
+        ret = f"{ctx.elif_stmts}"
+        ctx.elif_stmts += 1
         return ret
     
     def gen_else_label():
-        ret = f"{ASTNode.else_stmts}"
-        ASTNode.else_stmts += 1
+        ctx = current()
+        ret = f"{ctx.else_stmts}"
+        ctx.else_stmts += 1
         return ret
     
     def gen_loop_label():
-        ret = f"{ASTNode.loops}"
-        ASTNode.loops += 1
+        ctx = current()
+        ret = f"{ctx.loops}"
+        ctx.loops += 1
         return ret
     
     def fetch_and_update_block_label():
-        ret = f"block{ASTNode.block_label}"
-        ASTNode.block_label += 1
+        ctx = current()
+        ret = f"block{ctx.block_label}"
+        ctx.block_label += 1
         return ret
     
     def gen_boolcomp_label():
-        ret = f"cond{ASTNode.boolcomp_label}"
-        ASTNode.boolcomp_label += 1
+        ctx = current()
+        ret = f"cond{ctx.boolcomp_label}"
+        ctx.boolcomp_label += 1
         return ret
     
     def gen_typecase_label():
-        ret = f"{ASTNode.typecase_label}"
-        ASTNode.typecase_label += 1
+        ctx = current()
+        ret = f"{ctx.typecase_label}"
+        ctx.typecase_label += 1
         return ret
     
     def gen_typecase_gen_label():
-        ret = f"{ASTNode.typecase_gen_label}"
-        ASTNode.typecase_gen_label += 1
+        ctx = current()
+        ret = f"{ctx.typecase_gen_label}"
+        ctx.typecase_gen_label += 1
         return ret
     
     def locate_var(name) -> str:
-        # log.info(f"{ASTNode.scope}")
-        try:
-            return ASTNode.scope[name]
-        except:
-            try:
-                return ASTNode.args[name]
-            except:
-                return None
+        # log.info(f"{current().scope}")
+        ctx = current()
+        if name in ctx.scope:
+            return ctx.scope[name]
+        return ctx.args.get(name)
     
     def add_var(name, tpe) -> None:
-        ASTNode.scope[name] = tpe
+        current().scope[name] = tpe
 
-    def reset_variables():
-        ASTNode.scope = {}
-        ASTNode.args = {}
-    
-    def get_locals():
-        vars = []
-        ret = f""
-        for v in list(ASTNode.scope.keys()):
-            if v not in ASTNode.args:
-                vars.append(v)
-                ret += f",{v}"
-
-        if ret != f"":
-            return ret[1:]
-        return f""
-    
-    def set_asm_file(f: str):
-        Obj.ASM_FILE = f
+    def record_type(name, tpe, source: str = None) -> None:
+        # an assignment of tpe to a variable (from the variable source, if it is one)
+        ctx = current()
+        ctx.assigned.setdefault(name, set()).add(tpe)
+        if source is not None:
+            ctx.copies.setdefault(name, set()).add(source)
 
-        # clear the file
-        file = open(f, "w+")
-        file.close()
+    def uses_type_of(node, name) -> None:
+        # node is generated from the static type of the variable name
+        current().typed_uses.append((node, name))
 
-    def print_buffer():
-        ASTNode.program += ASTNode.buffer
-        ASTNode.buffer = f""
+    def settle_types() -> None:
+        """
+        At the end of a method or constructor body. The scope types a variable as what it was
+        last assigned, so one assigned values of more than one class (x = Rect(3), and
+        x = Square(5) in a branch) may hold either where it is used. The nodes using its
+        type are marked retyped, and the optimizations decide nothing from it. Neither do they
+        from a parameter's: only the arity of a call to a user method is checked, so an argument
+        may be of any class (None stands for that).
+        """
+        ctx = current()
+        types = {name: set(t) for name, t in ctx.assigned.items()}
+        for name in ctx.args:
+            types.setdefault(name, set()).update((ctx.args[name], None))
+        # y = x: y may hold whatever x does
+        changed = True
+        while changed:
+            changed = False
+            for name, sources in ctx.copies.items():
+                for source in sources:
+                    new = types.get(source, set()) - types[name]
+                    if new:
+                        types[name] |= new
+                        changed = True
+        for node, name in ctx.typed_uses:
+            node.retyped = len(types.get(name, ())) > 1
+        ctx.assigned, ctx.copies, ctx.typed_uses = {}, {}, []
 
-    def write():
-        ASTNode.print_buffer()
-        with open(Obj.ASM_FILE, "a+") as f:
-            print(ASTNode.program, file=f, end="")
-        f.close()
-        ASTNode.program = f""
+    def reset_variables():
+        current().scope = {}
+        current().args = {}
+        current().loop_vars = []
+    
+    def get_locals() -> list[str]:
+        ctx = current()
+        return [v for v in ctx.scope if v not in ctx.args] + \
+               [v for v in dict.fromkeys(ctx.loop_vars) if v not in ctx.scope and v not in ctx.args]
 
     def set_parse_class(name: str):
-        ASTNode.parsing_class = name
+        current().parsing_class = name
+
+    def resolve(node):
+        # the parser leaves bare names as strings, the type pass turns them into variables
+        if isinstance(node, str):
+            return Variable(node, ASTNode.locate_var(node))
+        return node
+
+    def branch(self, label: str, when: bool) -> None:
+        branch_on_value(self, label, when)
 
 """
 Block class: List of statements, to be evaluated in order.
 Implementing a class allows the .evaluate() method to be defined, which is helpful.
 """
 class Block(ASTNode):
+    __slots__ = ("statements",)
+
     def __init__(self, statements: list[ASTNode | Obj]):
         # a block is just a list of statements
         # but this way allows the evaluate method to be implemented
@@ -286,100 +353,94 @@ class Block(ASTNode):
             retstr += f", {s}"
         return retstr
 
+    def typecheck(self):
+        # check the list of statements
+        ret = "Nothing"
+        for i, s in enumerate(self.statements):
+            s = self.statements[i] = ASTNode.resolve(s)
+            ret = s.typecheck()
+
+        # this should always return the value of the return statement
+        return ret
+
     def evaluate(self):
         # evaluate the list of statements
-        ret = "Nothing"
         for s in self.statements:
-            ret = s.evaluate()
+            s.evaluate()
 
-        # this should always return the value of the return statement
         # log.debug(f"End of block\n{ASTNode.buffer}")
         # ASTNode.print_buffer()
-
-        return ret
     
 class Expression(ASTNode):
+    __slots__ = ("terms", "tokens", "type")
+
     # expression node
     # operator maps to functions
     ops = {"+": "plus", "-": "minus", "*": "multiply", "/": "divide"}
 
     def __init__(self, left: ASTNode | Obj, right: ASTNode | Obj, op: str):
-        self.left = left
-        self.right = right
+        # a chain of operators is one node, evaluated left to right: terms[0] tokens[0] terms[1] ...
+        # (a + b) * c included, so a generated chain of any length is no deeper than a + b.
+        # a - (b - c) is not one, the right operand is a term of its own
+        if isinstance(left, Expression):
+            self.terms, self.tokens = left.terms + [right], left.tokens + [op]
+        else:
+            self.terms, self.tokens = [left, right], [op]
         # this is old but it works
         # give objects type prio over other nodes
-        if isinstance(left, Obj):
-            self.type = left.type
-        elif isinstance(right, Obj):
-            self.type = right.type
-        else:
-            self.type = "Nothing"
-        
-        if op in "+-*/":
-            self.token = op
-            self.op = Expression.ops[op]
-        # this shouldn't ever happen
-        else:
+        objs = [t for t in self.terms if isinstance(t, Obj)]
+        self.type = objs[0].type if objs else "Nothing"
+
+        if op not in "+-*/":
+            # this shouldn't ever happen
             raise SyntaxError(f"op {op} does not exist in Quack!")
 
-    def check(self):
+    def typecheck(self):
         # operands can be any type but have to be the same
         # worry about implementation in actual call
-        if isinstance(self.left, str):
-            left = ASTNode.locate_var(self.left)
-            self.left = Variable(self.left, left)
-        
-        self.left.check()
-        left = self.left.type
-
-        if left is None:
-            ASTError(SYNTAX, f"Uninitialized variable {self.left}")
-
-        if isinstance(self.right, str):
-            right = ASTNode.locate_var(self.right)
-            self.right = Variable(self.right, right)
-        
-        self.right.check()
-        right = self.right.type
-
-        if right is None:
-            ASTError(SYNTAX, f"Uninitialized variable {self.right}")
-
-        # Also, because we changed when type checking and variable tracking happens, left.type and right.type may not be defined on initialization
-        if left != right:
-            ASTError(TYPE, f"Operands must have same type, not {left} and {right}.")
-        else:
-            # set self.type at this point
-            self.type = left
-
-        if self.type == "Int":
-            return
-        else:
-            try:
-                c = Class.classes[self.type]
-                if self.op not in c.get_methods():
-                    ASTError(SYNTAX, f"Method {self.token} ({self.op.upper()}) undefined for class {self.type}")
-            except:
-                ASTError(SYNTAX, f"Undefined class {self.type}.")
+        types = []
+        for i, term in enumerate(self.terms):
+            self.terms[i] = term = ASTNode.resolve(term)
+            term.typecheck()
+            if term.type is None:
+                ASTError(SYNTAX, f"Uninitialized variable {term}")
+            types.append(term.type)
+
+        # Also, because we changed when type checking and variable tracking happens, the types of the terms may not be defined on initialization
+        for tpe in types[1:]:
+            if tpe != types[0]:
+                ASTError(TYPE, f"Operands must have same type, not {types[0]} and {tpe}.")
+        # set self.type at this point
+        self.type = types[0]
+
+        for token in dict.fromkeys(self.tokens):
+            if Expression.ops[token] not in method_table(self.type):
+                ASTError(SYNTAX, f"Method {token} ({Expression.ops[token].upper()}) undefined for class {self.type}")
+        return self.type
 
     def evaluate(self):
-        self.check()
-
-        self.left.evaluate()
-        self.right.evaluate()
-
-        ASTNode.buffer += f"\tcall {self.type}:{self.op}\n"
+        self.terms[0].evaluate()
+        for token, term in zip(self.tokens, self.terms[1:]):
+            term.evaluate()
+            current().emitter.instr("call", f"{self.type}:{Expression.ops[token]}")
         return self.type
 
     def __str__(self):
-        return f"Expression: ({self.left} {self.token} {self.right}), {self.type}"
+        chain = " ".join(f"{token} {term}" for token, term in zip(self.tokens, self.terms[1:]))
+        return f"Expression: ({self.terms[0]} {chain}), {self.type}"
 
 class BoolComp(ASTNode):
-    def __init__(self, left: Expression | Int, right: Expression | Int, op: str):
-        # and/or
+    __slots__ = ("terms", "type", "op")
 
-        self.left = left
-        self.right = right
+    def __init__(self, left: ASTNode | Obj, right: ASTNode | Obj, op: str):
+        # and/or, a chain of one of them as one node: a and (b and c) is a and b and c, and a
+        # generated chain of any length is no deeper than a and b
+        self.terms = []
+        for term in (left, right):
+            if isinstance(term, BoolComp) and term.op == op:
+                self.terms.extend(term.terms)
+            else:
+                self.terms.append(term)
         self.type = "Bool"
 
         if op in ["and", "or"]:
@@ -387,78 +448,65 @@ class BoolComp(ASTNode):
         else:
             raise SyntaxError(f"op {op} does not exist in Quack!")
         
-    def check(self):
-        # check that both arguments are bools
-        if isinstance(self.left, str):
-            left = ASTNode.locate_var(self.left)
-            self.left = Variable(self.left, left)
-        else:
-            left = self.left.type
-
-        if left is None:
-            ASTError(SYNTAX, f"Uninitialized variable {self.left}")
-
-        if isinstance(self.right, str):
-            right = ASTNode.locate_var(self.right)
-            self.right = Variable(self.right, right)
-        else:
-            right = self.right.type
-
-        if right is None:
-            ASTError(SYNTAX, f"Uninitialized variable {self.right}")
-
-        if left != "Bool" or right != "Bool":
-            ASTError(TYPE, f"And/Or Comparison can only be executed for Boolean values, not {left}, {right}.")
+    def typecheck(self):
+        # check that every term is a bool
+        for i, term in enumerate(self.terms):
+            self.terms[i] = term = ASTNode.resolve(term)
+            term.typecheck()
+            if term.type is None:
+                ASTError(SYNTAX, f"Uninitialized variable {term}")
+            if term.type != "Bool":
+                ASTError(TYPE, f"And/Or Comparison can only be executed for Boolean values, not {term.type}.")
+        return self.type
 
     def __str__(self):
-        return f"BoolComp: {self.left} {self.op} {self.right}"
-    
-    def eval_or(self) -> None:
-        # generate label
-        label = ASTNode.gen_boolcomp_label()
-
-        # short circuit on first
-        self.left.evaluate()
-        # with open(Obj.ASM_FILE, "a+") as f:
-        #     print(f"\tjump_if short{label}", file=f)
-        # f.close()
-        ASTNode.buffer += f"\tjump_if short{label}\n"
-        # check second
-        self.right.evaluate()
-        ASTNode.buffer += f"\tjump {label}\nshort{label}:\n\tconst true\n\tjump {label}\n{label}:\n"
+        return "BoolComp: " + f" {self.op} ".join(str(term) for term in self.terms)
 
-        # continue
-
-    
-    def eval_and(self):
-        log.debug("and")
+    def evaluate(self):
+        tracing.codegen.debug(self.op)
         # generate label
         label = ASTNode.gen_boolcomp_label()
 
-        # short circuit on first
-        self.left.evaluate()
-        ASTNode.buffer += f"\tjump_ifnot short{label}\n"
-
-        # check second
-        self.right.evaluate()
-        ASTNode.buffer += f"\tjump {label}\nshort{label}:\n\tconst false\n\tjump {label}\n{label}:\n"
-        # continue
-
-    def evaluate(self):
-        self.check()
-        if self.op == "or":
-            self.eval_or()
-        elif self.op == "and":
-            self.eval_and()
+        # short circuit on every term but the last: or on the first true one, and on the first false one
+        decided = self.op == "or"
+        for term in self.terms[:-1]:
+            term.evaluate()
+            current().emitter.instr("jump_if" if decided else "jump_ifnot", f"short{label}")
+
+        # the last one is the value
+        self.terms[-1].evaluate()
+        current().emitter.instr("jump", label)
+        current().emitter.label(f"short{label}")
+        current().emitter.instr("const", "true" if decided else "false")
+        current().emitter.instr("jump", label)
+        current().emitter.label(label)
         return self.type
 
+    def branch(self, label: str, when: bool) -> None:
+        # or is decided as soon as one term is true, and as soon as one term is false
+        decided = self.op == "or"
+        if when == decided:
+            for term in self.terms:
+                term.branch(label, when)
+        else:
+            # the terms before the last can only decide against jumping
+            skip = ASTNode.gen_boolcomp_label()
+            for term in self.terms[:-1]:
+                term.branch(skip, decided)
+            self.terms[-1].branch(label, when)
+            current().emitter.label(skip)
+
 class IntComp(ASTNode):
+    __slots__ = ("left", "right", "type", "eval_type", "op", "temps")
+
     def __init__(self, left: Expression | Int, right: Expression | Int, op: str):
         self.left = left
         self.right = right
         self.type = "Bool"
 
         self.eval_type = "Nothing"
+        # the locals holding the operands of a <= or >= on a user class, named by typecheck
+        self.temps = None
 
         if op in [">", "<", "==", "<=", ">="]:
             self.op = op
@@ -468,21 +516,17 @@ class IntComp(ASTNode):
     def __str__(self):
         return f"IntComp: {self.left} _{self.op}_ {self.right}, eval_type = {self.eval_type}"
     
-    def check(self):
-        if isinstance(self.left, str):
-            left = ASTNode.locate_var(self.left)
-            self.left = Variable(self.left, left)
-        else:
-            left = self.left.type
+    def typecheck(self):
+        self.left = ASTNode.resolve(self.left)
+        self.left.typecheck()
+        left = self.left.type
 
         if left is None:
             ASTError(SYNTAX, f"Uninitialized variable {self.left}")
 
-        if isinstance(self.right, str):
-            right = ASTNode.locate_var(self.right)
-            self.right = Variable(self.right, right)
-        else:
-            right = self.right.type
+        self.right = ASTNode.resolve(self.right)
+        self.right.typecheck()
+        right = self.right.type
 
         if right is None:
             ASTError(SYNTAX, f"Uninitialized variable {self.right}")
@@ -491,55 +535,104 @@ class IntComp(ASTNode):
             ASTError(TYPE, "Comparison can only be executed for same types.")
         else:
             self.eval_type = left
-    
-    def evaluate(self):
-        self.check()
 
-        # log.debug(f"\n{ASTNode.buffer}")
-
-        # this is <, > - only need to check one thing
-        if len(self.op) == 1:
-            if self.op[0] == "<":
-                self.right.evaluate()
-                self.left.evaluate()
-            else:
-                self.left.evaluate()
-                self.right.evaluate()
-            ASTNode.buffer += f"\tcall {self.eval_type}:less\n"
+        method = "equals" if self.op == "==" else "less"
+        if method not in method_table(self.eval_type):
+            ASTError(TYPE, f"Comparison {self.op} is undefined for type {self.eval_type}.")
+        if self.op in ("<=", ">=") and self.eval_type not in BUILTIN_METHODS:
+            # named so no variable can clash
+            n = sum(1 for v in current().scope if v.startswith("$left"))
+            self.temps = (f"$left{n}", f"$right{n}")
+            for name in self.temps:
+                ASTNode.add_var(name, self.eval_type)
+        return self.type
 
-        # if len = 2, either ==, which is one call..
-        elif self.op == "==":
+    def either(self) -> BoolComp:
+        # a user class's less may order only partially, so there a <= b is a < b or a == b and
+        # not the negation of b < a: each operand is evaluated once (in the order compare()
+        # evaluates them) into its local, and both calls are made on the locals
+        left, right = self.temps
+        order = [(self.right, right), (self.left, left)] if self.op == ">=" else [(self.left, left), (self.right, right)]
+        for operand, temp in order:
+            operand.evaluate()
+            current().emitter.instr("store", temp)
+        strict = IntComp(Variable(left, self.eval_type), Variable(right, self.eval_type), self.op[0])
+        equal = IntComp(Variable(left, self.eval_type), Variable(right, self.eval_type), "==")
+        strict.eval_type = equal.eval_type = self.eval_type
+        return BoolComp(strict, equal, "or")
+
+    def negated(self) -> bool:
+        # <=, >= on a builtin are computed as the negation of >, <
+        return self.op in ("<=", ">=")
+
+    def compare(self) -> None:
+        # the callee is the operand pushed last: a < b is a.less(b), a > b is b.less(a),
+        # and each operand is evaluated exactly once
+        if self.op in ("<", ">="):
+            self.right.evaluate()
+            self.left.evaluate()
+        else:
             self.left.evaluate()
             self.right.evaluate()
-            ASTNode.buffer += f"\tcall {self.eval_type}:equals\n"
+        method = "equals" if self.op == "==" else "less"
+        current().emitter.instr("call", f"{self.eval_type}:{method}")
 
-        # .. or <=, >=, which are combined into "less than or equals" with a boolean or
-        elif len(self.op) == 2:
-            op = BoolComp(IntComp(self.left, self.right, self.op[0]), IntComp(self.left, self.right, "=="), "or")
-            op.evaluate()
+    def branch(self, label: str, when: bool) -> None:
+        if self.temps is not None:
+            self.either().branch(label, when)
+            return
+        self.compare()
+        current().emitter.instr("jump_if" if when != self.negated() else "jump_ifnot", label)
 
-        else:
-            ASTError(SYNTAX, f"Error in parsing integer comparison operation. ")
+    def evaluate(self):
+        if self.temps is not None:
+            return self.either().evaluate()
+        self.compare()
+        if self.negated():
+            label = ASTNode.gen_boolcomp_label()
+            current().emitter.instr("jump_if", f"short{label}")
+            current().emitter.instr("const", "true")
+            current().emitter.instr("jump", label)
+            current().emitter.label(f"short{label}")
+            current().emitter.instr("const", "false")
+            current().emitter.instr("jump", label)
+            current().emitter.label(label)
+        return self.type
 
-# TODO: make it so that not true will work
 class Not(ASTNode):
-    def __init__(self, expr: IntComp | Bool):
-        if isinstance(expr, IntComp):
-            self.expr = IntComp(expr.right, expr.left, expr.op)
-        elif isinstance(expr, BoolComp):
-            self.expr = BoolComp(expr.right, expr.left, expr.op)
-        else:
-            ASTError(TYPE, "Not can only be applied to boolean expressions.")
+    __slots__ = ("expr", "type")
+
+    def __init__(self, expr: ASTNode | Obj):
+        self.expr = expr
         self.type = "Bool"
 
     def __str__(self):
         return f"Not: {self.expr}"
 
+    def typecheck(self):
+        self.expr = ASTNode.resolve(self.expr)
+        self.expr.typecheck()
+        if self.expr.type != "Bool":
+            ASTError(TYPE, f"Not can only be applied to boolean expressions, not {self.expr.type}.")
+        return self.type
+
+    def branch(self, label: str, when: bool) -> None:
+        self.expr.branch(label, not when)
+
     def evaluate(self):
-        # reverse control flow
-        self.expr.evaluate()
+        label = ASTNode.gen_boolcomp_label()
+        self.expr.branch(f"short{label}", True)
+        current().emitter.instr("const", "true")
+        current().emitter.instr("jump", label)
+        current().emitter.label(f"short{label}")
+        current().emitter.instr("const", "false")
+        current().emitter.instr("jump", label)
+        current().emitter.label(label)
+        return self.type
 
 class Assign(ASTNode):
+    __slots__ = ("val", "type", "var", "static")
+
     def __init__(self, var: Variable | str, val: Obj | ASTNode, declared_type: int = None):
         self.val = val
         if declared_type is not None:
@@ -560,18 +653,11 @@ class Assign(ASTNode):
         if declared_type is None:
             self.static = False
 
-    def check(self):
+    def typecheck(self):
         # If we assigned a variable to another variable, 
         # Locate it in the current live set.
-        val = self.val
-        
-        if isinstance(self.val, str):
-            val = ASTNode.locate_var(self.val)
-            self.val = Variable(self.val, val)
-        elif isinstance(self.val, Field):
-            val = Class.classes[self.val.belongs].get_field(self.val.field)
-
-        self.val.check()
+        self.val = ASTNode.resolve(self.val)
+        self.val.typecheck()
         val = self.val.type
 
         if val is None:
@@ -585,7 +671,12 @@ class Assign(ASTNode):
         else:
             self.var.type = val
         self.type = val
-        
+
+        # the target is live from here on
+        self.var.declare()
+        if isinstance(self.var, Variable):
+            ASTNode.record_type(self.var.name, val, self.val.name if isinstance(self.val, Variable) else None)
+
     def set_type(self, t):
         self.type = t
         self.var.type = t
@@ -594,32 +685,41 @@ class Assign(ASTNode):
         return f"Assign: {self.var}, {self.val} <{self.type}>"
     
     def evaluate(self):
-        self.check()
         self.val.evaluate()
         self.var.store()
-        log.info(f"{self}")
+        tracing.codegen.info("%s", self)
 
 class Return(ASTNode):
+    __slots__ = ("ret", "type")
+
     def __init__(self, ret: Obj | ASTNode):
         self.ret = ret
         self.type = "Nothing"
     
     def __str__(self):
         return f"Return: {self.ret}"
-    
-    def evaluate(self):
-        if self.ret is not None:
-            self.ret.evaluate()
-        
-        log.info(f"{self}")
 
-        ASTNode.buffer += f"\treturn "
+    def typecheck(self):
         if self.ret is None:
             return "Nothing"
+        self.ret = ASTNode.resolve(self.ret)
+        self.ret.typecheck()
         return self.ret.type
 
+    def evaluate(self):
+        if self.ret is not None:
+            self.ret.evaluate()
+        else:
+            current().emitter.instr("const", "nothing")
+
+        tracing.codegen.info("%s", self)
+
+        current().emitter.instr("return", len(current().emitter.args))
+
 # TODO: flow-sensitive variable exist analysis
 class IfNode(ASTNode):
+    __slots__ = ("statement", "cond")
+
     def __init__(self, cond: IntComp | BoolComp, block: Block):
         self.statement = block
         self.cond = cond
@@ -627,44 +727,53 @@ class IfNode(ASTNode):
     def __str__(self):
         return f"If: {self.cond}, [{self.statement}]"
     
-    def check(self):
+    def typecheck(self):
         if self.cond.type != "Bool":
             ASTError(TYPE, f"Conditional statement {self.cond} must be a bool!")
-    
+        self.statement.typecheck()
+        return "Bool"
+
     def evaluate(self):
-        self.check()
         self.statement.evaluate()
-        return "Bool"
 
 class ElifNode(ASTNode):
+    __slots__ = ("statement", "cond")
+
     def __init__(self, cond: Expression, block: Block):
         self.statement = block
         self.cond = cond
 
-    def check(self):
+    def typecheck(self):
         if self.cond.type != "Bool":
             ASTError(TYPE, "Conditional statement must be a bool!")
+        self.statement.typecheck()
+        return "Bool"
 
     def __str__(self):
         return f"Elif: {self.cond} [{self.statement}]"
     
     def evaluate(self):
-        self.check()
         self.statement.evaluate()
-        return "Bool"
     
 class ElseNode(ASTNode):
+    __slots__ = ("statement",)
+
     def __init__(self, block: Block):
         self.statement = block
 
     def __str__(self):
         return f"Else: [{self.statement}]"
-    
+
+    def typecheck(self):
+        self.statement.typecheck()
+        return "Bool"
+
     def evaluate(self):
         self.statement.evaluate()
-        return "Bool"
 
 class Conditional(ASTNode):
+    __slots__ = ("ifnode", "elifnode", "elsenode")
+
     def __init__(self, ifnode: IfNode, elifnode: list[ElifNode], elsenode: ElseNode):
         self.ifnode = ifnode
         self.elifnode = elifnode
@@ -677,94 +786,142 @@ class Conditional(ASTNode):
     def __str__(self):
         return f"Conditional: if ({self.ifnode.cond}); elif ({self.elifnode}); else ({self.elsenode})"
 
+    def typecheck(self):
+        # in the order the code is generated: each condition, then its clause
+        self.ifnode.cond = ASTNode.resolve(self.ifnode.cond)
+        self.ifnode.cond.typecheck()
+        self.ifnode.typecheck()
+        for elf in self.elifnode or []:
+            elf.cond = ASTNode.resolve(elf.cond)
+            elf.cond.typecheck()
+            elf.typecheck()
+
+        if self.elsenode is not None:
+            self.elsenode.typecheck()
+
     def evaluate(self):
+        # each condition jumps past its clause when it is false, to the next condition (so an
+        # elif is only tested when the conditions before it were false), the else, or the end
+        ctx = current()
         block = ASTNode.fetch_and_update_block_label()
-        iflabel = ASTNode.gen_if_label()
-        self.ifnode.cond.evaluate()
-
-        # with open(Obj.ASM_FILE, "a+") as f:
-        #     print(f"\tjump_if if_clause{iflabel}", file=f)
-        # f.close()
-        ASTNode.buffer += f"\tjump_if if_clause{iflabel}\n"
-        eliflabels = []
-        if self.elifnode is not None:
-            for elf in self.elifnode:
-                eliflabels.append(ASTNode.gen_elif_label())
-                elf.cond.evaluate()
-                # with open(Obj.ASM_FILE, "a+") as f:
-                #     print(f"\tjump_if elif_clause{eliflabels[-1]}", file=f)
-                # f.close()
-                ASTNode.buffer += f"\tjump_if elif_clause{eliflabels[-1]}\n"
+        clauses = [self.ifnode] + list(self.elifnode or [])
+        for i, clause in enumerate(clauses):
+            if i + 1 < len(clauses):
+                otherwise = f"elif_clause{ASTNode.gen_elif_label()}"
+            elif self.elsenode is not None:
+                otherwise = f"else_clause{ASTNode.gen_else_label()}"
+            else:
+                otherwise = block
+            clause.cond.branch(otherwise, False)
+            clause.evaluate()
+            if otherwise != block:
+                ctx.emitter.instr("jump", block)
+                ctx.emitter.label(otherwise)
 
         if self.elsenode is not None:
             self.elsenode.evaluate()
-            # with open(Obj.ASM_FILE, "a+") as f:
-            #     print(f"\tjump {block}", file=f)
-            # f.close()
-            ASTNode.buffer += f"\tjump {block}\n"
-        
-        # with open(Obj.ASM_FILE, "a+") as f:
-        #     print(f"if_clause{iflabel}:", file=f)
-        # f.close()
-        ASTNode.buffer += f"if_clause{iflabel}:\n"
-        self.ifnode.evaluate()
-        # with open(Obj.ASM_FILE, "a+") as f:
-        #     print(f"\tjump {block}", file=f)
-        # f.close()
-        ASTNode.buffer += f"\tjump {block}\n"
-
-        for label, elf in zip(eliflabels, self.elifnode):
-            # with open(Obj.ASM_FILE, "a+") as f:
-            #     print(f"elif_clause{label}:", file=f)
-            # f.close()
-            ASTNode.buffer += f"elif_clause{label}:\n"
-            elf.evaluate()
-            # with open(Obj.ASM_FILE, "a+") as f:
-            #     print(f"\tjump {block}", file=f)
-            # f.close()
-            ASTNode.buffer += f"jump {block}\n"
-
-        # with open(Obj.ASM_FILE, "a+") as f:
-        #     print(f"{block}:", file=f)
-        # f.close()
-        ASTNode.buffer += f"{block}:\n"
+        ctx.emitter.label(block)
 
 class While(ASTNode):
+    __slots__ = ("statement", "cond")
+
     def __init__(self, cond: IntComp | BoolComp, block: Block):
         self.statement = block
         self.cond = cond
 
-    def check(self):
+    def typecheck(self):
+        self.cond = ASTNode.resolve(self.cond)
+        self.cond.typecheck()
         if self.cond.type != "Bool":
             ASTError(TYPE, "Conditional statement must be a bool!")
+        self.statement.typecheck()
 
     def __str__(self):
         return f"While: {self.cond} [{self.statement}]"
     
     def evaluate(self):
-        self.check()
+        # the condition is tested at the bottom, so each iteration takes one branch
         loop = ASTNode.gen_loop_label()
-        # with open(Obj.ASM_FILE, "a+") as f:
-        #     # print(f"loop{loop}:", file=f)
-        #     print(f"\tjump startl{loop}", file=f)
-        #     print(f"startl{loop}:", file=f)
-        # f.close()
-        ASTNode.buffer += f"\tjump startl{loop}\nstartl{loop}:\n"
-        self.cond = Not(self.cond)
-        self.cond.evaluate()
-        # with open(Obj.ASM_FILE, "a+") as f:
-        #     # print(f"\tjump_if end_loop{loop}",  file=f)
-        #     print(f"\tjump_if endl{loop}", file=f)
-        # f.close()
-        ASTNode.buffer += f"\tjump_if endl{loop}\n"
+        current().emitter.instr("jump", f"condl{loop}")
+        current().emitter.label(f"startl{loop}")
         self.statement.evaluate()
-        # with open(Obj.ASM_FILE, "a+") as f:
-        #     print(f"\tjump startl{loop}", file=f)
-        #     print(f"endl{loop}:", file=f)
-        # f.close()
-        ASTNode.buffer += f"\tjump startl{loop}\nendl{loop}:\n"
+        current().emitter.label(f"condl{loop}")
+        self.cond.branch(f"startl{loop}", True)
+
+class For(ASTNode):
+    """
+    for i in low..high { ... }: the body runs with i = low, low + 1, ..., high - 1 (high is
+    evaluated once, before the first iteration). The counter is not an Int: it is kept in a
+    frame slot of its own as a C int (the vm's unbox, incr and below), and made into an Int
+    for i (box) at the top of each iteration only if the body loads i. A new i is out of
+    scope after the loop; one the method had before the loop is stored on every iteration,
+    so after it i holds the last value it took.
+    """
+    __slots__ = ("var", "low", "high", "statement", "counter", "end", "outer")
+
+    def __init__(self, var: str, low: Obj | ASTNode, high: Obj | ASTNode, block: Block):
+        self.var = var
+        self.low = low
+        self.high = high
+        self.statement = block
+        # the locals holding the counter and the bound, named by typecheck, and whether the
+        # variable was in scope before the loop
+        self.counter = None
+        self.end = None
+        self.outer = False
+
+    def typecheck(self):
+        self.low = ASTNode.resolve(self.low)
+        self.low.typecheck()
+        self.high = ASTNode.resolve(self.high)
+        self.high.typecheck()
+        if self.low.type != "Int" or self.high.type != "Int":
+            ASTError(TYPE, f"Bounds of a for loop must be Int, not {self.low.type} and {self.high.type}")
+        var_type = ASTNode.locate_var(self.var)
+        if var_type not in (None, "Int"):
+            ASTError(TYPE, f"Cannot count with variable {self.var} of type {var_type}")
+        self.outer = var_type is not None
+
+        # a counter and a bound for each loop of the method, named so no variable can clash
+        n = sum(1 for v in current().scope if v.startswith("$for"))
+        self.counter, self.end = f"$for{n}", f"$end{n}"
+        for name in (self.counter, self.end, self.var):
+            ASTNode.add_var(name, "Int")
+        ASTNode.record_type(self.var, "Int")
+        self.statement.typecheck()
+        if not self.outer:
+            # i is only set when the body loads it: reading it after the loop is an error
+            ctx = current()
+            del ctx.scope[self.var]
+            ctx.loop_vars.append(self.var)
+
+    def __str__(self):
+        return f"For: {self.var} in {self.low}..{self.high} [{self.statement}]"
+
+    def evaluate(self):
+        # the condition is tested at the bottom, as in a while loop
+        emitter = current().emitter
+        loop = ASTNode.gen_loop_label()
+        self.low.evaluate()
+        emitter.instr("unbox", self.counter)
+        self.high.evaluate()
+        emitter.instr("store", self.end)
+        emitter.instr("jump", f"condl{loop}")
+        emitter.label(f"startl{loop}")
+        body = emitter.mark()
+        self.statement.evaluate()
+        if self.outer or emitter.loads(self.var, body):
+            emitter.insert(body, "store", self.var)
+            emitter.insert(body, "box", self.counter)
+        emitter.instr("incr", self.counter)
+        emitter.label(f"condl{loop}")
+        emitter.instr("load", self.end)
+        emitter.instr("below", self.counter)
+        emitter.instr("jump_if", f"startl{loop}")
 
 class Field(ASTNode):
+    __slots__ = ("field", "belongs", "type", "owner")
+
     # field access of a class instance
     def __init__(self, belongs: Obj | ASTNode = None, field: str | Variable = None):
         # field accessing
@@ -774,6 +931,8 @@ class Field(ASTNode):
         self.belongs = belongs
 
         self.type = "Nothing"
+        # class of belongs, set by the type pass
+        self.owner = None
 
         if isinstance(field, Variable):
             self.type = field.type
@@ -781,12 +940,13 @@ class Field(ASTNode):
     def __str__(self):
         return f"Field: {self.belongs}.{self.field}, <{self.type}>"
     
-    def check(self):
+    def typecheck(self):
         # check that belongs is initialized
         if self.belongs == "this":
-            val = ASTNode.parsing_class
+            val = current().parsing_class
         else:
             val = ASTNode.locate_var(self.belongs)
+        self.owner = val
 
         if val is None:
             ASTError(SYNTAX, f"Uninitialized variable {self.belongs}")
@@ -794,43 +954,54 @@ class Field(ASTNode):
         # if it is, check that field is in class type
         else:
             try:
-                c = Class.classes[val]
+                c = current().classes[val]
                 val = c.get_field(self.field)
             except:
                 ASTError(SYNTAX, f"Class {val} does not exist. (Or does not have fields if builtin)")
         # set type
         self.type = val
-        
+        return self.type
+
     def evaluate(self):
-        self.check()
         if self.belongs == "this":
             this = "$"
-            ASTNode.buffer += f"\tload {this}\n\tload_field {this}:{self.field}\n"
+            current().emitter.instr("load", this)
+            current().emitter.instr("load_field", f"{this}:{self.field}")
         else:
-            this = ASTNode.locate_var(self.belongs)
-            if this == ASTNode.parsing_class:
+            this = self.owner
+            if this == current().parsing_class:
                 this = "$"
-            ASTNode.buffer += f"\tload {self.belongs}\n\tload_field {this}:{self.field}\n"
+            current().emitter.instr("load", self.belongs)
+            current().emitter.instr("load_field", f"{this}:{self.field}")
         return self.type
 
-    def store(self):
+    def declare(self) -> None:
+        # assignment target
         if self.belongs == "this":
             # add new field to the current parsing class
-            Class.classes[ASTNode.parsing_class].add_field(self.field, self.type)
+            tracing.checker.info("%s", self)
+            current().classes[current().parsing_class].add_field(self.field, self.type)
+        else:
+            self.typecheck()
+
+    def store(self):
+        if self.belongs == "this":
             this = "$"
         else:
-            self.check()
             this = self.belongs
-            if self.belongs == ASTNode.parsing_class:
+            if self.belongs == current().parsing_class:
                 this = "$"
 
-        ASTNode.buffer += f"\tload {this}\n\tstore_field {this}:{self.field}\n"
+        current().emitter.instr("load", this)
+        current().emitter.instr("store_field", f"{this}:{self.field}")
         return self.type
 
 # formal parameters for a method
 class Params(ASTNode):
-    def __init__(self, params: list[(str, str | int)] = []):
-        self.params = params
+    __slots__ = ("params",)
+
+    def __init__(self, params: list[(str, str | int)] = None):
+        self.params = params if params is not None else []
     
     def add_param(self, new_param: tuple[str, str | int]):
         """
@@ -850,7 +1021,7 @@ class Params(ASTNode):
         return f""
     
     def set_args(self):
-        ASTNode.args = {p[0]: p[1] for p in self.params}
+        current().args = {p[0]: p[1] for p in self.params}
     
     def get_params(self):
         p = []
@@ -866,6 +1037,8 @@ class Params(ASTNode):
     
 
 class Method(ASTNode):
+    __slots__ = ("name", "args", "type", "block", "locals", "builtin")
+
     def __init__(self, name: str, args: Params | list, ret: int | str, block: Block):
         self.name = name
         if isinstance(args, list):
@@ -877,80 +1050,59 @@ class Method(ASTNode):
         # statements
         self.block = block
 
-        self.locals: dict[str: str | int] = {}
+        # local variables, in the order the type pass meets them
+        self.locals: list[str] = []
 
         self.builtin = False
 
         if self.name in ["PRINT", "EQUALS", "STRING", "LESS", "PLUS", "MINUS", "DIVIDE", "MULTIPLY"]:
             self.builtin = True
-
-    def add_local(self, var: Variable) -> None:
-        self.locals[var.name] = var
-
-    def get_locals(self) -> str | None:
-        if len(self.locals.keys()) <= 1:
-            return None
-        f = f""
-        for l in self.locals.keys():
-            if l != "this":
-                f += f",{l}"
-        return f[1:]
+            self.name = self.name.lower()
 
     def __str__(self):
         return f"Method: {self.name}({self.args}) -> {self.type}"
     
-    def check(self):
-        if self.builtin:
-            self.name = self.name.lower()
-    
-    def evaluate(self):
-        self.check()
-        log.info(f"{self}")
-        ASTNode.buffer += f"\n.method {self.name}\n"
+    def typecheck(self):
+        tracing.checker.info("%s", self)
 
+        # each method starts from its own arguments and no locals
+        current().scope = {}
+        current().loop_vars = []
         self.args.set_args()
-        args = self.args.get_param_names()
-        if args != f"":
-            ASTNode.buffer += f".args {args}\n"
-        # ASTNode.print_buffer()
 
-        ASTNode.print_buffer()
+        ret = self.block.typecheck()
+        self.locals = ASTNode.get_locals()
+        ASTNode.settle_types()
 
-        ret = self.block.evaluate()
-
-        temp_buffer = f""
-        # do local variables at this point
-
-        locals = ASTNode.get_locals()
-        if locals != f"":
-            temp_buffer += f"\t.local {locals}\n"
-
-        temp_buffer += f"\tenter\n"
-
-        # workaround that hopefully doesn't backfire - it's a very specific stack problem, basically if method returns nothing and the last statement in a method isn't loading a thing, the stack gets double-popped and messes up. 
-        if self.type == "Nothing" or self.name == "print":
-            ASTNode.buffer += f"\tload $\n"
+        if not (ret is None and self.type == "Nothing") and ret != self.type:
+            ASTError(TYPE, f"Return value of {ret} does not matched declared return value {self.type}")
 
-        if not isinstance(self.block.statements[-1], Return):
-            ASTNode.buffer += f"\treturn "
-            
-        ASTNode.buffer += f"{len(self.args.params)}\n"
+        ASTNode.reset_variables()
 
-        ASTNode.buffer = temp_buffer + ASTNode.buffer
+    def evaluate(self):
+        tracing.codegen.info("%s", self)
 
-        if ret is None and self.type == "Nothing":
-            return
-        if ret != self.type:
-            ASTError(TYPE, f"Return value of {ret} does not matched declared return value {self.type}")
+        ctx = current()
+        ctx.emitter = ctx.class_emitter.method(self.name, [p[0] for p in self.args.params])
 
+        self.block.evaluate()
+        ctx.emitter.locals = self.locals
 
-        ASTNode.print_buffer()
-        ASTNode.reset_variables()
+        # a return statement emits its own return
+        if not self.block.statements or not isinstance(self.block.statements[-1], Return):
+            # workaround that hopefully doesn't backfire - it's a very specific stack problem, basically if method returns nothing and the last statement in a method isn't loading a thing, the stack gets double-popped and messes up. 
+            if self.type == "Nothing" or self.name == "print":
+                current().emitter.instr("load", "$")
+            current().emitter.instr("return", len(self.args.params))
 
 class ClassBody(ASTNode):
-    def __init__(self, statements: Block, methods: list[Method] = []):
+    __slots__ = ("statements", "methods", "locals")
+
+    def __init__(self, statements: Block, methods: list[Method] = None):
         self.statements = statements
-        self.methods = methods
+        self.methods = methods if methods is not None else []
+        # local variables of the constructor
+        self.locals: list[str] = []
 
     def __str__(self):
         f = f"Init: {self.statements}\nMethods: _"
@@ -964,26 +1116,79 @@ class ClassBody(ASTNode):
     def get_methods(self):
         return {m.name: m for m in self.methods}
 
-    def evaluate(self, l, main):
-        ASTNode.buffer += f"\tenter\n"
+    def typecheck(self):
+        self.statements.typecheck()
+        self.locals = ASTNode.get_locals()
+        ASTNode.settle_types()
+
+        for method in self.methods:
+            method.typecheck()
+
+    def evaluate(self, params: list[str], main):
+        ctx = current()
+        ctx.emitter = ctx.class_emitter.method("$constructor", params)
         self.statements.evaluate()
 
         if not main:
-            ASTNode.buffer += f"\tload $\n"
-        ASTNode.buffer += f"\treturn {l}\n"
-        ASTNode.print_buffer()
+            ctx.emitter.instr("load", "$")
+        ctx.emitter.instr("return", len(params))
+        ctx.emitter.locals = self.locals
 
         for method in self.methods:
             method.evaluate()
 
+class MethodEntry():
+    """
+    One row of a method table: the class that defines the method, its parameter types,
+    return type and vtable slot.
+    """
+    __slots__ = ("name", "definer", "params", "type", "slot")
+
+    def __init__(self, name: str, definer: str, params: list[str], type: str, slot: int | None):
+        self.name = name
+        self.definer = definer
+        self.params = params
+        self.type = type
+        self.slot = slot
+
+    def __str__(self):
+        return f"{self.definer}:{self.name}({', '.join(self.params)}) -> {self.type} [{self.slot}]"
+
+def builtin_method_table(name: str) -> dict[str, MethodEntry]:
+    # the methods of a builtin class that the vm implements, from the registry (registry.py)
+    table = {}
+    for m in registry.CLASSES[name]["methods"].values():
+        if m["native"] is not None and m["name"] != "$constructor":
+            table[m["name"]] = MethodEntry(m["name"], name, list(m["params"]), m["returns"], m["slot"])
+    return table
+
+BUILTIN_METHODS: dict[str, dict[str, MethodEntry]] = {name: builtin_method_table(name) for name in registry.CLASSES}
+
+def method_table(type_name: str) -> dict[str, MethodEntry]:
+    """
+    Method table of a builtin or user class.
+    """
+    if type_name in BUILTIN_METHODS:
+        return BUILTIN_METHODS[type_name]
+    try:
+        c = current().classes[type_name]
+    except KeyError:
+        ASTError(SYNTAX, f"Undefined class {type_name}.")
+    return c.get_method_table()
+
 class Class(ASTNode):
-    # list of user-defined classes
-    # name of class : class
-    classes: dict[str: ASTNode] = {}
+    __slots__ = ("name", "main", "imported", "final", "params", "class_body", "parent", "fields", "method_table", "vtable")
 
-    def __init__(self, classname: str, constructor_args: Params | list = None, class_body: ClassBody = None, parent: str = "Obj", main=False):
+    # user-defined classes are registered in current().classes (name of class : class)
+
+    def __init__(self, classname: str, constructor_args: Params | list = None, class_body: ClassBody = None, parent: str = "Obj", main=False,
+                 imported=False):
         self.name = classname
         self.main = main
+        # from an interface (see interface.py): checked against, never generated; and the
+        # methods its program was compiled calling without looking for overrides (cha.assumed_final)
+        self.imported = imported
+        self.final: list[str] = []
 
         if isinstance(constructor_args, list):
             constructor_args = Params(constructor_args)
@@ -994,9 +1199,14 @@ class Class(ASTNode):
         
         self.fields: dict[str: type] = {}
 
-        Class.classes[self.name] = self
+        # built once, after parsing (get_method_table)
+        self.method_table: dict[str, MethodEntry] = None
+        self.vtable: list[str] = None
 
-        ASTNode.set_parse_class(self.name)
+        current().classes[self.name] = self
+
+        if not imported:
+            ASTNode.set_parse_class(self.name)
 
     def __str__(self):
         return f"Class: {self.name} ({self.params}) -> {self.parent}\nFields: {self.fields}\nMethods: {self.get_method_names()}"
@@ -1016,7 +1226,56 @@ class Class(ASTNode):
 
     def get_methods(self):
         return self.class_body.get_methods()
-    
+
+    def get_method_table(self) -> dict[str, "MethodEntry"]:
+        """
+        Every method an instance of this class has, inherited ones included (name : MethodEntry).
+        Built on first use from the parent's table; vtable lists the method names by slot, the
+        way the assembler lays them out (the parent's slots, then new methods in order).
+        """
+        if self.method_table is None:
+            if self.vtable is not None:
+                ASTError(TYPE, f"Class {self.name} inherits from itself.")
+            self.vtable = []
+
+            if self.parent in BUILTIN_METHODS:
+                table, vtable = BUILTIN_METHODS[self.parent], registry.CLASSES[self.parent]["vtable"]
+            elif self.parent in current().classes:
+                parent = current().classes[self.parent]
+                table, vtable = parent.get_method_table(), parent.vtable
+            else:
+                ASTError(TYPE, f"Parent class {self.parent} is undefined.")
+
+            table = dict(table)
+            self.vtable = list(vtable)
+            for m in self.class_body.methods:
+                if m.name in table:
+                    final = self.final_in(m.name)
+                    if final is not None:
+                        ASTError(TYPE, f"Class {self.name} cannot override {m.name}: {final} was compiled calling "
+                                       f"{final}:{m.name} directly (compile the program of {final} with -O1 to override it)")
+                    # overrides keep the inherited slot
+                    slot = table[m.name].slot
+                else:
+                    slot = len(self.vtable)
+                    self.vtable.append(m.name)
+                table[m.name] = MethodEntry(m.name, self.name, m.args.get_params(), m.type, slot)
+            self.method_table = table
+        return self.method_table
+
+    def final_in(self, method: str) -> str | None:
+        """
+        The class above this one, if any, whose program was compiled taking method to be
+        overridden nowhere under it.
+        """
+        name = self.parent
+        while name in current().classes:
+            c = current().classes[name]
+            if method in c.final:
+                return name
+            name = c.parent
+        return None
+
     def add_field(self, name: str, type: int | str):
         self.fields[name] = type
     
@@ -1026,69 +1285,81 @@ class Class(ASTNode):
         except:
             ASTError(f"Field {name} does not exist for class {self.name}")
 
-    def check(self):
-        # check that the parent is a valid class
-        # all other type checks happen later
-        try:
-            c = Class.classes[self.parent]
-        except:
-            if self.parent not in ["Int", "Bool", "Obj", "String", "Nothing"]:
-                ASTError(TYPE, f"Parent class {self.parent} is undefined.")
+    def interface(self) -> dict:
+        """
+        The class as another program compiles against it (see interface.py).
+        """
+        return {"name": self.name, "super": self.parent, "params": self.params.params, "fields": self.fields,
+                "methods": [{"name": m.name, "params": m.args.params, "returns": m.type} for m in self.class_body.methods]}
 
-    def evaluate(self):
-        self.check()
-        # check if it inherits a builtin class or a new class
-        inherit = self.parent
+    def typecheck(self):
+        # check that the parent is a valid class (the table is built from it)
+        self.get_method_table()
 
-        ASTNode.set_asm_file(f"{self.name}.asm")
+        # fields and `this` resolve against the class being checked, not the last one parsed
+        ASTNode.set_parse_class(self.name)
+        tracing.checker.info("Class %s", self.name)
 
-        ASTNode.buffer += f".class {self.name}:{inherit}\n"
+        ctx = current()
+        ctx.scope = {}
+        ctx.loop_vars = []
+        ctx.args = {p[0]: p[1] for p in self.params.params}
 
-        ASTNode.write()
+        self.class_body.typecheck()
+        return self.name
 
-        ASTNode.args = {p[0]: p[1] for p in self.params.params}
+    def evaluate(self):
+        # check if it inherits a builtin class or a new class
+        inherit = self.parent
 
-        self.class_body.evaluate(len(self.get_params()), self.main)
+        ASTNode.set_parse_class(self.name)
 
-        temp_buffer = f""
-        for f in self.fields.keys():
-            temp_buffer += f".field {f}\n"
-        
-        for m in self.class_body.methods:
-            temp_buffer += f".method {m.name} forward\n"
-        
-        temp_buffer += f".method $constructor\n"
-        if self.params.params != []:
-            temp_buffer += f".args\t"
-            temp_buffer += f"{self.params.get_param_names()}\n"
+        ctx = current()
+        ctx.class_emitter = ClassEmitter(self.name, inherit)
 
-        locals = ASTNode.get_locals()
-        if locals != f"":
-            temp_buffer += f".local\t{locals}\n"
+        self.class_body.evaluate([p[0] for p in self.params.params], self.main)
 
-        ASTNode.program = temp_buffer + ASTNode.program
+        ctx.class_emitter.fields = list(self.fields)
+        if not self.main:
+            ctx.class_emitter.interface = self.interface()
 
-        log.info(f"{self}")
+        tracing.codegen.info("%s", self)
 
-        ASTNode.write()
+        ctx.generated[self.name] = ctx.class_emitter
 
         # return class name as type
         return self.name
 
+def import_class(record: dict) -> Class:
+    """
+    A class from its interface (Class.interface), registered like one the program defines.
+    Its methods have no code; only their signatures are checked against.
+    """
+    methods = [Method(m["name"], [tuple(p) for p in m["params"]], m["returns"], Block([])) for m in record["methods"]]
+    c = Class(record["name"], [tuple(p) for p in record["params"]], ClassBody(Block([]), methods), record["super"],
+              imported=True)
+    for name, type in record["fields"].items():
+        c.add_field(name, type)
+    c.final = record["final"]
+    return c
+
 class UserClassInstance(ASTNode):
+    __slots__ = ("type", "args")
+
     def __init__(self, class_type: str, constructor_args: list[Obj]):
         self.type = class_type
         self.args = constructor_args
     
-    def check(self):
+    def typecheck(self):
         try:
-            c = Class.classes[self.type]
+            c = current().classes[self.type]
         except:
             ASTError(SYNTAX, f"Class <{self.type}> is undefined.")
 
         if len(c.get_params()) == len(self.args) and c.get_params() != []:
+            self.args = [ASTNode.resolve(a) for a in self.args]
             for a, c in zip(self.args, c.get_params()):
-                a.check()
+                a.typecheck()
                 if a.type != c:
                     ASTError(TYPE, f"Type {a.type} does not match constructor type {c}")
         elif len(self.args) != 0:
@@ -1098,18 +1369,20 @@ class UserClassInstance(ASTNode):
         return f"User class instance: {self.type}({self.args})"
     
     def evaluate(self):
-        self.check()
         for arg in self.args:
             arg.evaluate()
         # with open(Obj.ASM_FILE, "a") as f:
         #     print(f"\tnew {self.type}\n\tcall {self.type}:$constructor", file=f)
         # f.close()
         t = self.type
-        if self.type == ASTNode.parsing_class:
+        if self.type == current().parsing_class:
             t = "$"
-        ASTNode.buffer += f"\tnew {t}\n\tcall {t}:$constructor\n"
+        current().emitter.instr("new", t)
+        current().emitter.instr("call", f"{t}:$constructor")
 
 class TypecaseCase(ASTNode):
+    __slots__ = ("name", "type", "statements")
+
     def __init__(self, test, test_type, statement: Block):
         self.name = test
         self.type = test_type
@@ -1120,21 +1393,34 @@ class TypecaseCase(ASTNode):
     
     def evaluate_check(self, label):
         t = self.type
+        # the class being compiled is $ to the assembler, as in a constructor call
+        if t == current().parsing_class:
+            t = "$"
         # with open(Obj.ASM_FILE, "a") as f:
         #     print(f"\tis_instance {t}", file=f)
         #     print(f"\tjump_if it_is{label}", file=f)
         # f.close()
-        ASTNode.buffer += f"\tis_instance {t}\n\tjump_if it_is{label}\n"
+        current().emitter.instr("is_instance", t)
+        current().emitter.instr("jump_if", f"it_is{label}")
+
+    def typecheck(self):
+        self.statements.typecheck()
 
     def evaluate_block(self, label, tl):
-        ASTNode.buffer += f"it_is{label}:\n"
+        current().emitter.label(f"it_is{label}")
         self.statements.evaluate()
-        ASTNode.buffer += f"\tjump next{tl}\n"
+        current().emitter.instr("jump", f"next{tl}")
 
 class Typecase(ASTNode):
-    def __init__(self, test: Obj | ASTNode, cases: list[TypecaseCase] = []):
+    __slots__ = ("test", "test_type", "retyped", "cases")
+
+    def __init__(self, test: Obj | ASTNode, cases: list[TypecaseCase] = None):
         self.test = test
-        self.cases = cases
+        # static type of the variable tested, set by typecheck (None if unknown), and whether
+        # the variable is assigned other types as well (see ASTNode.settle_types)
+        self.test_type: str = None
+        self.retyped = False
+        self.cases = cases if cases is not None else []
 
     def add_case(self, new_case: TypecaseCase):
         self.cases.append(new_case)
@@ -1144,7 +1430,14 @@ class Typecase(ASTNode):
         for case in self.cases:
             f += f"{case}, "
         return f
-    
+
+    def typecheck(self):
+        if isinstance(self.test, str):
+            self.test_type = ASTNode.locate_var(self.test)
+            ASTNode.uses_type_of(self, self.test)
+        for c in self.cases:
+            c.typecheck()
+
     def evaluate(self):
         labels = []
         tl = ASTNode.gen_typecase_gen_label()
@@ -1154,19 +1447,25 @@ class Typecase(ASTNode):
             # with open(Obj.ASM_FILE, "a") as f:
             #     print(f"\tload {self.test}", file=f)
             # f.close()
-            ASTNode.buffer += f"\tload {self.test}\n"
+            current().emitter.instr("load", self.test)
             c.evaluate_check(label)
-        
+        # no case matched
+        current().emitter.instr("jump", f"next{tl}")
+
         for c, l in zip(self.cases, labels):
             c.evaluate_block(l, tl)
         
-        ASTNode.buffer += f"next{tl}:\n"
+        current().emitter.label(f"next{tl}")
 
 class Call(ASTNode):
+    __slots__ = ("var", "type", "calling_type", "retyped", "args", "method")
+
     def __init__(self, var: Obj | ASTNode = None, method: str = None, args: Params = None):
         self.var = var
         self.type = "Nothing"
         self.calling_type = "Nothing"
+        # the receiver is a variable also assigned other types (see ASTNode.settle_types)
+        self.retyped = False
 
         self.args = args
 
@@ -1174,7 +1473,7 @@ class Call(ASTNode):
 
         self.type = "Nothing"
 
-    def check(self):
+    def typecheck(self):
         if isinstance(self.var, str):
             tpe = ASTNode.locate_var(self.var)
             if tpe is None:
@@ -1182,44 +1481,34 @@ class Call(ASTNode):
 
             self.var = Variable(self.var, tpe)
 
-        self.var.check()
+        self.var.typecheck()
         self.calling_type = self.var.type
+        if isinstance(self.var, Variable):
+            ASTNode.uses_type_of(self, self.var.name)
 
-        self.check_method()
-        self.check_args()
-
-    def check_args(self):
-        # builtins which take no arguments
-        if self.method in ["print", "string"]:
-            if self.args is not None and len(self.args) != 0:
-                ASTError(SYNTAX, f"Method {self.method} takes 0 arguments, {len(self.args)} given.")
-        elif self.method in ["equals", "less", "add", "minus", "times", "divide"]:
-            p = self.args
-            if self.args is None or len(p) > 1 or len(p) == 0:
-                ASTError(SYNTAX, f"Method {self.method} takes 1 arguments, {len(self.args.get_params())} given.")
-            elif p[0].type != self.calling_type:
-                ASTError(TYPE, f"Argument type {p[0].type} must match calling type {self.calling_type} for method {self.method}.")
-        
-    def check_method(self):
-        if self.calling_type not in ["Int", "String", "Obj", "Bool", "Nothing"]:
-            ms = Class.classes[self.calling_type].get_methods()
-            try:
-                self.type = ms[self.method].type
-            except:
-                self.calling_type = Class.classes[self.calling_type].parent
-                self.check_method()
-                return
-        else:
-            if self.calling_type == "Int":
-                if self.method in ["less", "equals"]:
-                    self.type = "Bool"
-                elif self.method in ["plus", "minus", "times", "divide"]:
-                    self.type = "Int"
-            else:
-                if self.method in ["equals"]:
-                    self.type = "Bool"
-                elif self.method in ["string"]:
-                    self.type = "String"
+        self.args = [ASTNode.resolve(a) for a in self.args]
+        for arg in self.args:
+            arg.typecheck()
+
+        entry = method_table(self.calling_type).get(self.method)
+        if entry is None:
+            raise Exception(f"Invalid method call on {self.var}: {self.method} does not exist for type {self.calling_type}")
+
+        # calls go to the class that defines the method
+        self.calling_type = entry.definer
+        self.type = entry.type
+
+        self.check_args(entry)
+        return self.type
+
+    def check_args(self, entry: MethodEntry):
+        if len(self.args) != len(entry.params):
+            ASTError(SYNTAX, f"Method {self.method} takes {len(entry.params)} arguments, {len(self.args)} given.")
+        # argument types of builtin methods are exact (user methods only have their arity checked)
+        if entry.definer in BUILTIN_METHODS:
+            for a, p in zip(self.args, entry.params):
+                if a.type != p:
+                    ASTError(TYPE, f"Argument type {a.type} must match calling type {p} for method {self.method}.")
 
     def assign_var(self, expr: Obj | ASTNode):
         self.var = expr
@@ -1229,43 +1518,19 @@ class Call(ASTNode):
         return f"Call: {self.var}.{self.method}({self.args}), ret_type={self.type}"
     
     def evaluate(self) -> None:
-        """
-        Eventually include type checking in this
-        """
-        self.check()
-        log.info(f"{self}")
-
-        calling = ""
-            
-        if self.calling_type == "Int":
-            if self.method not in Int.methods:
-                raise Exception(f"Invalid method call on {self.var}: {self.method} does not exist for type {self.calling_type}")
-            calling = "Int"
-        elif self.calling_type == "Obj":
-            if self.method not in Obj.methods:
-                raise Exception(f"Invalid method call on {self.var}: {self.method} does not exist for type {self.calling_type}")
-            calling = "Obj"
-        elif self.calling_type == "Bool":
-            if self.method not in Bool.methods:
-                raise Exception(f"Invalid method call on {self.var}: {self.method} does not exist for type {self.calling_type}")
-            calling = "Bool"
-        elif self.calling_type == "String":
-            if self.method not in String.methods:
-                raise Exception(f"Invalid method call on {self.var}: {self.method} does not exist for type {self.calling_type}")
-            calling = "String"
-        elif self.calling_type == "Nothing":
-            raise Exception(f"Invalid method call on {self.var}: {self.method} does not exist for type {self.calling_type}")
-        elif isinstance(self.calling_type, str):
-            if self.method not in Class.classes[self.calling_type].get_method_names():
-                raise Exception(f"Invalid method call on {self.var}: {self.method} does not exist for type {self.calling_type}")
-            calling = self.calling_type
-        
+        tracing.codegen.info("%s", self)
+
         for arg in self.args:
             arg.evaluate()
 
         self.var.evaluate()
 
-        ASTNode.buffer += f"\tcall {calling}:{self.method}\n"
+        ctx = current()
+        operand = f"{self.calling_type}:{self.method}"
+        if self.retyped:
+            # the receiver may not be a calling_type at all: the passes leave this call to the vtable
+            ctx.dynamic_calls.setdefault(f"{ctx.class_emitter.name}:{ctx.emitter.name}", set()).add(operand)
+        ctx.emitter.instr("call", operand)
 
         # if method returns nothing, pop result
         # if self.type == "Nothing":
@@ -0,0 +1,144 @@
+"""
+Direct object code backend.
+
+The textual route joins every class's emitter records into .asm text, and vm/assemble.py
+then splits that text back into lines, matches its regexes against each one and rebuilds
+what the emitter already knew. This module skips that round trip. It replays the
+emitter records into the assembler's ObjectCode through the same calls translate() makes
+(declare_class, declare_method, begin_method, declare_locals, add_instruction, ...), so
+operand encoding, symbol resolution and the JSON layout are exactly the assembler's.
+
+    emitters = compile_emitters(program, "Main")      # quack.py
+    objects, errors = assemble_emitters(emitters, "build/OBJ")
+
+The .asm text (ClassEmitter.text()) is only needed as a debug dump.
+"""
+import os
+import sys
+import logging
+from pathlib import Path
+
+import registry
+from cache import atomic_write
+from emit import ClassEmitter
+
+VM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vm")
+BUILTINS = list(registry.CLASSES)
+
+_assembler = None
+
+def assembler():
+    """
+    The vm's assembler, imported once per process, with its error log captured.
+    """
+    global _assembler
+    if _assembler is None:
+        sys.path.insert(0, VM)
+        import assemble
+        assemble.log.setLevel(logging.ERROR)
+        assemble.log.propagate = False
+        _assembler = assemble
+    return _assembler
+
+class ErrorLog(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def assembly_order(parents: dict[str, str]) -> list[str]:
+    """
+    Class names (given as {name: parent}) with every class after its parent.
+    Classes keep their relative order otherwise, so the statement class stays last.
+    """
+    order = []
+    def visit(name, seen):
+        if name in order or name not in parents or name in seen:
+            return
+        seen.add(name)
+        visit(parents[name], seen)
+        order.append(name)
+
+    for name in parents:
+        visit(name, set())
+    return order
+
+def library(obj_dir: str) -> None:
+    """
+    Make obj_dir an object library: user classes import the builtins from it.
+    """
+    os.makedirs(obj_dir, exist_ok=True)
+    for name in BUILTINS:
+        target = os.path.join(obj_dir, f"{name}.json")
+        if not os.path.exists(target):
+            with open(os.path.join(VM, "OBJ", f"{name}.json"), "r") as f:
+                atomic_write(target, f.read())
+
+def lower(cls: ClassEmitter):
+    """
+    One class's emitter records as an assemble.ObjectCode.
+    Imports resolve against assemble.CONFIG.tvmlib, as they do for translate().
+    """
+    assemble = assembler()
+    INSTRS, Instruction = assemble.INSTRS, assemble.Instruction
+
+    # every class starts from an empty import table, as it would in its own process
+    assemble.IMPORTS.clear()
+    assemble.IMPORTS["$"] = None
+
+    code = assemble.ObjectCode()
+    code.declare_class(cls.name, cls.parent)
+    for field in cls.fields:
+        code.declare_field(field)
+    for m in cls.methods:
+        if m.name != "$constructor":
+            code.declare_method(m.name)
+
+    for m in cls.methods:
+        code.begin_method(m.name)
+        if m.args:
+            code.declare_args(m.args)
+        if m.slots is not None:
+            # loads and stores already carry frame offsets
+            if m.frame:
+                code.add_instruction(Instruction(None, INSTRS["alloc"], str(m.frame)))
+        elif m.locals:
+            code.add_instruction(Instruction(None, INSTRS["alloc"], str(len(m.locals))))
+            code.declare_locals(m.locals)
+        code.add_instruction(Instruction(None, INSTRS["enter"], None))
+
+        for label, op, operand in m.code:
+            if op is None:
+                code.add_label(label)
+            else:
+                # operands are text in the assembler ("0" is an operand, 0 would not be)
+                code.add_instruction(Instruction(None, INSTRS[op], None if operand is None else str(operand)))
+
+    code.resolve_jumps()  # of the last method
+    return code
+
+def assemble_emitters(emitters: dict[str, ClassEmitter], obj_dir: str) -> tuple[dict[str, str], list[str]]:
+    """
+    Lower every class and write its object code into obj_dir, next to the builtin classes.
+    Returns ({class name: json object code}, the assembler's error messages).
+    """
+    assemble = assembler()
+    library(obj_dir)
+
+    objects = {}
+    errors = ErrorLog()
+    assemble.log.addHandler(errors)
+    try:
+        assemble.CONFIG.tvmlib = Path(obj_dir)
+        for name in assembly_order({n: e.parent for n, e in emitters.items()}):
+            try:
+                objects[name] = lower(emitters[name]).json()
+                # later classes may import this one
+                atomic_write(os.path.join(obj_dir, f"{name}.json"), objects[name])
+            except Exception as e:
+                errors.messages.append(f"{name}: {type(e).__name__}: {e}")
+    finally:
+        assemble.log.removeHandler(errors)
+    return objects, errors.messages
@@ -0,0 +1,209 @@
+"""
+Batch compiler driver.
+
+Compiles every .qk file under a directory across a pool of worker processes:
+
+    python batch.py tests/ -j 8 -o build/
+    ./quackc --batch tests/ -j 8
+
+Each file gets its own output directory (build/<path without .qk>/) holding the object
+code of every class in OBJ/, alongside the builtin classes, so it can be run with
+`tiny_vm -L build/<path>/OBJ <main>`. Classes go straight to object code (backend.py);
+the .asm text is only written with --asm, or instead of the object code with --no-assemble.
+Every file is written atomically, and compiles never share an output directory, so
+any number of them can run at once.
+
+The files of a batch don't see each other's classes. A program that uses classes compiled
+before (separate compilation, see interface.py) names their obj dir with --lib: their
+interfaces are looked up there, and their object code is copied into the program's OBJ/
+next to its own, which gets the interfaces of its classes in turn.
+
+    python quack.py --obj-dir lib tests/sep/Shapes.qk
+    python batch.py tests/sep/UseShapes.qk --lib lib -o build/
+
+At the end the driver prints per-file timings and an aggregated error report, and
+exits non-zero if any file failed.
+"""
+import os
+import sys
+import time
+import argparse
+import warnings
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from quack import compile_emitters
+import interface
+from cache import atomic_write
+from backend import assembler, assemble_emitters, assembly_order, library, ErrorLog
+
+def main_class_name(path: str) -> str:
+    # same naming rule as quack.py: the capitalized file name
+    name = os.path.basename(path).split(".")[0]
+    return name[0].upper() + name[1:]
+
+def assemble_classes(asm: dict[str, str], obj_dir: str) -> tuple[dict[str, str], list[str]]:
+    """
+    Assemble the .asm text of every class into obj_dir, next to the builtin classes.
+    Returns ({class name: json object code}, the assembler's error messages).
+    """
+    assemble = assembler()
+    library(obj_dir)
+
+    # the parent is the last part of the ".class Name:Parent" line
+    parents = {name: text.split("\n", 1)[0].split(":")[-1].strip() for name, text in asm.items()}
+
+    objects = {}
+    errors = ErrorLog()
+    assemble.log.addHandler(errors)
+    try:
+        assemble.CONFIG.tvmlib = Path(obj_dir)
+        for name in assembly_order(parents):
+            # each class starts from an empty import table, as it would in its own process
+            assemble.IMPORTS.clear()
+            assemble.IMPORTS["$"] = None
+            try:
+                objects[name] = assemble.translate(asm[name].splitlines()).json()
+                atomic_write(os.path.join(obj_dir, f"{name}.json"), objects[name])
+            except Exception as e:
+                errors.messages.append(f"{name}: {type(e).__name__}: {e}")
+    finally:
+        assemble.log.removeHandler(errors)
+    return objects, errors.messages
+
+def import_objects(lib: str, obj_dir: str) -> None:
+    """
+    Copy the object code of every class with an interface in lib to obj_dir, for the vm and
+    the assembler to find the classes a program imports.
+    """
+    for name in os.listdir(lib):
+        if name.endswith(interface.SUFFIX):
+            source = os.path.join(lib, name[:-len(interface.SUFFIX)] + ".json")
+            if os.path.exists(source):
+                with open(source, "r") as f:
+                    atomic_write(os.path.join(obj_dir, os.path.basename(source)), f.read())
+
+def compile_file(path: str, root: str, out_root: str, assemble: bool = True, dump_asm: bool = False,
+                 opt_level: int = 0, lib: str = None) -> dict:
+    """
+    Compile (and assemble) one file into its own directory under out_root.
+    The .asm files are only written with dump_asm, or when not assembling.
+    Classes the program doesn't define are imported from the interfaces in lib.
+    Runs in a worker process; returns a picklable summary.
+    """
+    rel = os.path.relpath(path, root)
+    out_dir = os.path.join(out_root, os.path.splitext(rel)[0])
+    result = {"file": rel, "out": out_dir, "ok": False, "error": None, "warnings": [],
+              "classes": [], "compile": 0.0, "assemble": 0.0}
+
+    start = time.perf_counter()
+    try:
+        with open(path, "r") as f:
+            program = f.read()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            emitters = compile_emitters(program, main_class_name(path), opt_level, interface_dir=lib)
+        result["warnings"] = [str(w.message) for w in caught]
+    except Exception as e:
+        result["compile"] = time.perf_counter() - start
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    os.makedirs(out_dir, exist_ok=True)
+    if dump_asm or not assemble:
+        for name, cls in emitters.items():
+            atomic_write(os.path.join(out_dir, f"{name}.asm"), cls.text())
+    result["classes"] = list(emitters)
+    result["compile"] = time.perf_counter() - start
+
+    if assemble:
+        start = time.perf_counter()
+        obj_dir = os.path.join(out_dir, "OBJ")
+        if lib is not None:
+            os.makedirs(obj_dir, exist_ok=True)
+            import_objects(lib, obj_dir)
+        _, errors = assemble_emitters(emitters, obj_dir)
+        result["assemble"] = time.perf_counter() - start
+        if errors:
+            result["error"] = "assembler: " + "; ".join(errors)
+            return result
+        interface.write(emitters, obj_dir)
+
+    result["ok"] = True
+    return result
+
+def find_sources(root: str) -> list[str]:
+    if os.path.isfile(root):
+        return [root]
+    sources = []
+    for directory, _, files in os.walk(root):
+        sources.extend(os.path.join(directory, f) for f in files if f.endswith(".qk"))
+    return sorted(sources)
+
+def run(sources: list[str], root: str, out_root: str, jobs: int, assemble: bool = True,
+        dump_asm: bool = False, opt_level: int = 0, lib: str = None) -> list[dict]:
+    if jobs == 1:
+        if assemble:
+            assembler()
+        return [compile_file(s, root, out_root, assemble, dump_asm, opt_level, lib) for s in sources]
+    # import the assembler up front in every worker, so it isn't timed as part of the first file
+    with ProcessPoolExecutor(max_workers=jobs, initializer=assembler if assemble else None) as pool:
+        futures = [pool.submit(compile_file, s, root, out_root, assemble, dump_asm, opt_level, lib) for s in sources]
+        return [f.result() for f in futures]
+
+def report(results: list[dict], wall: float, file=sys.stdout) -> None:
+    print(f"{'':4} {'file':<40} {'compile':>9} {'assemble':>9}  classes", file=file)
+    for r in results:
+        status = "ok" if r["ok"] else "FAIL"
+        print(f"{status:4} {r['file']:<40} {r['compile'] * 1000:>7.1f}ms {r['assemble'] * 1000:>7.1f}ms  "
+              f"{','.join(r['classes'])}", file=file)
+
+    failed = [r for r in results if not r["ok"]]
+    warned = [r for r in results if r["warnings"]]
+    if failed:
+        print(f"\nerrors ({len(failed)}):", file=file)
+        for r in failed:
+            print(f"  {r['file']}: {r['error']}", file=file)
+    if warned:
+        print(f"\nwarnings ({sum(len(r['warnings']) for r in warned)}):", file=file)
+        for r in warned:
+            for w in r["warnings"]:
+                print(f"  {r['file']}: {w}", file=file)
+
+    busy = sum(r["compile"] + r["assemble"] for r in results)
+    print(f"\n{len(results)} files, {len(results) - len(failed)} ok, {len(failed)} failed "
+          f"in {wall:.2f}s ({busy:.2f}s of compile time)", file=file)
+
+def cli():
+    parser = argparse.ArgumentParser(description="Compile every .qk file under a directory in parallel")
+    parser.add_argument("source", help="directory (searched recursively) or single .qk file")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes (default: one per core)")
+    parser.add_argument("-o", "--out-dir", default="build", help="output root, one subdirectory per file (default build/)")
+    parser.add_argument("--no-assemble", action="store_true", help="stop after writing the .asm files")
+    parser.add_argument("--asm", action="store_true", help="also write the .asm text of every class")
+    parser.add_argument("--lib", help="obj dir of classes compiled before, which the programs may use")
+    parser.add_argument("-O", "-O1", dest="opt_level", action="store_const", const=1, default=0,
+                           help="optimize: fold constants, remove dead code (see optimize.py)")
+    parser.add_argument("-O2", dest="opt_level", action="store_const", const=2, default=0,
+                           help="-O, drop + 0, * 1 and the like, inline small methods, call methods directly and reuse the frame for tail calls")
+    parser.add_argument("-O0", dest="opt_level", action="store_const", const=0, default=0,
+                           help="don't optimize (the default)")
+    return parser.parse_args()
+
+def main():
+    args = cli()
+    sources = find_sources(args.source)
+    if not sources:
+        sys.exit(f"batch.py: no .qk files under {args.source}")
+    root = args.source if os.path.isdir(args.source) else os.path.dirname(args.source)
+
+    start = time.perf_counter()
+    results = run(sources, root, args.out_dir, max(1, args.jobs), not args.no_assemble, args.asm, args.opt_level,
+                  args.lib)
+    report(results, time.perf_counter() - start)
+
+    if any(not r["ok"] for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Synthetic Quack program generator for the benchmarks.
+
+Programs are built from a handful of knobs:
+    classes     number of user classes
+    methods     methods per class
+    statements  statements per block
+    depth       nesting depth of if/while blocks
+    expr_len    operands per arithmetic expression
+
+Every generated program type checks, and runs to completion in the vm
+(loops are bounded by their own counters), so the same program can be
+pushed through every phase of the pipeline.
+
+    python bench/generate.py --classes 4 --methods 3 --statements 6 > prog.qk
+"""
+import random
+import argparse
+
+DEFAULTS = {"classes": 2, "methods": 2, "statements": 4, "depth": 1, "expr_len": 3, "seed": 0}
+
+
+class Generator():
+    def __init__(self, classes: int = 2, methods: int = 2, statements: int = 4, depth: int = 1,
+                 expr_len: int = 3, seed: int = 0):
+        self.classes = classes
+        self.methods = methods
+        self.statements = statements
+        self.depth = depth
+        self.expr_len = expr_len
+        self.rand = random.Random(seed)
+        self.lines = []
+        self.indent = 0
+
+    def line(self, text: str) -> None:
+        self.lines.append("    " * self.indent + text)
+
+    def expr(self, names: list[str]) -> str:
+        """
+        An Int expression with expr_len operands, drawn from names and small literals.
+        """
+        parts = []
+        for i in range(self.expr_len):
+            if i > 0:
+                parts.append(self.rand.choice(["+", "-", "*", "+"]))
+            if self.rand.random() < 0.6:
+                parts.append(self.rand.choice(names))
+            else:
+                parts.append(str(self.rand.randint(0, 9)))
+        # parenthesise a prefix now and then, so nesting shows up in the parser too
+        if len(parts) >= 3 and self.rand.random() < 0.3:
+            parts[0] = "(" + parts[0]
+            parts[2] = parts[2] + ")"
+        return " ".join(parts)
+
+    def block(self, names: list[str], depth: int) -> None:
+        for _ in range(self.statements):
+            kind = self.rand.random()
+            if depth > 0 and kind < 0.2:
+                # comparisons stick to plain operands, which is all the checker types there
+                self.line(f"if (y < {self.rand.choice(['x', 'w', str(self.rand.randint(0, 9))])}) {{")
+                self.indent += 1
+                self.block(names, depth - 1)
+                self.indent -= 1
+                self.line("} else {")
+                self.indent += 1
+                self.block(names, depth - 1)
+                self.indent -= 1
+                self.line("}")
+            elif depth > 0 and kind < 0.3:
+                # loops only ever count their own counter up, so they always terminate
+                counter = f"i{depth}"
+                self.line(f"{counter} = 0;")
+                self.line(f"while ({counter} < 2) {{")
+                self.indent += 1
+                self.line(f"{counter} = {counter} + 1;")
+                self.block(names, depth - 1)
+                self.indent -= 1
+                self.line("}")
+            elif kind < 0.4:
+                self.line(f"w = {self.expr(names)};")
+            else:
+                self.line(f"y = {self.expr(names)};")
+
+    def method(self, c: int, m: int) -> None:
+        self.line(f"def m{m}(x: Int): Int {{")
+        self.indent += 1
+        self.line("y = x + this.a;")
+        self.line("w = 1;")
+        self.block(["x", "y", "w", "this.a"], self.depth)
+        self.line("return y + this.a;")
+        self.indent -= 1
+        self.line("}")
+        self.line("")
+
+    def klass(self, c: int) -> None:
+        self.line(f"class C{c}(a: Int) {{")
+        self.indent += 1
+        self.line("this.a = a;")
+        self.line("")
+        for m in range(self.methods):
+            self.method(c, m)
+        self.indent -= 1
+        self.line("}")
+        self.line("")
+
+    def program(self) -> str:
+        for c in range(self.classes):
+            self.klass(c)
+
+        # statements: exercise every method once
+        self.line("y = 1;")
+        self.line("w = 2;")
+        for c in range(self.classes):
+            self.line(f"c{c} = C{c}({c + 1});")
+            for m in range(self.methods):
+                self.line(f"r = c{c}.m{m}({self.expr(['y', 'w'])});")
+                self.line("r.print();")
+                self.line('"\\n".print();')
+        return "\n".join(self.lines) + "\n"
+
+
+def generate(**params) -> str:
+    return Generator(**{**DEFAULTS, **params}).program()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Quack program")
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=int, default=default)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    print(generate(**vars(cli())), end="")
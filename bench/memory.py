@@ -0,0 +1,116 @@
+"""
+AST memory benchmark.
+
+Parses programs from bench/generate.py and measures what the tree costs
+once parsing is done: the bytes still allocated (tracemalloc) with only
+the statements and the user classes kept alive, the token stream
+dropped. The figure reported is bytes per source line; the AST's size
+relative to the source text is printed too.
+
+    python bench/memory.py --out before.json
+    python bench/memory.py --compare before.json
+
+Nodes are counted by walking the tree, shared nodes (interned literals)
+once.
+"""
+import os
+import gc
+import sys
+import json
+import argparse
+import logging
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from AST import ASTNode, Obj
+from quack import ParseTree
+from context import CompilationContext
+from generate import DEFAULTS, generate
+
+DEFAULT_STATEMENTS = [8, 32, 64, 128]
+
+
+def attributes(node) -> list:
+    # works for nodes with a __dict__ and for slotted ones
+    values = list(getattr(node, "__dict__", {}).values())
+    for cls in type(node).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if hasattr(node, name):
+                values.append(getattr(node, name))
+    return values
+
+
+def count_nodes(roots: list) -> int:
+    seen = set()
+    stack = list(roots)
+    while stack:
+        n = stack.pop()
+        if isinstance(n, (list, tuple)):
+            stack.extend(n)
+        elif isinstance(n, (ASTNode, Obj)) and id(n) not in seen:
+            seen.add(id(n))
+            stack.extend(attributes(n))
+    return len(seen)
+
+
+def measure(params: dict) -> dict:
+    program = generate(**params)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        with CompilationContext() as ctx:
+            tree = ParseTree(program)
+            tree.Parse()
+        roots = [tree.statements, list(ctx.classes.values())]
+        # only the tree stays alive, not the tokens or the parser
+        del tree, ctx
+        gc.collect()
+        ast_bytes = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    lines = program.count("\n")
+    return {"params": params, "lines": lines, "source_bytes": len(program), "nodes": count_nodes(roots),
+            "ast_bytes": ast_bytes, "bytes_per_line": ast_bytes / lines, "ast_per_source": ast_bytes / len(program)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory the parsed AST of generated programs takes")
+    parser.add_argument("--statements", type=int, nargs="+", default=DEFAULT_STATEMENTS,
+                        help="statements per method to sweep (default: %(default)s)")
+    parser.add_argument("--out", help="write results here instead of stdout")
+    parser.add_argument("--compare", help="earlier results to print before/after figures against")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    results = []
+    print(f"{'stmts':>6} {'lines':>7} {'nodes':>8} {'ast bytes':>11} {'B/line':>8} {'x source':>9}", file=sys.stderr)
+    for n in args.statements:
+        point = measure({**DEFAULTS, "statements": n})
+        results.append(point)
+        print(f"{n:>6} {point['lines']:>7} {point['nodes']:>8} {point['ast_bytes']:>11} "
+              f"{point['bytes_per_line']:>8.0f} {point['ast_per_source']:>9.1f}", file=sys.stderr)
+
+    text = json.dumps({"points": results}, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            old = {json.dumps(p["params"], sort_keys=True): p for p in json.load(f)["points"]}
+        for point in results:
+            prev = old.get(json.dumps(point["params"], sort_keys=True))
+            if prev is not None:
+                print(f"statements={point['params']['statements']}: {prev['bytes_per_line']:.0f} -> "
+                      f"{point['bytes_per_line']:.0f} bytes/line "
+                      f"({point['bytes_per_line'] / prev['bytes_per_line']:.2f}x)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
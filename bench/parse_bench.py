@@ -0,0 +1,63 @@
+"""
+Parse-time benchmark.
+
+Generates Quack programs of 1k, 10k and 100k lines and times
+ParseTree.Parse() on each of them. With the token stream the time per
+line should stay roughly flat as the program grows.
+
+    python bench/parse_bench.py [--lines 1000 10000 100000]
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from quack import ParseTree
+from context import CompilationContext
+
+# a small block of statements that exercises most of the grammar
+# (10 lines, so line counts stay round)
+CHUNK = """x{i} = {i} * 2 + 1;
+y{i}: Int = x{i} - 3 / 1;
+// comment line {i}
+if (x{i} < y{i} and y{i} > 0) {{
+    "less\\n".print();
+}} elif (x{i} == 4) {{
+    x{i}.print();
+}} else {{ y{i}.print(); }}
+/* block comment {i} */
+while (y{i} < 10) {{ y{i} = y{i} + 1; }}
+"""
+
+
+def generate(lines: int) -> str:
+    return "".join(CHUNK.format(i=i) for i in range(lines // 10))
+
+
+def time_parse(program: str) -> float:
+    with CompilationContext():
+        start = time.perf_counter()
+        ParseTree(program).Parse()
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time ParseTree.Parse on generated programs")
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    # keep the parser's logging out of the timings
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'lines':>8} {'seconds':>10} {'us/line':>10}")
+    for n in args.lines:
+        program = generate(n)
+        elapsed = time_parse(program)
+        print(f"{n:>8} {elapsed:>10.3f} {elapsed / n * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Compile-pipeline benchmark.
+
+Generates programs with bench/generate.py and times every phase of the
+pipeline separately:
+
+    parse       ParseTree.Parse
+    codegen     the check/evaluate walk that generates the asm
+    assemble    lowering every class to json object code (backend.py)
+    vm          tiny_vm loading (and running) the program
+
+Each knob given with --scale is swept while the others stay at their base
+values, giving one scaling curve per knob. Times are the best of --repeat
+runs; peak memory of the python phases comes from a separate run under
+tracemalloc (a child's max rss is inherited from the forking python
+process, so the vm has no peak). Results are written as json.
+
+    python bench/pipeline.py --out before.json
+    python bench/pipeline.py --out after.json --compare before.json
+
+The vm phase is skipped (null) when the vm binary does not run on this
+machine, or when the program would not fit in tiny_vm's fixed tables.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import logging
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+VM = os.path.join(ROOT, "vm")
+
+sys.path.insert(0, ROOT)
+
+from quack import ParseTree, codegen
+from backend import BUILTINS, assembler, assemble_emitters
+from context import CompilationContext
+from generate import DEFAULTS, generate
+
+PHASES = ["parse", "codegen", "assemble", "vm"]
+
+# tiny_vm's fixed tables (vm_state.h, vm_loader.c); larger programs overrun them
+VM_CODE_CAPACITY = 1024
+VM_CLASS_CONSTANTS = 29
+VM_CLASS_IMPORTS = 30
+VM_CONST_POOL = 128
+
+DEFAULT_SCALES = ["statements=2,8,32,64", "classes=1,4,16", "expr_len=2,8,32", "depth=0,1,2,3"]
+
+
+def make_workdir() -> str:
+    # a scratch directory with its own OBJ library, seeded with the builtin classes
+    workdir = tempfile.mkdtemp(prefix="quack-bench-")
+    os.makedirs(os.path.join(workdir, "OBJ"))
+    for name in BUILTINS:
+        shutil.copy(os.path.join(VM, "OBJ", f"{name}.json"), os.path.join(workdir, "OBJ"))
+    return workdir
+
+
+def vm_fits(objects: list[dict]) -> bool:
+    words = sum(len(m["code"]) for o in objects for m in o["code"])
+    constants = [len(o["constants"]) for o in objects]
+    return (words <= VM_CODE_CAPACITY and max(constants, default=0) <= VM_CLASS_CONSTANTS
+            and sum(constants) <= VM_CONST_POOL and all(len(o["imports"]) <= VM_CLASS_IMPORTS for o in objects))
+
+
+def run_vm(vm: str, workdir: str, main: str) -> None:
+    proc = subprocess.run([vm, "-L", "OBJ", main], cwd=workdir,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if proc.returncode != 0:
+        raise RuntimeError(f"tiny_vm exited with {proc.returncode}")
+
+
+def run_once(program: str, workdir: str, vm: str | None, traced: bool = False) -> dict:
+    """
+    Push program through the whole pipeline once.
+    Returns {"seconds": {phase: s}, "peak_bytes": {phase: bytes}, "sizes": {...}};
+    peak_bytes is only filled in when traced.
+    """
+    seconds = dict.fromkeys(PHASES)
+    peaks = dict.fromkeys(PHASES)
+
+    def phase(name, start, base):
+        seconds[name] = time.perf_counter() - start
+        if traced:
+            peaks[name] = tracemalloc.get_traced_memory()[1] - base
+
+    def begin():
+        base = 0
+        if traced:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        return time.perf_counter(), base
+
+    with CompilationContext():
+        start, base = begin()
+        tree = ParseTree(program)
+        tree.Parse()
+        phase("parse", start, base)
+
+        start, base = begin()
+        emitters = codegen(tree, "Main")
+        phase("codegen", start, base)
+
+    start, base = begin()
+    objects, errors = assemble_emitters(emitters, os.path.join(workdir, "OBJ"))
+    phase("assemble", start, base)
+    if errors:
+        raise RuntimeError("assembler: " + "; ".join(errors))
+    objects = [json.loads(text) for text in objects.values()]
+
+    if vm is not None and vm_fits(objects):
+        start = time.perf_counter()
+        run_vm(vm, workdir, list(emitters)[-1])
+        seconds["vm"] = time.perf_counter() - start
+
+    sizes = {
+        "lines": program.count("\n"),
+        # the .asm text is only a debug dump now, but its size is still a fair measure of the code
+        "asm_bytes": sum(len(cls.text()) for cls in emitters.values()),
+        "code_words": sum(len(m["code"]) for o in objects for m in o["code"]),
+    }
+    return {"seconds": seconds, "peak_bytes": peaks, "sizes": sizes}
+
+
+def measure(params: dict, vm: str | None, repeat: int) -> dict:
+    program = generate(**params)
+    workdir = make_workdir()
+    try:
+        best = None
+        for _ in range(repeat):
+            run = run_once(program, workdir, vm)
+            if best is None:
+                best = run
+            else:
+                for p in PHASES:
+                    if run["seconds"][p] is not None:
+                        best["seconds"][p] = min(best["seconds"][p], run["seconds"][p])
+
+        tracemalloc.start()
+        try:
+            traced = run_once(program, workdir, vm, traced=True)
+        finally:
+            tracemalloc.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {"params": params, **best["sizes"], "seconds": best["seconds"], "peak_bytes": traced["peak_bytes"]}
+
+
+def find_vm(path: str) -> str | None:
+    """
+    path if it is a tiny_vm binary that runs here (the checked in one may be built for another platform).
+    """
+    try:
+        subprocess.run([path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return path
+
+
+def parse_scale(text: str) -> tuple[str, list[int]]:
+    knob, _, values = text.partition("=")
+    if knob not in DEFAULTS or knob == "seed":
+        raise argparse.ArgumentTypeError(f"unknown knob {knob}, expected one of {', '.join(DEFAULTS)}")
+    return knob, [int(v) for v in values.split(",")]
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(new: dict, old: dict, threshold: float, floor: float) -> list[str]:
+    """
+    Phase timings and peaks in new that are more than threshold times their counterpart in old.
+    Timings under floor seconds are too noisy to compare.
+    """
+    regressions = []
+    for knob, points in new["curves"].items():
+        before = {json.dumps(p["params"], sort_keys=True): p for p in old["curves"].get(knob, [])}
+        for point in points:
+            prev = before.get(json.dumps(point["params"], sort_keys=True))
+            if prev is None:
+                continue
+            for p in PHASES:
+                for metric, minimum in [("seconds", floor), ("peak_bytes", 0)]:
+                    a, b = prev[metric].get(p), point[metric].get(p)
+                    if a is None or b is None or max(a, b) < minimum or a == 0:
+                        continue
+                    if b / a > threshold:
+                        regressions.append(f"{knob}={point['params'][knob]} {p} {metric}: "
+                                           f"{a:.4g} -> {b:.4g} ({b / a:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each phase of the Quack compile pipeline on generated programs")
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=int, default=default,
+                            help=f"base value (default {default})")
+    parser.add_argument("--scale", type=parse_scale, action="append",
+                        help="knob=v1,v2,... to sweep (repeatable, default: " + " ".join(DEFAULT_SCALES) + ")")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per point, the fastest is kept")
+    parser.add_argument("--vm", default=os.path.join(VM, "bin", "tiny_vm"), help="tiny_vm binary")
+    parser.add_argument("--out", help="write results here instead of stdout")
+    parser.add_argument("--compare", help="earlier results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio that counts as a regression")
+    parser.add_argument("--floor", type=float, default=0.001, help="ignore timings below this many seconds")
+    args = parser.parse_args()
+
+    # keep the compiler's and assembler's logging out of the timings
+    logging.disable(logging.CRITICAL)
+    assembler()
+
+    base = {name: getattr(args, name) for name in DEFAULTS}
+    scales = args.scale or [parse_scale(s) for s in DEFAULT_SCALES]
+    vm = find_vm(args.vm)
+    if vm is None:
+        print(f"{args.vm} does not run here, skipping the vm phase", file=sys.stderr)
+
+    results = {
+        "meta": {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                 "repeat": args.repeat, "vm": vm, "base": base},
+        "curves": {},
+    }
+
+    print(f"{'knob':>12} {'value':>6} {'lines':>7} " + " ".join(f"{p:>10}" for p in PHASES), file=sys.stderr)
+    for knob, values in scales:
+        curve = results["curves"].setdefault(knob, [])
+        for value in values:
+            point = measure({**base, knob: value}, vm, args.repeat)
+            curve.append(point)
+            times = " ".join("         -" if point["seconds"][p] is None else f"{point['seconds'][p]:>10.4f}"
+                             for p in PHASES)
+            print(f"{knob:>12} {value:>6} {point['lines']:>7} {times}", file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            old = json.load(f)
+        regressions = compare(results, old, args.threshold, args.floor)
+        for r in regressions:
+            print(f"REGRESSION {r}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.compare} (commit {old['meta'].get('commit')})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Content-addressed on-disk cache of compiler output.
+
+An entry maps a key (hash of the source, the output name, the compile options and
+the compiler version) to the files that compiling that program wrote: the asm or the
+object code of every class. On a hit quack.py writes the cached files back out and
+skips parsing and type checking.
+
+Entries are evicted least-recently-used first once the cache grows past its size cap;
+a hit bumps the entry's mtime, so mtime order is LRU order.
+"""
+import os
+import json
+import glob
+import hashlib
+import tempfile
+import fcntl
+
+COMPILER_VERSION = "1"
+
+DEFAULT_DIR = ".quack_cache"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+STATS_FILE = "stats.json"
+# held while stats.json is read, added to and written back
+STATS_LOCK = "stats.lock"
+
+# the assembler and its instruction table, which turn the asm into the cached object code,
+# and the builtin class registry, which type checking and code generation read
+VM_FILES = [os.path.join("vm", "assemble.py"), os.path.join("vm", "opdefs.txt"), os.path.join("vm", "builtins.json")]
+
+_fingerprint = None
+
+def compiler_fingerprint() -> str:
+    """
+    Hash of COMPILER_VERSION and the compiler's own sources (the assembler's included), so
+    editing the compiler invalidates everything it cached before.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        h = hashlib.sha256(COMPILER_VERSION.encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        sources = sorted(glob.glob(os.path.join(here, "*.py"))) + [os.path.join(here, p) for p in VM_FILES]
+        for path in sources:
+            with open(path, "rb") as f:
+                h.update(os.path.relpath(path, here).encode())
+                h.update(f.read())
+        _fingerprint = h.hexdigest()
+    return _fingerprint
+
+def atomic_write(path: str, text: str) -> None:
+    """
+    Write text to path so that readers see either the old or the new file, never half of one.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+class CompileCache():
+    def __init__(self, directory: str = DEFAULT_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, source: str, name: str, options: tuple = ()) -> str:
+        h = hashlib.sha256()
+        h.update(compiler_fingerprint().encode())
+        h.update(b"\0" + name.encode())
+        h.update(b"\0" + repr(options).encode())
+        h.update(b"\0" + source.encode())
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> dict[str, str] | None:
+        """
+        Cached {path: text} for key, or None on a miss.
+        """
+        path = self.path(key)
+        try:
+            with open(path, "r") as f:
+                files = json.load(f)["files"]
+            # bump the entry to most recently used
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return files
+
+    def put(self, key: str, files: dict[str, str]) -> None:
+        atomic_write(self.path(key), json.dumps({"files": files}))
+        self.evict()
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        # (mtime, size, path) of every entry, oldest first
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            if os.path.basename(path) == STATS_FILE:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self) -> None:
+        """
+        Drop least recently used entries until the cache fits in max_bytes.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def load_stats(self) -> dict[str, int]:
+        try:
+            with open(os.path.join(self.directory, STATS_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0, "evictions": 0}
+
+    def save_stats(self) -> dict[str, int]:
+        """
+        Add this run's counters to the totals kept in the cache directory and return the totals.
+        Batch workers and quackd save at once, so the update holds a lock on the directory's
+        STATS_LOCK: without it two of them would read the same totals and one's counts be lost.
+        """
+        with open(os.path.join(self.directory, STATS_LOCK), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stats = self.load_stats()
+            stats["hits"] = stats.get("hits", 0) + self.hits
+            stats["misses"] = stats.get("misses", 0) + self.misses
+            stats["evictions"] = stats.get("evictions", 0) + self.evictions
+            atomic_write(os.path.join(self.directory, STATS_FILE), json.dumps(stats))
+        self.hits = self.misses = self.evictions = 0
+        return stats
+
+    def __str__(self):
+        stats = self.load_stats()
+        entries = self.entries()
+        size = sum(size for _, size, _ in entries)
+        return (f"cache {self.directory}: {len(entries)} entries, {size} bytes (cap {self.max_bytes}), "
+                f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
@@ -0,0 +1,125 @@
+"""
+Class hierarchy analysis.
+
+The compiler sees the whole program: every user class (current().classes) and the
+builtin classes (registry.py), each with its parent. So it knows every class under a
+class, and every method a call could go to. A call is emitted as `call D:m`, D the class
+that defines the method for the receiver's static type (see Call.typecheck); unless a
+class under D overrides m, that is the only method the call can reach, whatever the
+receiver turns out to be. That takes a receiver that is a D: a call on a variable the
+method also assigns values of other classes is left alone (see dynamic).
+
+devirtualize is the IR pass (see ir.py) that turns those calls, and every constructor
+call (its receiver is the object new just made), into `call_direct D:m`, which the vm
+loader binds to the method's code: no vtable lookup through the receiver's class at run
+time. Its operand has room for DIRECT_MAX_IMPORTS classes, so the calls of a class that
+may import more stay as they are. It runs last before slots, so the passes before it only see `call` (a tail_call,
+see ir.tail_calls, still goes through the vtable). Typecase uses
+is_subclass to decide cases at compile time (see optimize.py).
+
+A class imported from an interface (see interface.py) is the exception: the program it
+was compiled with may have classes under it that this one never sees, so calls to its
+methods stay virtual. The other way round, a program compiled later may subclass this
+one's classes. So each class's interface lists the methods the passes took to be
+overridden nowhere under it (assumed_final), and a class that overrides one of them is
+rejected (Class.get_method_table).
+"""
+import registry
+from ir import CFG
+from context import current
+from AST import method_table
+
+# a call_direct operand holds the class's index in the caller's imports in 5 bits
+# (DIRECT_CLASS_BITS in vm/assemble.py)
+DIRECT_MAX_IMPORTS = 32
+
+def parent(name: str) -> str | None:
+    """
+    The parent of a user or builtin class (None for Obj).
+    """
+    if name == "Obj":
+        return None
+    if name in registry.CLASSES:
+        return registry.CLASSES[name]["super"]
+    return current().classes[name].parent
+
+def is_subclass(name: str, other: str) -> bool:
+    """
+    Whether every instance of name is an instance of other.
+    """
+    while name is not None:
+        if name == other:
+            return True
+        name = parent(name)
+    return False
+
+def overridden(cls: str, method: str) -> str | None:
+    """
+    A class under cls whose instances have another method than cls's for method, if any.
+    """
+    ctx = current()
+    key = f"{cls}:{method}"
+    if key not in ctx.overrides:
+        ctx.overrides[key] = None
+        definer = method_table(cls)[method].definer
+        for name in [*registry.CLASSES, *ctx.classes]:
+            entry = method_table(name).get(method)
+            if name != cls and entry is not None and entry.definer != definer and is_subclass(name, cls):
+                ctx.overrides[key] = name
+                break
+    return ctx.overrides[key]
+
+def imported(name: str) -> bool:
+    return name not in registry.CLASSES and current().classes[name].imported
+
+def assumed_final(name: str) -> list[str]:
+    """
+    The methods of a class that overridden found no class under it overriding. Calls to
+    them may have been inlined or bound directly.
+    """
+    return sorted(key.split(":")[1] for key, other in current().overrides.items()
+                  if other is None and key.split(":")[0] == name)
+
+def dynamic(cfg: CFG) -> set[str]:
+    """
+    The calls of a method whose receiver may not be of the class the call names (see
+    ASTNode.settle_types): whatever the hierarchy says, they go through the vtable.
+    """
+    return current().dynamic_calls.get(f"{cfg.cls}:{cfg.name}", set())
+
+def imports(cls: str) -> int:
+    """
+    At most how many classes the assembler's import table for a generated class holds: $,
+    the parent, and every class its code names, with the code of the methods it calls (the
+    ones inline may put in it).
+    """
+    ctx = current()
+    if cls not in ctx.imports:
+        names = {"$", ctx.generated[cls].parent}
+        code = [instr for key, (_, _, c) in ctx.method_code.items() if key.split(":")[0] == cls for instr in c]
+        code += [instr for _, op, operand in list(code) if op == "call" and operand in ctx.method_code
+                 for instr in ctx.method_code[operand][2]]
+        for _, op, operand in code:
+            if op in ("call", "load_field", "store_field"):
+                names.add(operand.split(":")[0])
+            elif op in ("new", "is_instance"):
+                names.add(operand)
+        ctx.imports[cls] = len(names)
+    return ctx.imports[cls]
+
+def devirtualize(cfg: CFG) -> None:
+    if imports(cfg.cls) > DIRECT_MAX_IMPORTS:
+        cfg.remarks.append(f"calls stay virtual: up to {imports(cfg.cls)} imports, call_direct reaches {DIRECT_MAX_IMPORTS}")
+        return
+    calls = dynamic(cfg)
+    for b in cfg.blocks:
+        for i, (_, op, operand) in enumerate(b.instrs):
+            if op != "call" or operand in calls:
+                continue
+            cls, method = operand.split(":")
+            if method != "$constructor" and (imported(cls) or overridden(cls, method) is not None):
+                continue
+            if cls == cfg.cls:
+                # the assembler knows this class's own methods as $
+                cls = "$"
+            b.instrs[i] = (None, "call_direct", f"{cls}:{method}")
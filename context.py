@@ -0,0 +1,96 @@
+"""
+Per-compilation state.
+
+Everything the parser, checker and code generator used to keep in class attributes
+(user classes, variable scope, label counters, the current emitters, generated classes)
+lives in a CompilationContext. A context is made current for the thread that enters it:
+
+    with CompilationContext() as ctx:
+        ParseTree(program).Parse()
+        ...
+
+so separate compilations never see each other, whether they run one after the other
+or in several threads at once.
+"""
+import threading
+
+_local = threading.local()
+
+class CompilationContext():
+    def __init__(self, opt_level: int = 0):
+        # -O level (see optimize.py)
+        self.opt_level = opt_level
+
+        # user classes by name (name : Class)
+        self.classes: dict[str, object] = {}
+
+        # live variables (name : type) and arguments of the method being checked, and the
+        # variables of the for loops that ended (out of scope, but locals of the method all the same)
+        self.scope: dict[str, str] = {}
+        self.args: dict[str, str] = {}
+        self.loop_vars: list[str] = []
+        self.block_level = 0
+
+        # class whose fields `this` refers to
+        self.parsing_class: str = None
+
+        # emitters for the class and the method currently being generated
+        self.class_emitter = None
+        self.emitter = None
+
+        # label counters
+        self.elif_stmts = 0
+        self.else_stmts = 0
+        self.loops = 0
+        self.block_label = 0
+        self.boolcomp_label = 0
+        self.typecase_label = 0
+        self.typecase_gen_label = 0
+
+        # code of every generated method before the passes ("Class:method" : (args, locals, code)),
+        # and the constants each class uses (see inline.py)
+        self.method_code: dict[str, tuple] = {}
+        self.constants: dict[str, int] = {}
+
+        # a class overriding each Class:method called, None if there is none (see cha.overridden)
+        self.overrides: dict[str, str | None] = {}
+
+        # every type assigned to each variable of the body being checked, the variables each
+        # is assigned from, and the nodes that depend on a variable's type (see ASTNode.settle_types)
+        self.assigned: dict[str, set[str]] = {}
+        self.copies: dict[str, set[str]] = {}
+        self.typed_uses: list[tuple[object, str]] = []
+
+        # the calls in each Class:method whose receiver may not be of its static type
+        # ("Class:method" : {call operands}, see ASTNode.settle_types)
+        self.dynamic_calls: dict[str, set[str]] = {}
+
+        # at most how many classes each generated class imports (see cha.imports)
+        self.imports: dict[str, int] = {}
+
+        # calls to methods the vm implements (see cse.builtin_calls)
+        self.builtin_calls: set[str] = None
+
+        # generated classes (class name : ClassEmitter), in the order they were generated
+        self.generated: dict[str, object] = {}
+
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = getattr(_local, "context", None)
+        _local.context = self
+        return self
+
+    def __exit__(self, *exc):
+        _local.context = self._outer
+        self._outer = None
+        return False
+
+def current() -> CompilationContext:
+    """
+    The context of the compilation running on this thread.
+    """
+    ctx = getattr(_local, "context", None)
+    if ctx is None:
+        raise RuntimeError("No compilation in progress - enter a CompilationContext first")
+    return ctx
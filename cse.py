@@ -0,0 +1,175 @@
+"""
+Common subexpression elimination.
+
+An IR pass (see ir.py) that finds values computed more than once in a basic block and
+computes them once. Each block is simulated on a stack of value numbers: two values get
+the same number when they come from the same instruction applied to the same values,
+so `this.x * this.x` is the same value every time the block computes it, as long as
+nothing in between could have changed it:
+
+    a local is the same until it is stored to
+    a field load is the same until a store_field to that field, or a call to a user
+    method (see builtin_calls), which may store to any field
+
+The vm has no dup, so the first occurrence of a value that is reused is followed by
+`store t; load t` (t a new local), and every later one is replaced by `load t`. That only
+pays when it saves more than those two instructions: a reuse saves what computing the
+value costs, less the load, and a call counts as CALL_COST (it also enters a frame, runs
+the native code, returns and allocates its result). Larger values are considered first,
+and a value inside one that is replaced is not counted again.
+"""
+import itertools
+
+from ir import CFG, Block, text
+from context import current
+import registry
+
+CALL_COST = 4
+
+def builtin_calls() -> set[str]:
+    """
+    The calls (Class:method) that go to a method the vm implements: every builtin method,
+    unless a user class under the builtin overrides it, since a call goes to the method of
+    the receiver's class. These never store to a field.
+    """
+    ctx = current()
+    if ctx.builtin_calls is None:
+        overridden = set()
+        for c in ctx.classes.values():
+            builtin = c.parent
+            while builtin not in registry.CLASSES:
+                builtin = ctx.classes[builtin].parent
+            # Obj is its own parent
+            while True:
+                overridden.update(f"{builtin}:{m.name}" for m in c.class_body.methods)
+                if builtin == "Obj":
+                    break
+                builtin = registry.CLASSES[builtin]["super"]
+        ctx.builtin_calls = {f"{name}:{m}" for name, cls in registry.CLASSES.items() for m, entry in cls["methods"].items()
+                             if entry["native"] is not None and m != "$constructor"} - overridden
+    return ctx.builtin_calls
+
+def pure_calls() -> set[str]:
+    """
+    The builtin calls that only compute a value from their receiver and arguments (all but print).
+    """
+    return {c for c in builtin_calls() if not c.endswith(":print")}
+
+def cost(instrs: list[tuple]) -> int:
+    return sum(CALL_COST if op == "call" else 1 for _, op, _ in instrs)
+
+class Value():
+    """
+    A value on the simulated stack: its number, and the instructions that computed it
+    (start..end) when they are exactly the ones that could be replaced by a load.
+    """
+    __slots__ = ("number", "start", "end")
+
+    def __init__(self, number: int, start: int | None, end: int | None):
+        self.number = number
+        self.start = start
+        self.end = end
+
+def occurrences(cfg: CFG, block: Block, builtin: set[str], pure: set[str]) -> dict[int, list[tuple[int | None, int]]]:
+    """
+    For each value number computed in block by pure instructions, where it is computed:
+    (start, end) instruction indices, start None when the value can't be replaced.
+    """
+    numbers = {}
+    versions, fields, memory = {}, {}, 0
+    found = {}
+    stack = []
+    unknown = itertools.count(-1, -1)
+
+    def fresh() -> Value:
+        # a value nothing else is equal to
+        return Value(next(unknown), None, None)
+
+    for k, instr in enumerate(block.instrs):
+        _, op, operand = instr
+        pops, pushes = cfg.effect(instr)
+        # values left on the stack by the blocks before this one are unknown
+        args = [stack.pop() if stack else fresh() for _ in range(pops)][::-1]
+        numbers_in = tuple(a.number for a in args)
+
+        key = None
+        if op == "const":
+            key = (op, operand)
+        elif op == "load":
+            key = (op, operand, versions.get(operand, 0))
+        elif op == "load_field":
+            field = operand.split(":")[1]
+            key = (op, field, fields.get(field, 0), memory) + numbers_in
+        elif (op == "call" and operand in pure) or op == "is_instance":
+            key = (op, operand) + numbers_in
+
+        if op == "store":
+            versions[operand] = versions.get(operand, 0) + 1
+        elif op == "store_field":
+            field = operand.split(":")[1]
+            fields[field] = fields.get(field, 0) + 1
+        elif op == "call" and operand not in builtin:
+            memory += 1
+        elif op == "roll":
+            # reorders the stack: forget what is on it
+            stack = [fresh() for _ in stack]
+
+        if not pushes:
+            continue
+        if key is None:
+            stack.append(fresh())
+            continue
+
+        # replaceable if the arguments were computed right before, one after the other
+        start = k
+        for a in reversed(args):
+            if a.start is None or a.end != start - 1:
+                start = None
+                break
+            start = a.start
+        number = numbers.setdefault(key, len(numbers))
+        found.setdefault(number, []).append((start, k))
+        stack.append(Value(number, start, k))
+    return found
+
+def eliminate(cfg: CFG) -> None:
+    builtin, pure = builtin_calls(), pure_calls()
+    for b in cfg.blocks:
+        instrs = b.instrs
+        replaced = {}
+        saves = {}
+        candidates = []
+        for number, occ in occurrences(cfg, b, builtin, pure).items():
+            if len(occ) > 1 and any(s is not None for s, _ in occ[1:]):
+                size = max(cost(instrs[s:e + 1]) for s, e in occ if s is not None)
+                candidates.append((size, number, occ))
+
+        for _, _, occ in sorted(candidates, key=lambda c: -c[0]):
+            # occurrences inside a value that is already replaced are gone
+            occ = [(s, e) for s, e in occ if not any(rs <= e <= re for rs, (re, _) in replaced.items())]
+            later = [(s, e) for s, e in occ[1:] if s is not None]
+            if not later or sum(cost(instrs[s:e + 1]) - 1 for s, e in later) <= 2:
+                continue
+            temp = cfg.temp()
+            s, e = later[0]
+            cfg.remarks.append(f"computed `{text(*instrs[s:e + 1])}` once for {len(later) + 1} uses in {b} ({temp})")
+            saves[occ[0][1]] = temp
+            for s, e in later:
+                replaced[s] = (e, temp)
+
+        if not saves:
+            continue
+        out = []
+        k = 0
+        while k < len(instrs):
+            if k in replaced:
+                end, temp = replaced[k]
+                out.append((None, "load", temp))
+                k = end + 1
+                continue
+            out.append(instrs[k])
+            if k in saves:
+                out.append((None, "store", saves[k]))
+                out.append((None, "load", saves[k]))
+            k += 1
+        b.instrs = out
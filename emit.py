@@ -0,0 +1,99 @@
+"""
+Code emitter for tiny_vm assembly.
+
+Code generation appends records to an emitter instead of concatenating strings.
+There is one MethodEmitter per method (the constructor included), collected in
+a ClassEmitter per class. A record is a (label, op, operand) tuple; a label on
+its own line is (label, None, None).
+
+The directives that are only known once a body has been generated (.local for
+a method; .field and the .method forward declarations for a class) have
+reserved slots in the header, so nothing is ever prepended. A class's text is
+joined once, and written out by the driver with a single write.
+
+Once slots.allocate() has given a method's locals frame slots, its loads and stores
+carry frame offsets instead of names and the header allocates the slots (alloc n)
+instead of declaring the names.
+"""
+
+class MethodEmitter():
+    def __init__(self, name: str, args: list[str]):
+        self.name = name
+        self.args = args
+
+        # reserved header slot, filled in once the body has been generated
+        self.locals: list[str] = []
+
+        # frame offset of each local (name : offset, as its loads and stores carry it) and the
+        # number of slots, set by slots.allocate()
+        self.slots: dict[str, int] = None
+        self.frame = 0
+
+        self.code: list[tuple[str | None, str | None, str | int | None]] = []
+
+    def instr(self, op: str, operand: str | int = None) -> None:
+        self.code.append((None, op, operand))
+
+    def label(self, name: str) -> None:
+        self.code.append((name, None, None))
+
+    def mark(self) -> int:
+        # where the next record goes, for insert() and loads()
+        return len(self.code)
+
+    def insert(self, at: int, op: str, operand: str | int = None) -> None:
+        self.code.insert(at, (None, op, operand))
+
+    def loads(self, name: str, since: int) -> bool:
+        # whether the code emitted since a mark() loads the variable name
+        return any(op == "load" and operand == name for _, op, operand in self.code[since:])
+
+    def lines(self) -> list[str]:
+        out = [f".method {self.name}"]
+        if self.args:
+            out.append(f".args {','.join(self.args)}")
+        if self.slots is not None:
+            if self.slots:
+                out.append("# " + ", ".join(f"{l}={s}" for l, s in self.slots.items()))
+            if self.frame:
+                out.append(f"\talloc {self.frame}")
+        elif self.locals:
+            out.append(f".local {','.join(self.locals)}")
+        out.append("\tenter")
+
+        for label, op, operand in self.code:
+            if op is None:
+                out.append(f"{label}:")
+            elif operand is None:
+                out.append(f"\t{op}")
+            else:
+                out.append(f"\t{op} {operand}")
+        return out
+
+class ClassEmitter():
+    def __init__(self, name: str, parent: str):
+        self.name = name
+        self.parent = parent
+
+        # reserved header slot, filled in once every method has been generated
+        self.fields: list[str] = []
+
+        # constructor first
+        self.methods: list[MethodEmitter] = []
+
+        # what other programs compile against (see interface.py), None for the statement class
+        self.interface: dict = None
+
+    def method(self, name: str, args: list[str]) -> MethodEmitter:
+        m = MethodEmitter(name, args)
+        self.methods.append(m)
+        return m
+
+    def text(self) -> str:
+        lines = [f".class {self.name}:{self.parent}"]
+        lines.extend(f".field {f}" for f in self.fields)
+        lines.extend(f".method {m.name} forward" for m in self.methods if m.name != "$constructor")
+        for m in self.methods:
+            lines.extend(m.lines())
+            lines.append("")
+        return "\n".join(lines)
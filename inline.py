@@ -0,0 +1,139 @@
+"""
+Inlining of small user methods.
+
+An IR pass (see ir.py) that replaces a call to a short user method with the method's
+code, saving the call, enter and return and the frame they set up (for an accessor like
+Pt:_get_x that is most of what it does). A call is inlined when it can only go to one
+method: `call D:m` with D a user class the program defines (an imported one has no code
+here, see interface.py), a receiver that is a D (not one of cha.dynamic), and no class
+under D overriding m (see cha.py).
+The method's code, as generated (codegen keeps it in
+current().method_code before any pass runs), must be one block ending in its only
+return, of at most INLINE_SIZE instructions, that never reads a local before writing it.
+
+At the call, the receiver and the arguments are on the stack; they are stored to new
+locals (cfg.temp()), or popped if the method never loads them, the method's own locals
+get new locals as well, and `return`
+becomes nothing, leaving the result where the call would have. A method with no
+arguments that loads $ only as its first instruction uses the receiver where it is:
+
+    call Pt:_get_x      ->      load_field Pt:x
+
+Field, method and class references to $ are qualified with the class that defines the
+method.
+The vm holds at most MAX_CONSTANTS constants per class, so a method whose consts would
+take the caller's class past that is not inlined. What was and wasn't inlined goes in
+cfg.remarks (--opt-report).
+"""
+import cha
+from ir import CFG, ENDS_BLOCK
+from context import current
+
+INLINE_SIZE = 8
+
+# the vm loader's constant pool per class (it asserts fewer than 30)
+MAX_CONSTANTS = 29
+
+# consts that are not in the constant pool
+NAMED_LITERALS = ("true", "false", "nothing")
+
+def constants(cls: str) -> int:
+    """
+    The constants the generated code of a class uses (inlined ones included).
+    """
+    ctx = current()
+    if cls not in ctx.constants:
+        ctx.constants[cls] = sum(1 for key, (_, _, code) in ctx.method_code.items() if key.split(":")[0] == cls
+                                 for _, op, operand in code if op == "const" and operand not in NAMED_LITERALS)
+    return ctx.constants[cls]
+
+def why_not(cfg: CFG, operand: str) -> str | None:
+    """
+    Why the method a call goes to can't be inlined into cfg (None if it can).
+    """
+    if operand in cha.dynamic(cfg):
+        return "the receiver may be another class"
+    other = cha.overridden(*operand.split(":"))
+    if other is not None:
+        return f"overridden in {other}"
+
+    args, locals, code = current().method_code[operand]
+    size = len(code) - 1
+    if any(op is None or op in ENDS_BLOCK for _, op, _ in code[:-1]) or code[-1][1] != "return":
+        return "more than one block"
+    if size > INLINE_SIZE:
+        return f"{size} instructions"
+    written = set()
+    for _, op, operand in code:
+        if op == "store":
+            written.add(operand)
+        elif op == "load" and operand in locals and operand not in written:
+            return f"reads {operand} before writing it"
+    added = sum(1 for _, op, operand in code if op == "const" and operand not in NAMED_LITERALS)
+    if added and constants(cfg.cls) + added > MAX_CONSTANTS:
+        return f"constant pool of {cfg.cls} is full"
+    return None
+
+def expand(cfg: CFG, operand: str) -> list[tuple]:
+    """
+    The code to run in place of a call, which why_not allows.
+    """
+    definer = operand.split(":")[0]
+    args, locals, code = current().method_code[operand]
+    body = code[:-1]
+    # the method's calls on a retyped receiver stay so in cfg
+    dynamic = current().dynamic_calls.get(operand, set())
+
+    out = []
+    names = {}
+    if not args and body and body[0][1:] == ("load", "$") and sum(1 for _, op, o in body if op == "load" and o == "$") == 1:
+        # the receiver is already where the method would load it
+        body = body[1:]
+    else:
+        # the receiver was pushed last
+        loaded = {operand for _, op, operand in body if op == "load"}
+        for name in ["$"] + args[::-1]:
+            if name not in loaded:
+                out.append((None, "pop", None))
+                continue
+            names[name] = cfg.temp()
+            out.append((None, "store", names[name]))
+    for name in locals:
+        names[name] = cfg.temp()
+
+    for _, op, operand in body:
+        retyped = op == "call" and operand in dynamic
+        if op in ("load", "store"):
+            operand = names.get(operand, operand)
+        elif op in ("load_field", "store_field", "call") and operand.startswith("$:") and definer != cfg.cls:
+            operand = f"{definer}{operand[1:]}"
+        elif op in ("new", "is_instance") and operand == "$" and definer != cfg.cls:
+            operand = definer
+        if retyped:
+            current().dynamic_calls.setdefault(f"{cfg.cls}:{cfg.name}", set()).add(operand)
+        out.append((None, op, operand))
+
+    consts = sum(1 for _, op, operand in body if op == "const" and operand not in NAMED_LITERALS)
+    if consts:
+        current().constants[cfg.cls] = constants(cfg.cls) + consts
+    return out
+
+def inline(cfg: CFG) -> None:
+    generated = current().method_code
+    for b in cfg.blocks:
+        out = []
+        for instr in b.instrs:
+            _, op, operand = instr
+            # a constructor is only ever called right after its new
+            if op != "call" or operand not in generated or operand.endswith(":$constructor"):
+                out.append(instr)
+                continue
+            reason = why_not(cfg, operand)
+            if reason is not None:
+                cfg.remarks.append(f"did not inline {operand}: {reason}")
+                out.append(instr)
+                continue
+            code = expand(cfg, operand)
+            cfg.remarks.append(f"inlined {operand} ({len(code)} instructions)")
+            out.extend(code)
+        b.instrs = out
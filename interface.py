@@ -0,0 +1,100 @@
+"""
+Class interfaces, for separate compilation.
+
+Compiling a program into an obj dir (--obj-dir) writes an interface for each of its
+classes (the statement class aside) there, Name.qki: what another program needs to check
+code that uses the class, and nothing it would need to generate it -
+
+    {"name": "Pt", "super": "Obj", "params": [["x", "Int"], ["y", "Int"]],
+     "fields": {"x": "Int", "y": "Int"},
+     "methods": [{"name": "_get_x", "params": [], "returns": "Int"}, ...],
+     "final": ["_get_x"]}
+
+JSON, like the object code in OBJ/*.json and vm/builtins.json. The methods are the ones
+the class defines, in order, so their vtable slots come out as they did (see
+Class.get_method_table); inherited ones come from the parent's interface, or the builtins.
+final lists the methods -O2 may have inlined or called directly, taking them to be
+overridden by no class under this one (cha.assumed_final); a class of a later program
+that overrides one of them is an error, not a call that silently goes to the old method.
+
+current().classes is a Classes: a class the program doesn't define is looked up as an
+interface in the obj dir the first time the checker asks for it, and becomes a Class with no code
+(import_class in AST.py). Only the program's own classes are generated; the code of an
+imported class is its object code, which the assembler imports from the obj dir as it
+does any other class's. Without an obj dir nothing is written or imported: .asm files
+are assembled one by one, into wherever the assembler is told, so a directory of them is
+no library to compile against.
+"""
+import os
+import json
+import hashlib
+import re
+from AST import Class, import_class
+from cache import atomic_write
+
+SUFFIX = ".qki"
+
+def path(directory: str, name: str) -> str:
+    return os.path.join(directory, f"{name}{SUFFIX}")
+
+class Classes(dict):
+    """
+    User classes by name (name : Class), the ones in interfaces in directory included.
+    """
+    def __init__(self, directory: str = None):
+        super().__init__()
+        self.directory = directory
+        # names with no interface (builtins, locals, typos), looked for once each
+        self.missing: set[str] = set()
+
+    def __missing__(self, name: str) -> Class:
+        if not self.load(name):
+            raise KeyError(name)
+        return self[name]
+
+    def __contains__(self, name: str) -> bool:
+        return super().__contains__(name) or self.load(name)
+
+    def load(self, name: str) -> bool:
+        """
+        Import a class from its interface, if there is one.
+        """
+        if name in self.missing:
+            return False
+        if self.directory is None or not name.isidentifier() or not os.path.exists(path(self.directory, name)):
+            self.missing.add(name)
+            return False
+        with open(path(self.directory, name), "r") as f:
+            record = json.load(f)
+        if record["name"] != name:
+            raise ValueError(f"{path(self.directory, name)} is the interface of {record['name']}, not {name}")
+        # registers itself
+        import_class(record)
+        return True
+
+def write(classes: dict, directory: str) -> dict[str, str]:
+    """
+    Write the interface of every class that has one ({name: ClassEmitter}) to directory.
+    Returns {path: text} of the files written.
+    """
+    files = {}
+    for cls in classes.values():
+        if cls.interface is not None:
+            target = path(directory, cls.name)
+            files[target] = json.dumps(cls.interface, indent=4) + "\n"
+            atomic_write(target, files[target])
+    return files
+
+def fingerprint(directory: str, source: str) -> str:
+    """
+    Hash of the interfaces in directory a program could import (all but those of the classes
+    it defines), so the compile cache misses once one of them changes.
+    """
+    own = set(re.findall(r"\bclass\s+(\w+)", source))
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if name.endswith(SUFFIX) and name[:-len(SUFFIX)] not in own:
+            with open(os.path.join(directory, name), "rb") as f:
+                h.update(name.encode())
+                h.update(f.read())
+    return h.hexdigest()
@@ -0,0 +1,366 @@
+"""
+Control-flow graph IR.
+
+Code generation (ASTNode.evaluate) emits every method as a flat list of tiny_vm stack
+instructions (emit.MethodEmitter). Before a method is written out it becomes a CFG, the
+passes run over that, and it is lowered back to the instruction list:
+
+    passes = PassManager([("unreachable", remove_unreachable), ("slots", slots.allocate)])
+    passes.run(class_name, method)        CFG.build, each pass, CFG.lower
+
+A block is a run of instructions entered only at its start (a label, or the instruction
+after a jump, return or tail call) and left only at its end. Blocks are kept in layout
+order, and one that does not end in one of those falls through to the next. A block's
+instructions are the emitter's own (label, op, operand) records, with no label; a pass
+replaces a record rather than changing it. cfg.effect() gives the number of values an instruction pops off
+the operand stack and pushes onto it, so a pass can follow the stack (and the temporaries
+in it) without knowing what each op does. Loads and stores name the frame slot they use,
+a local, an argument or $, until slots.allocate turns the names into frame offsets.
+
+Passes are functions of a CFG; a pass that changes the jumps calls cfg.link() to
+recompute the edges, one that needs a local to keep a value in gets a new one from
+cfg.temp(), and what a pass did goes in cfg.remarks (--opt-report). Dominators are
+computed on demand (cfg.dominators()). The
+PassManager times every pass across all the methods it runs on, and can print the IR of
+each method after the passes (--dump-ir).
+"""
+import time
+
+import tracing
+from emit import MethodEmitter
+from context import current
+from AST import method_table
+
+# (pops, pushes) of every op whose stack effect does not depend on its operand
+STACK_EFFECTS = {
+    "const": (0, 1), "load": (0, 1), "store": (1, 0), "new": (0, 1), "pop": (1, 0),
+    "load_field": (1, 1), "store_field": (2, 0), "is_instance": (1, 1), "roll": (0, 0),
+    "jump": (0, 0), "jump_if": (1, 0), "jump_ifnot": (1, 0), "return": (1, 0),
+    "unbox": (1, 0), "box": (0, 1), "incr": (0, 0), "below": (1, 1),
+}
+
+JUMPS = ("jump", "jump_if", "jump_ifnot")
+CALLS = ("call", "call_direct")
+ENDS_BLOCK = frozenset(JUMPS + ("return", "tail_call"))
+
+# the vm's tail_call operand holds each argument count in 4 bits (TAIL_ARITY_BITS in vm/assemble.py)
+TAIL_MAX_ARGS = 15
+
+def call_arity(cls: str, operand: str) -> int:
+    """
+    Number of arguments of the method a call goes to (not counting the receiver).
+    """
+    name, method = operand.split(":")
+    if name == "$":
+        name = cls
+    if method == "$constructor":
+        return len(current().classes[name].get_params())
+    return len(method_table(name)[method].params)
+
+class Block():
+    __slots__ = ("name", "label", "instrs", "succ", "pred", "idom")
+
+    def __init__(self, name: str, label: str | None):
+        # name identifies the block in dumps, label is the asm label jumps use (if any)
+        self.name = name
+        self.label = label
+        self.instrs: list[tuple] = []
+        self.succ: list[Block] = []
+        self.pred: list[Block] = []
+        # immediate dominator, set by CFG.dominators() (None for the entry and unreachable blocks)
+        self.idom: Block = None
+
+    def terminator(self) -> tuple | None:
+        if self.instrs and self.instrs[-1][1] in ENDS_BLOCK:
+            return self.instrs[-1]
+        return None
+
+    def __str__(self):
+        return self.name if self.label is None else f"{self.name} ({self.label})"
+
+class CFG():
+    def __init__(self, cls: str, name: str, args: list[str], locals: list[str]):
+        self.cls = cls
+        self.name = name
+        self.args = args
+        self.locals = locals
+        self.blocks: list[Block] = []
+        # frame offsets of the locals, set by slots.allocate
+        self.slots: dict[str, int] = None
+        self.frame = 0
+        # stack effect of each call operand, looked up once per method
+        self.calls: dict[str, tuple[int, int]] = {}
+        # what the passes did, for --opt-report
+        self.remarks: list[str] = []
+        self.temps = 0
+
+    @staticmethod
+    def build(cls: str, method: MethodEmitter) -> "CFG":
+        """
+        The CFG of a generated method of class cls.
+        """
+        cfg = CFG(cls, method.name, method.args, method.locals)
+        block = None
+        for record in method.code:
+            label, op, _ = record
+            if op is None:
+                if block is not None and not block.instrs and block.label is None:
+                    block.label = label
+                else:
+                    block = cfg.new_block(label)
+                continue
+            if block is None:
+                block = cfg.new_block(None)
+            block.instrs.append(record)
+            if op in ENDS_BLOCK:
+                # whatever follows starts a new block
+                block = None
+        cfg.link()
+        return cfg
+
+    def effect(self, instr: tuple) -> tuple[int, int]:
+        """
+        (values popped, values pushed) of an instruction.
+        """
+        _, op, operand = instr
+        if op == "tail_call":
+            # the operand carries the number of arguments (see tail_calls)
+            return int(operand.split(":")[2]) + 1, 0
+        if op not in CALLS:
+            return STACK_EFFECTS.get(op, (0, 0))
+        effect = self.calls.get(operand)
+        if effect is None:
+            effect = self.calls[operand] = (call_arity(self.cls, operand) + 1, 1)
+        return effect
+
+    def temp(self) -> str:
+        """
+        A new local for a pass to keep a value in.
+        """
+        if self.temps == 0:
+            # the method's own list belongs to the tree
+            self.locals = list(self.locals)
+        name = f"$t{self.temps}"
+        self.temps += 1
+        self.locals.append(name)
+        return name
+
+    def new_block(self, label: str | None) -> Block:
+        block = Block(f"B{len(self.blocks)}", label)
+        self.blocks.append(block)
+        return block
+
+    def entry(self) -> Block:
+        return self.blocks[0]
+
+    def link(self) -> None:
+        """
+        (Re)compute every block's successors and predecessors from its last instruction.
+        """
+        by_label = {b.label: b for b in self.blocks if b.label is not None}
+        for b in self.blocks:
+            b.succ, b.pred = [], []
+        for i, b in enumerate(self.blocks):
+            last = b.terminator()
+            succ = []
+            if last is not None and last[1] in JUMPS:
+                succ.append(by_label[last[2]])
+            if (last is None or last[1] in ("jump_if", "jump_ifnot")) and i + 1 < len(self.blocks):
+                succ.append(self.blocks[i + 1])
+            # a conditional jump to the next block has one successor
+            b.succ = list(dict.fromkeys(succ))
+            for s in b.succ:
+                s.pred.append(b)
+
+    def reverse_postorder(self) -> list[Block]:
+        """
+        The blocks reachable from the entry, each before its successors (back edges aside).
+        """
+        order, seen = [], {self.entry()}
+        stack = [(self.entry(), iter(self.entry().succ))]
+        while stack:
+            block, succ = stack[-1]
+            nxt = next((s for s in succ if s not in seen), None)
+            if nxt is None:
+                order.append(block)
+                stack.pop()
+            else:
+                seen.add(nxt)
+                stack.append((nxt, iter(nxt.succ)))
+        order.reverse()
+        return order
+
+    def dominators(self) -> None:
+        """
+        Set the immediate dominator of every block (Cooper, Harvey & Kennedy's iterative
+        algorithm over reverse postorder).
+        """
+        order = self.reverse_postorder()
+        index = {b: i for i, b in enumerate(order)}
+        entry = order[0]
+        for b in self.blocks:
+            b.idom = None
+        entry.idom = entry
+
+        def intersect(a: Block, b: Block) -> Block:
+            while a is not b:
+                while index[a] > index[b]:
+                    a = a.idom
+                while index[b] > index[a]:
+                    b = b.idom
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for b in order[1:]:
+                preds = [p for p in b.pred if p.idom is not None]
+                idom = preds[0]
+                for p in preds[1:]:
+                    idom = intersect(p, idom)
+                if b.idom is not idom:
+                    b.idom = idom
+                    changed = True
+        entry.idom = None
+
+    def dominates(self, a: Block, b: Block) -> bool:
+        """
+        Whether every path from the entry to b goes through a (after dominators()).
+        """
+        while b is not None:
+            if b is a:
+                return True
+            b = b.idom
+        return False
+
+    def lower(self, method: MethodEmitter) -> None:
+        """
+        Write the blocks back to method's instruction list, in layout order.
+        """
+        code = []
+        for b in self.blocks:
+            if b.label is not None:
+                code.append((b.label, None, None))
+            code.extend(b.instrs)
+        method.code = code
+        method.slots = self.slots
+        method.frame = self.frame
+
+    def dump(self) -> str:
+        self.dominators()
+        lines = [f"{self.cls}:{self.name}({', '.join(self.args)})"]
+        if self.locals:
+            lines.append(f"  locals {', '.join(self.locals)}")
+        if self.slots:
+            lines.append(f"  frame {self.frame}: " + ", ".join(f"{l}={s}" for l, s in self.slots.items()))
+        for b in self.blocks:
+            preds = ", ".join(p.name for p in b.pred) or "-"
+            idom = b.idom.name if b.idom is not None else "-"
+            lines.append(f"  {b}:    preds {preds}    idom {idom}")
+            for instr in b.instrs:
+                pops, pushes = self.effect(instr)
+                lines.append(f"      {text(instr):<32} -{pops} +{pushes}")
+            if b.succ:
+                lines.append(f"    -> {', '.join(s.name for s in b.succ)}")
+        return "\n".join(lines)
+
+def text(*instrs: tuple) -> str:
+    return "; ".join(op if operand is None else f"{op} {operand}" for _, op, operand in instrs)
+
+def remove_unreachable(cfg: CFG) -> None:
+    """
+    Drop the blocks no path from the entry reaches (code after a return, jumps past the
+    end of an if that every branch returns from).
+    """
+    reachable = set(cfg.reverse_postorder())
+    # a block that falls through into another is reachable if that one is, so the layout holds
+    cfg.blocks = [b for b in cfg.blocks if b in reachable]
+    cfg.link()
+
+def thread_jumps(cfg: CFG) -> None:
+    """
+    Send jumps to a block that only jumps on straight to its target, and drop jumps to the
+    block that follows anyway.
+    """
+    by_label = {b.label: b for b in cfg.blocks if b.label is not None}
+    for b in cfg.blocks:
+        last = b.terminator()
+        if last is None or last[1] not in JUMPS:
+            continue
+        seen = {b}
+        target = by_label[last[2]]
+        while len(target.instrs) == 1 and target.instrs[0][1] == "jump" and target not in seen:
+            seen.add(target)
+            target = by_label[target.instrs[0][2]]
+        b.instrs[-1] = (None, last[1], target.label)
+
+    for b, nxt in zip(cfg.blocks, cfg.blocks[1:]):
+        last = b.terminator()
+        if last is not None and last[1] == "jump" and last[2] == nxt.label:
+            b.instrs.pop()
+    cfg.link()
+
+def tail_calls(cfg: CFG) -> None:
+    """
+    Turn a call whose result is returned at once into a tail call, which reuses the
+    method's frame instead of stacking another on it: `call D:m; return n` becomes
+    `tail_call D:m:k`, k the number of arguments the call passes (the vm moves them and the
+    receiver down over the method's own before it jumps). The operand holds both argument
+    counts, so a method with more than TAIL_MAX_ARGS, or a call to one, is left alone.
+    """
+    for b in cfg.blocks:
+        if len(b.instrs) < 2 or b.instrs[-1][1] != "return" or b.instrs[-2][1] != "call":
+            continue
+        operand = b.instrs[-2][2]
+        arity = call_arity(cfg.cls, operand)
+        if max(arity, len(cfg.args)) > TAIL_MAX_ARGS:
+            cfg.remarks.append(f"no tail call to {operand}: more than {TAIL_MAX_ARGS} arguments")
+            continue
+        b.instrs[-2:] = [(None, "tail_call", f"{operand}:{arity}")]
+        cfg.remarks.append(f"tail call to {operand}")
+
+class PassManager():
+    """
+    Runs a list of (name, pass) over the CFG of every method it is given, and keeps the
+    time each pass took in total (building and lowering the CFG included).
+    """
+    def __init__(self, passes: list[tuple[str, callable]], dump=None, remarks=None):
+        self.passes = passes
+        # file to print each method's IR to, after the passes
+        self.dump = dump
+        # file to print what the passes did to (--opt-report)
+        self.remarks = remarks
+        self.times = {name: 0.0 for name in ["build"] + [n for n, _ in passes] + ["lower"]}
+        self.methods = 0
+
+    def run(self, cls: str, method: MethodEmitter) -> None:
+        start = time.perf_counter()
+        cfg = CFG.build(cls, method)
+        self.times["build"] += time.perf_counter() - start
+
+        for name, run in self.passes:
+            start = time.perf_counter()
+            run(cfg)
+            elapsed = time.perf_counter() - start
+            self.times[name] += elapsed
+            tracing.ir.debug("%s:%s %s %.3fms", cls, method.name, name, elapsed * 1000)
+
+        start = time.perf_counter()
+        cfg.lower(method)
+        self.times["lower"] += time.perf_counter() - start
+        self.methods += 1
+
+        if self.remarks is not None:
+            for remark in cfg.remarks:
+                print(f"{cls}:{method.name}: {remark}", file=self.remarks)
+        if self.dump is not None:
+            print(cfg.dump() + "\n", file=self.dump)
+
+    def report(self) -> str:
+        total = sum(self.times.values())
+        lines = [f"{'pass':<14} {'total':>10} {'per method':>12} {'share':>7}"]
+        for name, t in self.times.items():
+            lines.append(f"{name:<14} {t * 1000:>8.2f}ms {t * 1e6 / max(self.methods, 1):>10.1f}us "
+                         f"{t / total if total else 0:>7.1%}")
+        lines.append(f"{self.methods} methods, {total * 1000:.2f}ms")
+        return "\n".join(lines)
@@ -0,0 +1,99 @@
+"""
+Lexer for Quack.
+
+The whole program is split into tokens up front with a single compiled
+pattern that is matched *at a position* (never on a slice of the rest of
+the program), so scanning is linear in the size of the source.
+ParseTree then works on the token list instead of the raw text.
+"""
+import re
+import sys
+
+# token kinds
+IDENT, KEYWORD, INT, STRING, OP, EOF = range(6)
+token_kinds = {IDENT: "Ident", KEYWORD: "Keyword", INT: "Int", STRING: "String", OP: "Op", EOF: "EOF"}
+
+# reserved words - these can never be used as identifiers
+KEYWORDS = frozenset(["class", "if", "while", "and", "typecase", "def", "elif", "return", "or", "not",
+                      "extends", "else", "none", "true", "false", "for", "in"])
+
+# builtin class names are lexed as identifiers (they are valid class names),
+# but they are not allowed as variable names
+TYPE_NAMES = frozenset(["String", "Int", "Obj", "Boolean", "Nothing"])
+
+TOKEN_PAT = re.compile(r"""
+    (?P<space>      \s+ )
+  | (?P<comment>    //[^\n]* | /\*(?s:.*?)\*/ )
+  | (?P<longstring> \"\"\"(?s:.*?)\"\"\" )
+  | (?P<string>     "[^"]*" )
+  | (?P<int>        0|[1-9]\d* )
+  | (?P<name>       [a-zA-Z_]\w* )
+  | (?P<op>         <=|>=|==|\.\.|[-+*/<>=.,:;(){}] )
+""", re.VERBOSE)
+
+
+class Token():
+    """
+    A single token: its kind, the matched text, the [start, end) span in the
+    program string and the (1-based) line and column where it starts.
+    """
+    def __init__(self, kind: int, text: str, start: int, end: int, line: int, col: int):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+        self.line = line
+        self.col = col
+
+    def __str__(self):
+        return f"{token_kinds[self.kind]} '{self.text}' at {self.line}:{self.col}"
+
+
+def tokenize(program: str) -> list[Token]:
+    """
+    Split a program into a list of tokens, always terminated by an EOF token.
+    Whitespace and comments are dropped.
+    """
+    tokens = []
+    pos = 0
+    end = len(program)
+    line = 1
+    line_start = 0
+    match = TOKEN_PAT.match
+
+    while pos < end:
+        m = match(program, pos)
+        if m is None:
+            if program.startswith("/*", pos):
+                raise SyntaxError(f"Unterminated comment at {line}:{pos - line_start + 1}")
+            raise SyntaxError(f"Unexpected character '{program[pos]}' at {line}:{pos - line_start + 1}")
+
+        group = m.lastgroup
+        text = m.group()
+        if group == "name":
+            kind = KEYWORD if text in KEYWORDS else IDENT
+            # names end up in the AST; interned, every occurrence of `x` is the same string
+            text = sys.intern(text)
+        elif group == "op":
+            kind = OP
+        elif group == "int":
+            kind = INT
+        elif group == "string" or group == "longstring":
+            kind = STRING
+        else:
+            kind = None
+
+        if kind is not None:
+            tokens.append(Token(kind, text, pos, m.end(), line, pos - line_start + 1))
+
+        # only whitespace, comments and strings can span lines
+        if kind is None or kind == STRING:
+            newlines = text.count("\n")
+            if newlines:
+                line += newlines
+                line_start = pos + text.rindex("\n") + 1
+
+        pos = m.end()
+
+    tokens.append(Token(EOF, "", end, end, line, end - line_start + 1))
+    return tokens
@@ -0,0 +1,141 @@
+"""
+Loop-invariant code motion.
+
+An IR pass (see ir.py) that computes what a loop computes the same way on every
+iteration once, before the loop. Loops are found from their back edges: an edge to a
+block that dominates the block it leaves, the loop's header (for a while loop, the block
+testing the condition). A value computed in a loop is invariant when it is
+
+    a const
+    a load of a local the loop never stores to
+    a field load from an invariant object, of a field the loop never stores to, in a
+    loop that calls no user method (see cse.builtin_calls)
+    a pure builtin call (see cse.pure_calls) or an is_instance on invariant values
+
+Every largest invariant value that takes more than one instruction is computed at the end
+of the block the loop is entered from (its preheader) into a new local, which the loop
+loads instead; the same value in several places shares one local. The loop may not run
+at all, so nothing that can stop the vm (FAULTS) is moved, and a loop entered from more
+than one block is left alone. Inner loops go first, so what leaves an inner loop can then
+leave the one around it too.
+"""
+from ir import CFG, Block, text
+from cse import builtin_calls, pure_calls
+
+# builtin calls that abort the vm on some arguments (division by zero)
+FAULTS = frozenset({"Int:divide"})
+
+def loops(cfg: CFG) -> list[tuple[Block, list[Block]]]:
+    """
+    (header, blocks) of every loop, inner loops first, the blocks in layout order.
+    """
+    cfg.dominators()
+    bodies: dict[Block, set[Block]] = {}
+    for b in cfg.blocks:
+        for header in b.succ:
+            if not cfg.dominates(header, b):
+                continue
+            body = bodies.setdefault(header, {header})
+            work = [b]
+            while work:
+                x = work.pop()
+                if x not in body and cfg.dominates(header, x):
+                    body.add(x)
+                    work.extend(x.pred)
+    return [(h, [b for b in cfg.blocks if b in body]) for h, body in sorted(bodies.items(), key=lambda l: len(l[1]))]
+
+def preheader(header: Block, body: list[Block]) -> Block | None:
+    """
+    The block the loop is entered from, if there is only one and it goes nowhere else.
+    """
+    outside = [p for p in header.pred if p not in body]
+    if len(outside) != 1 or outside[0].succ != [header]:
+        return None
+    return outside[0]
+
+def invariant_spans(cfg: CFG, block: Block, stored: set[str], fields: set[str] | None,
+                    pure: set[str]) -> list[tuple[int, int]]:
+    """
+    The (start, end) instructions of the largest invariant values computed in a block of a
+    loop that stores to the locals in stored and to the fields in fields (None: to any field).
+    """
+    spans = []
+    # (invariant, start, end) of each value on the stack
+    stack = []
+    for k, instr in enumerate(block.instrs):
+        _, op, operand = instr
+        pops, pushes = cfg.effect(instr)
+        # values left on the stack by the blocks before this one are unknown
+        args = [stack.pop() if stack else (False, None, None) for _ in range(pops)][::-1]
+
+        if op == "roll":
+            stack = [(False, None, None) for _ in stack]
+        if not pushes:
+            continue
+        if op == "const":
+            invariant = True
+        elif op == "load":
+            invariant = operand not in stored
+        elif op == "load_field":
+            invariant = fields is not None and operand.split(":")[1] not in fields
+        else:
+            invariant = (op == "call" and operand in pure and operand not in FAULTS) or op == "is_instance"
+
+        # and computed from invariant values, right before it, one after the other
+        start = k
+        for inv, s, e in reversed(args):
+            if not (invariant and inv and e == start - 1):
+                invariant = False
+                break
+            start = s
+        if not invariant:
+            stack.append((False, None, None))
+            continue
+        stack.append((True, start, k))
+        if k > start:
+            # this value contains the ones recorded since start
+            while spans and spans[-1][0] >= start:
+                spans.pop()
+            spans.append((start, k))
+    return spans
+
+def hoist(cfg: CFG) -> None:
+    builtin, pure = builtin_calls(), pure_calls()
+    for header, body in loops(cfg):
+        pre = preheader(header, body)
+        if pre is None:
+            continue
+        stored, fields = set(), set()
+        for b in body:
+            for _, op, operand in b.instrs:
+                if op == "store":
+                    stored.add(operand)
+                elif op == "store_field" and fields is not None:
+                    fields.add(operand.split(":")[1])
+                elif op == "call" and operand not in builtin:
+                    fields = None
+
+        temps: dict[tuple, str] = {}
+        code = []
+        for b in body:
+            spans = invariant_spans(cfg, b, stored, fields, pure)
+            if not spans:
+                continue
+            out, k = [], 0
+            for s, e in spans:
+                out.extend(b.instrs[k:s])
+                value = tuple(b.instrs[s:e + 1])
+                if value not in temps:
+                    temps[value] = cfg.temp()
+                    code.extend(value)
+                    code.append((None, "store", temps[value]))
+                    cfg.remarks.append(f"hoisted `{text(*value)}` out of the loop at {header} ({temps[value]})")
+                out.append((None, "load", temps[value]))
+                k = e + 1
+            out.extend(b.instrs[k:])
+            b.instrs = out
+
+        if code:
+            # before the jump into the loop (the code leaves the stack as it was)
+            at = len(pre.instrs) - (pre.terminator() is not None)
+            pre.instrs[at:at] = code
@@ -0,0 +1,262 @@
+"""
+AST optimizations.
+
+Runs on the checked tree, after the type pass and before code generation, at the level
+given with -O:
+
+    -O0   nothing (the default)
+    -O1   folds Int, Bool and String operations on literals, compiles negative literals to
+          one const, drops statements after a return, the branches of if/elif/else and
+          while whose condition is constant, for loops over an empty range of literals,
+          and the typecase cases the static type of the variable tested decides (see
+          cha.py)
+    -O2   also drops + 0, - 0, * 1 and / 1 from Int expressions (and 0 + x, 1 * x)
+
+    for c in classes:
+        optimize(c, 2)
+
+Folding computes what the vm would: Ints are 32-bit C ints and division truncates toward
+zero. A division by zero, or a result that does not fit, is left for the vm to compute.
+The tree is rewritten in place; expression nodes and statements are replaced by the
+literal or the statements they reduce to. Negative literals are handled by Int.evaluate,
+which checks the level itself.
+"""
+import cha
+import registry
+from context import current
+from AST import (ASTNode, Obj, Int, String, Bool, Block, Expression, BoolComp, IntComp, Not, Assign, Return,
+                 IfNode, ElifNode, ElseNode, Conditional, While, For, Typecase, Call, UserClassInstance, Class)
+
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+def optimize(cls: Class, level: int) -> None:
+    """
+    Optimize the constructor and methods of a checked class.
+    """
+    if level < 1:
+        return
+    body = cls.class_body
+    block(body.statements, level)
+    for m in body.methods:
+        block(m.block, level)
+
+def literal(value: bool) -> Bool:
+    return Bool("true" if value else "false")
+
+def int_op(op: str, a: int, b: int) -> int | None:
+    """
+    a op b as the vm computes it, or None when it has to be left to the vm.
+    """
+    if op == "plus":
+        value = a + b
+    elif op == "minus":
+        value = a - b
+    elif op == "multiply":
+        value = a * b
+    elif b == 0:
+        return None
+    else:
+        # C division truncates, Python's floors
+        value = abs(a) // abs(b)
+        if (a < 0) != (b < 0):
+            value = -value
+    if not INT_MIN <= value <= INT_MAX:
+        return None
+    return value
+
+def fold_expression(node: Expression, level: int) -> Obj | Expression:
+    if node.type != "Int":
+        return node
+    terms, tokens = node.terms, node.tokens
+    # the chain is evaluated left to right: the constants it starts with fold into one
+    if isinstance(terms[0], Int):
+        value, n = terms[0].val, 1
+        while n < len(terms) and isinstance(terms[n], Int):
+            folded = int_op(Expression.ops[tokens[n - 1]], value, terms[n].val)
+            if folded is None:
+                break
+            value, n = folded, n + 1
+        if n > 1:
+            terms, tokens = [Int(value)] + terms[n:], tokens[n - 1:]
+    if level >= 2:
+        # x + 0, x * 1 and the like: what came before the constant
+        kept = [(None, terms[0])]
+        kept.extend((token, term) for token, term in zip(tokens, terms[1:])
+                    if not (isinstance(term, Int) and (term.val, token) in ((0, "+"), (0, "-"), (1, "*"), (1, "/"))))
+        # 0 + x, 1 * x: x
+        if len(kept) > 1 and isinstance(kept[0][1], Int) and (kept[0][1].val, kept[1][0]) in ((0, "+"), (1, "*")):
+            kept = [(None, kept[1][1])] + kept[2:]
+        terms, tokens = [term for _, term in kept], [token for token, _ in kept[1:]]
+    if len(terms) == 1:
+        return terms[0]
+    node.terms, node.tokens = terms, tokens
+    return node
+
+def fold_comparison(node: IntComp) -> Bool | IntComp:
+    left, right = node.left, node.right
+    if isinstance(left, Int) and isinstance(right, Int):
+        a, b = left.val, right.val
+        return literal({"<": a < b, ">": a > b, "==": a == b, "<=": a <= b, ">=": a >= b}[node.op])
+    if node.op != "==":
+        return node
+    if isinstance(left, Bool) and isinstance(right, Bool):
+        return literal(left.true_false == right.true_false)
+    # escapes may spell the same string differently, leave those to the vm
+    if isinstance(left, String) and isinstance(right, String) and "\\" not in left.val + right.val:
+        return literal(left.val == right.val)
+    return node
+
+def fold_bool(node: BoolComp, level: int) -> Obj | ASTNode:
+    # true or x, false and x: x is never evaluated
+    decided = node.op == "or"
+    last = len(node.terms) - 1
+    terms = []
+    for i, term in enumerate(node.terms):
+        if isinstance(term, Bool):
+            if term.true_false == decided:
+                terms.append(term)
+                break
+            # false or x, true and x: x; x and true, x or false at -O2 only
+            if i < last or (level >= 2 and terms):
+                continue
+        terms.append(term)
+    if len(terms) == 1:
+        return terms[0]
+    node.terms = terms
+    return node
+
+def expression(node, level: int):
+    """
+    The node to evaluate in place of node.
+    """
+    if isinstance(node, Expression):
+        node.terms = [expression(term, level) for term in node.terms]
+        return fold_expression(node, level)
+    if isinstance(node, IntComp):
+        node.left = expression(node.left, level)
+        node.right = expression(node.right, level)
+        return fold_comparison(node)
+    if isinstance(node, BoolComp):
+        node.terms = [expression(term, level) for term in node.terms]
+        return fold_bool(node, level)
+    if isinstance(node, Not):
+        node.expr = expression(node.expr, level)
+        if isinstance(node.expr, Bool):
+            return literal(not node.expr.true_false)
+    elif isinstance(node, Call):
+        node.var = expression(node.var, level)
+        node.args = [expression(a, level) for a in node.args]
+    elif isinstance(node, UserClassInstance):
+        node.args = [expression(a, level) for a in node.args]
+    return node
+
+def terminates(statement) -> bool:
+    """
+    Whether control never falls through statement: a return, or an if/elif/else whose
+    branches all end in one.
+    """
+    if isinstance(statement, Return):
+        return True
+    if isinstance(statement, Conditional) and statement.elsenode is not None:
+        branches = [statement.ifnode, *statement.elifnode, statement.elsenode]
+        return all(b.statement.statements and terminates(b.statement.statements[-1]) for b in branches)
+    return False
+
+def block(b: Block, level: int) -> None:
+    statements = []
+    for s in b.statements:
+        for t in statement(s, level):
+            statements.append(t)
+            if terminates(t):
+                # the rest of the block is unreachable
+                b.statements = statements
+                return
+    b.statements = statements
+
+def statement(s, level: int) -> list:
+    """
+    The statements to generate in place of s.
+    """
+    if isinstance(s, Assign):
+        s.val = expression(s.val, level)
+    elif isinstance(s, Return):
+        if s.ret is not None:
+            s.ret = expression(s.ret, level)
+    elif isinstance(s, Conditional):
+        return conditional(s, level)
+    elif isinstance(s, While):
+        return loop(s, level)
+    elif isinstance(s, For):
+        return counted(s, level)
+    elif isinstance(s, Typecase):
+        return typecase(s, level)
+    else:
+        s = expression(s, level)
+    return [s]
+
+def conditional(s: Conditional, level: int) -> list:
+    arms = []
+    otherwise = s.elsenode.statement if s.elsenode is not None else None
+    for arm in [s.ifnode, *s.elifnode]:
+        cond = expression(arm.cond, level)
+        if isinstance(cond, Bool):
+            if not cond.true_false:
+                continue
+            # always taken: it is the else branch, and nothing after it is reached
+            otherwise = arm.statement
+            break
+        block(arm.statement, level)
+        arms.append((cond, arm.statement))
+
+    if otherwise is not None:
+        block(otherwise, level)
+    if not arms:
+        return otherwise.statements if otherwise is not None else []
+
+    s.ifnode = IfNode(*arms[0])
+    s.elifnode = [ElifNode(cond, body) for cond, body in arms[1:]]
+    s.elsenode = ElseNode(otherwise) if otherwise is not None else None
+    return [s]
+
+def loop(s: While, level: int) -> list:
+    s.cond = expression(s.cond, level)
+    if isinstance(s.cond, Bool) and not s.cond.true_false:
+        return []
+    block(s.statement, level)
+    return [s]
+
+def counted(s: For, level: int) -> list:
+    s.low = expression(s.low, level)
+    s.high = expression(s.high, level)
+    if isinstance(s.low, Int) and isinstance(s.high, Int) and s.low.val >= s.high.val:
+        return []
+    block(s.statement, level)
+    return [s]
+
+def typecase(s: Typecase, level: int) -> list:
+    """
+    Drop the cases the static type of the tested variable decides: a case for a class it is
+    under always matches (so nothing after it is tried), one for a class neither above nor
+    under it never does. A typecase left with one case that always matches is its block.
+    A variable also assigned other types, or a parameter, has no static type to go by (see
+    ASTNode.settle_types).
+    """
+    for case in s.cases:
+        block(case.statements, level)
+    known = lambda name: name in registry.CLASSES or name in current().classes
+    if s.test_type is None or s.retyped or not all(known(name) for name in [s.test_type] + [c.type for c in s.cases]):
+        return [s]
+
+    cases = []
+    for case in s.cases:
+        if cha.is_subclass(s.test_type, case.type):
+            if not cases:
+                return case.statements.statements
+            cases.append(case)
+            break
+        if cha.is_subclass(case.type, s.test_type):
+            cases.append(case)
+    if not cases:
+        return []
+    s.cases = cases
+    return [s]
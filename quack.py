@@ -1,182 +1,164 @@
 import sys
-import re
 import os
+import argparse
+import tracing
+import slots
+import optimize
+import cse
+import licm
+import inline
+import cha
+from ir import PassManager, remove_unreachable, thread_jumps, tail_calls
 from AST import *
-# import logging as log
+from cache import CompileCache, atomic_write, DEFAULT_DIR, DEFAULT_MAX_BYTES
+import interface
+from context import CompilationContext, current
+from backend import assemble_emitters, library
+from lexer import tokenize, Token, IDENT, KEYWORD, INT, STRING, OP, EOF, TYPE_NAMES
 # import warnings
 
-# log.basicConfig(level=log.DEBUG)
-
 class ParseTree():
     NORMAL, EOF, CLASS, RETURN = range(4)
-    statements = []
-    classes = []
+
+    # binary operators: token -> (precedence, associativity, node)
+    # higher precedence binds tighter. and/or nest to the right, comparisons don't chain.
+    # a chain of and, or or arithmetic becomes one node (see BoolComp, Expression).
+    BINARY_OPS = {
+        "and": (1, "right", BoolComp),
+        "or": (1, "right", BoolComp),
+        "<=": (2, None, IntComp),
+        ">=": (2, None, IntComp),
+        "==": (2, None, IntComp),
+        "<": (2, None, IntComp),
+        ">": (2, None, IntComp),
+        "+": (3, "left", Expression),
+        "-": (3, "left", Expression),
+        "*": (4, "left", Expression),
+        "/": (4, "left", Expression),
+    }
 
     def __init__(self, program: str):
         """
         Initiates the ParseTree with a given program string
         """
         self.program = program
-        self.len = len(program)
-        # program counter
-        self.pc = 0
+        self.tokens = tokenize(program)
+        # index of the current token
+        self.pos = 0
+        self.tok = self.tokens[0]
 
         self.state = ParseTree.NORMAL
 
+        # top-level statements, and the names of the user classes in the order they were defined
+        self.statements = []
+        self.classes = []
+
     def __str__(self):
-        return f"position {self.pc}, '{self.program[self.pc]}'"
-    
+        return f"line {self.tok.line}, column {self.tok.col}, '{self.tok.text}'"
+
     def error(self, msg = ""):
-        raise Exception(msg)
-    
-    def check_space(self):
-        # If we run off the end of the program, return
-        if (self.pc >= self.len):
+        raise Exception(f"{msg} (line {self.tok.line}, column {self.tok.col})")
+
+    def at_eof(self) -> bool:
+        return self.tok.kind == EOF
+
+    def peek(self, k: int = 1) -> Token:
+        # look k tokens ahead of the current one without consuming anything
+        return self.tokens[min(self.pos + k, len(self.tokens) - 1)]
+
+    def check(self, text: str) -> bool:
+        # is the current token the operator or keyword `text`?
+        return self.tok.text == text and (self.tok.kind == OP or self.tok.kind == KEYWORD)
+
+    def eat(self, expect: str = None) -> Token:
+        # eats a token, optionally checking that it is the expected operator/keyword
+        tok = self.tok
+        if tok.kind == EOF:
             self.state = ParseTree.EOF
-            return
-        
-        # Otherwise, keeping checking if there's a space until none is found
-        token = self.program[self.pc]
-        while re.match(r"[\s\n]", token) is not None:
-            # log.debug("space!")
-            self.eat(r"\s", 1)
-            if (self.pc >= self.len):
-                self.state = ParseTree.EOF
-                return
-            token = self.program[self.pc]
-
-    def check_comment(self) -> None:
-        # log.debug("Checking comment")
-        # eat short-form comment
-        match = re.match(r"//.*\n", self.program[self.pc:])
-        if match is not None:
-            match = match.group()
-            self.eat(r"//.*\n", len(match))
-            return
-        
-        # eat long form comment
-        match = re.match(r"/\*", self.program[self.pc:])
-        if match is not None:
-            while re.match(r"\*/", self.program[self.pc:]) is None:
-                self.eat()
-            self.eat(r"\*/", num_to_jump=2)
-            return
-        
-    def eat(self, expect: str = r".", num_to_jump: int = 1) -> None:
-        # eats a token
-        # check if still in program
-        if self.pc < self.len:
-            match = re.match(expect, self.program[self.pc:])
-            if match is not None:
-                self.pc += num_to_jump
-                self.check_space()
-                self.check_comment()
-            else:
-                # log.info(f"Error at: {self.program[self.pc:]}")
-                self.error(f"Expected token {expect} not found in {self.program[self.pc:]}")
-        else:
+            if expect is not None:
+                self.error(f"Expected token {expect} but reached end of file")
+            return tok
+        if expect is not None and not self.check(expect):
+            # log.info(f"Error at: {tok}")
+            self.error(f"Expected token {expect} not found, got '{tok.text}'")
+
+        self.pos += 1
+        self.tok = self.tokens[self.pos]
+        if self.tok.kind == EOF:
             self.state = ParseTree.EOF
-        return
-    
-    def literal(self):
-        integer = r"(-?[1-9]\d*)|0"
-
-        # short strings accept character that they technically shouldn't - this was not high priority to fix. 
-        string = r"\"[^\"]*\""
-        longstring = f"\"\"\".*\"\"\""
-        boolean = r"true|false"
+        return tok
 
-        self.check_space()
+    def literal(self):
+        tok = self.tok
 
-        # check for left parentheses
-        if self.program[self.pc] == "(":
-            self.eat(r"\(")
-            node = self.R_Expr()
-            self.eat(r"\)")
-            log.debug(f"Parsed expression ({node})")
-            return node
+        # parenthesised expressions are handled by R_Expr, so they never get here
 
         # boolean
-        match = re.match(boolean, self.program[self.pc:]) 
-        if match is not None:
-            match = match.group()
-            self.eat(boolean, len(match))
-            return Bool(match)
-        
+        if self.check("true") or self.check("false"):
+            self.eat()
+            return Bool(tok.text)
+
         # check for variable name first. If found, return early
         node = self.ident()
 
         if node is not None:
             return node
-        
-        # long form string
-        match = re.match(longstring, self.program[self.pc:]) 
-        if match is not None:
-            match = match.group()
-            log.debug(f"Long string: {match}")
-            self.eat(num_to_jump=len(match))
-            return String(match)
-        
-        # short form string
-        match = re.match(string, self.program[self.pc:]) 
-        if match is not None:
-            match = match.group()
-            log.debug(f"Short string literal: {match}")
-            self.eat(num_to_jump=len(match))
-            return String(match)
-        
+
+        # long and short form strings
+        # short strings accept character that they technically shouldn't - this was not high priority to fix.
+        if tok.kind == STRING:
+            tracing.parser.debug("String literal: %s", tok.text)
+            self.eat()
+            return String(tok.text)
+
         # integer
-        match = re.match(integer, self.program[self.pc:]) 
-        if match is not None:
-            match = match.group()
-            self.eat(num_to_jump=len(match))
-            return Int(int(match))
-        
-        # The above are all disjoint, so order of checking doesn't matter. If none match, return unrecognized literal. 
-        # this return is likely the sign of a different error, either in the parser or in the program. 
-
-        log.debug(f"Unrecognized literal:{self.program[self.pc:self.pc+12]} - returning Nothing()")
+        if tok.kind == INT:
+            self.eat()
+            return Int(int(tok.text))
+
+        # negative integer - the sign has to be directly attached to the digits
+        nxt = self.peek()
+        if self.check("-") and nxt.kind == INT and nxt.start == tok.end and nxt.text != "0":
+            self.eat()
+            self.eat()
+            return Int(-int(nxt.text))
+
+        # The above are all disjoint, so order of checking doesn't matter. If none match, return unrecognized literal.
+        # this return is likely the sign of a different error, either in the parser or in the program.
+
+        tracing.parser.debug("Unrecognized literal: %s - returning Nothing()", tok)
         return Nothing()
-    
+
     def ident(self):
-        keywords = r"class|if|while|and|typecase|def|elif|return|or|not|extends|else|String|Int|Obj|Boolean|true|false|Nothing|none"
-        self.check_space()
-
-        # check that the ident is not a keyword - keyword followed by not an underscore or alphanumeric character.
-        match = re.match(keywords + r"[^\w^\_]", self.program[self.pc:])
-        if match is None:
-            # now check variable name - start with letter, then any letter, digit, or underscore
-            match = re.match(r"[a-zA-Z\_][\w\_]*", self.program[self.pc:])
-            if match is not None:
-                match = match.group()
-                self.eat(num_to_jump=len(match))
-                log.debug(f"Ident: {match}")
-
-                # An ident can be a variable, class, type, etc., so just return the string and decide what it is based on context. 
-                return match
-            return None
-        else:
-            self.error(f"Ident {match.group()} cannot be a keyword!")
+        tok = self.tok
+
+        # check that the ident is not a keyword (or builtin type name)
+        if tok.kind == KEYWORD or (tok.kind == IDENT and tok.text in TYPE_NAMES):
+            self.error(f"Ident {tok.text} cannot be a keyword!")
+
+        # variable name - start with letter, then any letter, digit, or underscore
+        if tok.kind == IDENT:
+            self.eat()
+            tracing.parser.debug("Ident: %s", tok.text)
+
+            # An ident can be a variable, class, type, etc., so just return the string and decide what it is based on context.
+            return tok.text
+        return None
 
     def class_ident(self):
-        keywords = r"class|if|while|and|typecase|def|elif|return|or|not|extends|else|none"
-        self.check_space()
-
-        # check that the ident is not a keyword - keyword followed by not an underscore or alphanumeric character.
-        match = re.match(keywords + r"[^\w^\_]", self.program[self.pc:])
-        if match is None:
-            # now check variable name - start with letter, then any letter, digit, or underscore
-            match = re.match(r"[a-zA-Z\_][\w\_]*", self.program[self.pc:])
-            if match is not None:
-                match = match.group()
-                self.eat(num_to_jump=len(match))
-                log.debug(f"Class Ident: {match}")
-
-                # An ident can be a variable, class, type, etc., so just return the string and decide what it is based on context. 
-                return match
-            return None
-        else:
-            self.error(f"Ident {match.group()} cannot be a keyword!")
+        tok = self.tok
+
+        # builtin type names are fine here, keywords are not
+        if tok.kind == KEYWORD:
+            self.error(f"Ident {tok.text} cannot be a keyword!")
+
+        if tok.kind == IDENT:
+            self.eat()
+            tracing.parser.debug("Class Ident: %s", tok.text)
+
+            # An ident can be a variable, class, type, etc., so just return the string and decide what it is based on context.
+            return tok.text
+        return None
 
     # Killing class_ident() because moving type checks to AST instead of ParseTree.
 
@@ -184,35 +166,35 @@ class ParseTree():
         args = []
 
         # check for starting paren
-        if re.match(r"\(", self.program[self.pc]) is not None:
-            self.eat(r"\(", 1)
+        if self.check("("):
+            self.eat("(")
         # check if method takes no args first
-        if self.program[self.pc] == ")":
-            self.eat(r"\)")
-            log.debug("No arguments - returning")
-            log.debug(f"Current position: {self.program[self.pc:]}")
+        if self.check(")"):
+            self.eat(")")
+            tracing.parser.debug("No arguments - returning")
+            tracing.parser.debug("Current position: %s", self)
             return args
-        
+
         while True:
             args.append(self.R_Expr())
-            if re.match(r",", self.program[self.pc:]) is None:
-                if re.match(r"\)", self.program[self.pc:]) is None:
-                    self.error(f"Expected ',' or ')' to end arguments, got {self.program[self.pc:self.pc + 12]}")
+            if not self.check(","):
+                if not self.check(")"):
+                    self.error(f"Expected ',' or ')' to end arguments, got '{self.tok.text}'")
                 break
-            self.eat(r",")
+            self.eat(",")
 
-        self.eat(r"\)")
+        self.eat(")")
         return args
-    
+
     def Class_Instance(self) -> UserClassInstance :
         match = self.literal()
 
-        if isinstance(match, str) and self.program[self.pc] == "(":
-            log.debug(f"Class instance: {match}")
+        if isinstance(match, str) and self.check("("):
+            tracing.parser.debug("Class instance: %s", match)
             args = self.Calling_Args()
             inst = UserClassInstance(match, args)
             return inst
-        
+
         return match
 
     def R_Expr_Field(self) -> str | Obj | Field | Call:
@@ -226,108 +208,110 @@ class ParseTree():
         if isinstance(node, UserClassInstance):
             return node
 
-        rhs = None
+        return self.Postfix(node)
+
+    def Postfix(self, node):
+        """
+        Field accesses and method calls following an operand: x.y, x.f(...), (x + y).print()
+        """
         # if we see a '.', parse it
-        while self.program[self.pc] == ".":
-            self.eat()
+        while self.check("."):
+            self.eat(".")
             # get rhs (this must be an ident)
             rhs = self.ident()
-            # if (), we have a method call - parse arguments and break
-            args = []
-            if re.match(r"\(", self.program[self.pc:]):
-                self.eat(r"\(")
+            # if (), we have a method call - parse arguments
+            if self.check("("):
                 args = self.Calling_Args()
-                log.debug(f"At {self.program[self.pc:self.pc+12]}")
+                tracing.parser.debug("At %s", self)
                 node = Call(node, rhs, args)
-                break
             # otherwise, set field node
-            node = Field(node, rhs)
-        
+            else:
+                node = Field(node, rhs)
+
         return node
 
-    def R_Expr_Times(self):
+    def reduce(self, operands: list, operators: list) -> None:
         """
-        *, / operators
-        This is the highest precedence operator, so lowest in parse tree
+        Pop the top operator and its operand(s) and push the node they make.
         """
-        node = self.R_Expr_Field()
+        op = operators.pop()
+        if op == "not":
+            operands.append(Not(operands.pop()))
+            return
 
-        # If we have a times, parse it and return the Expression
-        while self.pc < self.len and self.program[self.pc] in ['*', '/']:
-            token = self.program[self.pc]
-            self.eat()
-            node = Expression(node, self.R_Expr_Field(), token)
+        right = operands.pop()
+        left = operands.pop()
+        operands.append(ParseTree.BINARY_OPS[op][2](left, right, op))
 
-        # Otherwise, return only the literal
-        return node
-    
-    def R_Expr_Plus(self):
+    def R_Expr(self):
         """
-        +, - operators
+        Precedence climbing over ParseTree.BINARY_OPS, using explicit operand/operator stacks
+        instead of one recursive call per precedence level, so long operator chains and deeply
+        parenthesised expressions don't grow the Python stack.
+
+        'not' is a prefix operator that applies to the rest of the (sub)expression.
         """
-        node = self.R_Expr_Times()
+        operands = []
+        # operator texts, "not", or "(" for an open parenthesis
+        operators = []
+        open_parens = 0
 
-        # If we have a times, parse it and return the Expression
-        while self.pc < self.len and self.program[self.pc] in ['+', '-']:
-            token = self.program[self.pc]
-            self.eat()
-            node = Expression(node, self.R_Expr_Times(), token)
+        while True:
+            # operand position: any number of prefix 'not's and '('s, then an operand
+            if self.check("not"):
+                self.eat("not")
+                operators.append("not")
+                continue
+            if self.check("("):
+                self.eat("(")
+                operators.append("(")
+                open_parens += 1
+                continue
 
-        # Otherwise, return only the literal
-        return node
+            operands.append(self.R_Expr_Field())
 
+            # operator position: close parentheses we opened, then a binary operator or the end
+            while open_parens > 0 and self.check(")"):
+                self.eat(")")
+                while operators[-1] != "(":
+                    self.reduce(operands, operators)
+                operators.pop()
+                open_parens -= 1
+                operands.append(self.Postfix(operands.pop()))
 
-    def R_Expr_IntComp(self):
-        """
-        Comparison operators - ==, <, etc.
-        less, equals have to be defined methods for a class for these to work. greater doesn't matter. 
-        """
-        node = self.R_Expr_Plus()
+            tok = self.tok
+            if not (tok.kind == OP or tok.kind == KEYWORD) or tok.text not in ParseTree.BINARY_OPS:
+                break
 
-        match = re.match(r"<=|>=|==|<|>", self.program[self.pc:]) 
-        if match is not None:
-            match = match.group()
+            prec, assoc, _ = ParseTree.BINARY_OPS[tok.text]
+            while operators and operators[-1] in ParseTree.BINARY_OPS:
+                top = ParseTree.BINARY_OPS[operators[-1]][0]
+                if top == prec and assoc is None:
+                    self.error(f"Comparison operators cannot be chained ('{operators[-1]}' followed by '{tok.text}')")
+                if top > prec or (top == prec and assoc == "left"):
+                    self.reduce(operands, operators)
+                else:
+                    break
+            operators.append(self.eat().text)
 
-            self.eat(match, len(match))
-            node = IntComp(node, self.R_Expr_Plus(), match)
-        
-            log.debug(f"Comparison: {node}")
-        else:
-            log.debug(f"{node}")
-        return node
+        if open_parens > 0:
+            self.error(f"Expected token ) not found, got '{self.tok.text}'")
 
-    def R_Expr_AndOr(self):
-        node = self.R_Expr_IntComp()
+        while operators:
+            self.reduce(operands, operators)
 
-        match = re.match(r"and|or", self.program[self.pc:])
-        if match is not None:
-            match = match.group()
-            self.eat(match, len(match))
-            node = BoolComp(node, self.R_Expr_AndOr(), match)
-            log.debug(r"And/Or: {node}")
-        return node
-    
-    def R_Expr(self):
-        match = re.match(r"not", self.program[self.pc:])
-        if match is not None:
-            self.eat(r"not")
-            node = Not(self.R_Expr())
-            
-        else:
-            node = self.R_Expr_AndOr()
+        return operands[0]
 
-        return node
-    
     def L_Expr(self):
         lhs = self.R_Expr()
-        log.debug(f"lhs: {lhs}")
+        tracing.parser.debug("lhs: %s", lhs)
         decl_type = None
-        if self.program[self.pc] == ':':
-            self.eat(r":")
+        if self.check(":"):
+            self.eat(":")
             decl_type = self.class_ident()
-        
-        if self.program[self.pc] == "=":
-            self.eat(r"=")
+
+        if self.check("="):
+            self.eat("=")
             rhs = self.R_Expr()
             lhs = Assign(lhs, rhs, decl_type)
 
@@ -335,108 +319,125 @@ class ParseTree():
 
     def ElifBlock(self) -> ElifNode | None:
         block = []
-        if re.match(r"elif", self.program[self.pc:]) is not None:
-            self.eat(r"elif", num_to_jump=4)
-            self.eat(r"\(")
+        if self.check("elif"):
+            self.eat("elif")
+            self.eat("(")
             elifcond = self.R_Expr()
-            if self.program[self.pc] == ")":
-                self.eat(r"\)")
-            log.debug(f"elif condition located: {elifcond}")
-            if re.match(r";", self.program[self.pc]) is not None:
+            if self.check(")"):
+                self.eat(")")
+            tracing.parser.debug("elif condition located: %s", elifcond)
+            if self.check(";"):
                 # else
-                self.eat(r";")
+                self.eat(";")
             else:
-                self.eat(r"\{")
-                self.Statement_Block(end_char = r"\}", block=block)
+                self.eat("{")
+                self.Statement_Block(end_char = "}", block=block)
             return ElifNode(elifcond, Block(block))
         else:
             return None
 
     def ElseBlock(self) -> Conditional | None:
         block = []
-        if re.match(r"else", self.program[self.pc:]) is not None:
-            self.eat(r"else", num_to_jump=4)
-            if re.match(r";", self.program[self.pc]) is not None:
+        if self.check("else"):
+            self.eat("else")
+            if self.check(";"):
                 # else
-                self.eat(r";")
+                self.eat(";")
             else:
-                self.eat(r"\{")
-                self.Statement_Block(end_char = r"\}", block=block)
+                self.eat("{")
+                self.Statement_Block(end_char = "}", block=block)
             elsenode = ElseNode(Block(block))
             return elsenode
         else:
             return None
-    
+
     def IfBlock(self) -> IfNode:
-        if re.match(r"if", self.program[self.pc:]) is not None:
-            self.eat(r"if", 2)
-            if re.match(r"\(.*\)", self.program[self.pc:]):
-                self.eat(r"\(", 1)
-                log.debug(f"Condition at {self.program[self.pc:]}")
+        if self.check("if"):
+            self.eat("if")
+            if self.check("("):
+                self.eat("(")
+                tracing.parser.debug("Condition at %s", self)
                 ifcond = self.R_Expr()
-                log.debug(f"If condition located: {ifcond}, {ifcond.type}")
+                tracing.parser.debug("If condition located: %s, %s", ifcond, ifcond.type)
                 block = []
-                if re.match(r"\)", self.program[self.pc:]):
-                    self.eat(r"\)", 1)
-                if re.match(r";", self.program[self.pc]) is not None:
+                if self.check(")"):
+                    self.eat(")")
+                if self.check(";"):
                     # else
-                    self.eat(r";")
+                    self.eat(";")
                 else:
-                    self.eat(r"\{")
-                    self.Statement_Block(end_char = r"\}", block=block)
+                    self.eat("{")
+                    self.Statement_Block(end_char = "}", block=block)
                 ifnode = IfNode(ifcond, Block(block))
                 return ifnode
             else:
                 self.error("Missing parentheses around IF condition")
 
     def Conditional(self) -> Conditional:
-        log.debug(f"Parsing conditional at {self.program[self.pc:self.pc + 12]}")
+        tracing.parser.debug("Parsing conditional at %s", self)
         ifnode = self.IfBlock()
         elifnodes = []
-        while re.match(r"elif", self.program[self.pc:]) is not None:
+        while self.check("elif"):
             elifnodes.append(self.ElifBlock())
         elsenode = self.ElseBlock()
         return Conditional(ifnode, elifnodes, elsenode)
 
     def While(self) -> While:
         whilecond = self.R_Expr()
-        log.debug(f"While condition located: {whilecond}")
+        tracing.parser.debug("While condition located: %s", whilecond)
         block = []
-        if re.match(r";", self.program[self.pc]) is not None:
+        if self.check(";"):
             # else
-            self.eat(r";")
+            self.eat(";")
         else:
-            self.eat(r"\{")
-            self.Statement_Block(end_char = r"\}", block=block)
+            self.eat("{")
+            self.Statement_Block(end_char = "}", block=block)
         whilenode = While(whilecond, Block(block))
         return whilenode
-    
+
+    def For(self) -> For:
+        var = self.ident()
+        if var is None:
+            self.error(f"Expected a variable after 'for', got '{self.tok.text}'")
+        self.eat("in")
+        low = self.R_Expr()
+        self.eat("..")
+        high = self.R_Expr()
+        tracing.parser.debug("For range located: %s..%s", low, high)
+        block = []
+        if self.check(";"):
+            self.eat(";")
+        else:
+            self.eat("{")
+            self.Statement_Block(end_char = "}", block=block)
+        return For(var, low, high, Block(block))
+
     def Return(self):
-        match = re.match(r"return[\s]", self.program[self.pc:])
-        if match is not None:
-            match = match.group()
-            self.eat(num_to_jump=len(match))
+        if self.check("return"):
+            self.eat("return")
             expr = self.R_Expr()
-            self.eat(r";")
+            self.eat(";")
             return Return(expr)
 
     def Typecase(self):
-        if re.match(r"typecase\s", self.program[self.pc:]):
-            self.eat(num_to_jump=8)
+        if self.check("typecase"):
+            self.eat("typecase")
             test = self.R_Expr()
-            log.debug(f"test = {test}")
+            tracing.parser.debug("test = %s", test)
 
-            self.eat(r"\{")
+            self.eat("{")
             typecase = Typecase(test)
-            while re.match(r"\}", self.program[self.pc:]) is None:
+            while not self.check("}"):
+                if self.at_eof():
+                    self.error("Unterminated typecase")
                 check = self.ident()
-                self.eat(r":")
+                self.eat(":")
                 classtype = self.class_ident()
-                self.eat(r"\{")
+                self.eat("{")
                 block = []
-                self.Statement_Block(r"\}", block)
+                self.Statement_Block("}", block)
                 typecase.add_case(TypecaseCase(check, classtype, Block(block)))
-            self.eat(r"\}")
+            self.eat("}")
             return typecase
         else:
             self.error("???????????")
@@ -446,246 +447,363 @@ class ParseTree():
         if/elif/else, return, typecase, other statements
         """
         if nested is None:
-            block = ParseTree.statements
+            block = self.statements
         else:
             block = nested
 
-        self.check_comment()
-
         # check typecase
-        if re.match(r"typecase\s", self.program[self.pc:]):
+        if self.check("typecase"):
             node = self.Typecase()
             block.append(node)
-            log.info(node)
+            tracing.parser.info("%s", node)
             return
 
 
         # check return
-        if re.match(r"return\s", self.program[self.pc:]):
+        if self.check("return"):
             node = self.Return()
             block.append(node)
             self.state = ParseTree.RETURN
-            log.info(f"{node}")
+            tracing.parser.info("%s", node)
             return
 
         # check if
-        if re.match(r"if[\s\(]", self.program[self.pc:]):
+        if self.check("if"):
             node = self.Conditional()
             block.append(node)
-            log.info(f"{node}")
+            tracing.parser.info("%s", node)
             return
-        
+
         # check while
-        elif re.match(r"while[\s\(]", self.program[self.pc:]):
-            self.eat("", num_to_jump=5)
+        elif self.check("while"):
+            self.eat("while")
             node = self.While()
             block.append(node)
-            log.info(f"{node}")
+            tracing.parser.info("%s", node)
             return
-        
+
+        # check for
+        elif self.check("for"):
+            self.eat("for")
+            node = self.For()
+            block.append(node)
+            tracing.parser.info("%s", node)
+            return
+
         else:
             node = self.L_Expr()
             block.append(node)
 
-            self.eat(r";")
-        
-        log.info(node)
+            self.eat(";")
+
+        tracing.parser.info("%s", node)
         return
-    
+
     def Statement_Block(self, end_char = None, block = None):
-        log.info(f"Statement Block:\n-----------------")
+        tracing.parser.info("Statement Block:\n-----------------")
         if end_char is None:
-            while self.pc < self.len and self.state != ParseTree.RETURN:
+            while not self.at_eof() and self.state != ParseTree.RETURN:
                 # on return, stop parsing
                 self.Statement()
         else:
-            while self.pc < self.len and re.match(end_char, self.program[self.pc:]) is None:
-                if re.match(r"def", self.program[self.pc:]):
-                    log.info("------------------")
+            while not self.at_eof() and not self.check(end_char):
+                if self.check("def"):
+                    tracing.parser.info("------------------")
                     return
                 self.Statement(block)
             self.eat(end_char)
-        log.info("------------------")
+        tracing.parser.info("------------------")
         return
-    
+
     def Args(self):
         args = []
-        if re.match(r"\(", self.program[self.pc]) is not None:
-            self.eat(r"\(", 1)
-        while re.match(r"\)", self.program[self.pc]) is None:
+        if self.check("("):
+            self.eat("(")
+        while not self.check(")"):
+            if self.at_eof():
+                self.error("Unterminated argument list")
             name = self.ident()
-            self.eat(r":")
+            self.eat(":")
             tpe = self.class_ident()
             args.append((name, tpe))
-            try:
-                self.eat(r",")
-            except:
-                continue
+            if self.check(","):
+                self.eat(",")
         return args
-    
+
     def Method(self):
-        if re.match(r"def", self.program[self.pc:]) is not None:
+        if self.check("def"):
             # get name
-            self.eat(r"def", 3)
+            self.eat("def")
             name = self.ident()
 
             # args on constructor is ok here
             # get args
-            self.eat(r"\(", 1)
+            self.eat("(")
             args = self.Args()
-            self.eat(r"\)", 1)
+            self.eat(")")
 
             # get return type
-            self.eat(r":", 1)
+            self.eat(":")
             ret = self.class_ident()
-            self.eat(r"\{", 1)
+            self.eat("{")
 
             # parse statements
             block = []
-            self.Statement_Block(end_char = r"\}", block=block)
+            self.Statement_Block(end_char = "}", block=block)
             if self.state != ParseTree.RETURN:
                 block.append(Return(None))
             method = Method(name, args, ret, Block(block))
-            log.info(f"Parsed {method}")
+            tracing.parser.info("Parsed %s", method)
             # return
             return method
         else:
             # this should never never happen
-            self.error(f"Error: attempted method parsing at {self.program[self.pc + 12]}")
+            self.error(f"Error: attempted method parsing at {self}")
 
     def ClassBody(self):
         # classbody is a sequence of statements followed by a sequence of method definitions
         block = []
-        self.Statement_Block(end_char=r"\}", block=block)
+        self.Statement_Block(end_char="}", block=block)
         body = ClassBody(Block(block))
 
-        log.debug(f"Statement block: {body.statements}")
-        log.debug(f"finished statements, looking for method call at {self.program[self.pc:self.pc + 12]}")
+        tracing.parser.debug("Statement block: %s", body.statements)
+        tracing.parser.debug("finished statements, looking for method call at %s", self)
 
         self.state = ParseTree.NORMAL
-        while self.pc < self.len and re.match(r"def", self.program[self.pc:]) is not None:
-            log.debug("Found a new method!")
+        while self.check("def"):
+            tracing.parser.debug("Found a new method!")
             body.add_method(self.Method())
-        if re.match(r"\}", self.program[self.pc:]) is not None:
-            self.eat(r"\}")
-        log.info(f"ClassBody: {body}")
+        if self.check("}"):
+            self.eat("}")
+        tracing.parser.info("ClassBody: %s", body)
         return body
-    
-    def Class(self):
-        self.check_comment()
 
+    def Class(self):
         self.state = ParseTree.CLASS
-        match = re.match(r"class", self.program[self.pc:])
         # this is a bit redundant but whatever
-        if match is not None:
-            self.eat(r"class", 5)
+        if self.check("class"):
+            self.eat("class")
             classname = self.ident()
             # get the function arguments
-            self.eat(r"\(", 1)
+            self.eat("(")
             args = self.Args()
-            self.eat(r"\)", 1)
+            self.eat(")")
 
         # Optionally, new class can extend old class
-        match = re.match(r"extends", self.program[self.pc:])
-        if match is not None:
-            self.eat(r"extends", len("extends"))
+        if self.check("extends"):
+            self.eat("extends")
             parent = self.class_ident()
-            log.debug(f"new class {classname} extending {parent}")
+            tracing.parser.debug("new class %s extending %s", classname, parent)
         else:
             parent = "Obj"
-            log.debug(f"no parent given, new class {classname} inheriting Obj")
-        self.eat(r"\{")
+            tracing.parser.debug("no parent given, new class %s inheriting Obj", classname)
+        self.eat("{")
 
         self.state = ParseTree.CLASS
         new_class = Class(classname, args, None, parent)
-        log.info(f"Parsing {new_class}\n--------------")
+        tracing.parser.info("Parsing %s\n--------------", new_class)
 
         new_class.set_body(self.ClassBody())
 
-        ParseTree.classes.append(new_class.name)
+        self.classes.append(new_class.name)
 
-        log.debug(f"{new_class}")
-        log.info(f"Successfully parsed {new_class}\n-------------------")
+        tracing.parser.debug("%s", new_class)
+        tracing.parser.info("Successfully parsed %s\n-------------------", new_class)
         return
-    
+
     def Parse(self):
-        self.check_comment()
         # evaluate 0 or more class statements
-        while self.pc < self.len and re.match(r"class", self.program[self.pc:]) is not None:
+        while self.check("class"):
             self.Class()
-        
-        log.debug("Finished parsing class definitions - looking for statements...")
-        log.debug(f"Current position: {self.program[self.pc:self.pc + 12]}")
+
+        tracing.parser.debug("Finished parsing class definitions - looking for statements...")
+        tracing.parser.debug("Current position: %s", self)
         self.state = ParseTree.NORMAL
         # followed by a statement block
-        # check that global statement block is still empty
-        assert(ParseTree.statements == [])
         self.Statement_Block()
 
-def main():
-    if len(sys.argv) > 1:
-        file = sys.argv[1]
-    else:
-        file = "ex.qk"
-    # read quack
-
-    path = ""
-    out_file = file.split(".")[0]
-    if file.startswith("tests/"):
-        path = "tests/"
-        out_file = file.split("/")[1].split(".")[0]
-
-    out_file = out_file[0].upper() + out_file[1:]
+def compile_emitters(program: str, out_file: str = "Main", opt_level: int = 0,
+                     passes: PassManager = None, interface_dir: str = None) -> dict[str, ClassEmitter]:
+    """
+    Parse, check, optimize (at opt_level, see optimize.py) and generate code for a program, in memory.
+    Returns {class name: ClassEmitter}, the statement class last. Every call compiles in its own
+    CompilationContext, so this can be called repeatedly and from several threads at once.
+    The generated methods go through passes (default: pipeline(opt_level)). Classes the program
+    uses but doesn't define are imported from their interfaces in interface_dir (see interface.py).
+    """
+    with CompilationContext(opt_level) as ctx:
+        ctx.classes = interface.Classes(interface_dir)
+        tree = ParseTree(program)
+        tree.Parse()
+        return codegen(tree, out_file, passes)
+
+def compile_string(program: str, out_file: str = "Main", opt_level: int = 0) -> dict[str, str]:
+    """
+    Compile a program to {class name: asm}, the statement class last.
+    """
+    return {name: cls.text() for name, cls in compile_emitters(program, out_file, opt_level).items()}
+
+def compile_program(program: str, out_file: str, obj_dir: str = None, dump_asm: bool = False,
+                    opt_level: int = 0, passes: PassManager = None) -> dict[str, str]:
+    """
+    Compile a program and write its output; returns {path: text} of every file written.
+    Without obj_dir that is one .asm file per class. With obj_dir the classes go straight
+    to object code in obj_dir (see backend.py), and .asm files are only written with dump_asm.
+    With obj_dir each class's interface goes there too, and classes the program doesn't define
+    are imported from the interfaces there (see interface.py).
+    """
+    emitters = compile_emitters(program, out_file, opt_level, passes, obj_dir)
+    files = {}
+    if obj_dir is None or dump_asm:
+        for name, cls in emitters.items():
+            files[f"{name}.asm"] = cls.text()
+            atomic_write(f"{name}.asm", files[f"{name}.asm"])
+    if obj_dir is not None:
+        objects, errors = assemble_emitters(emitters, obj_dir)
+        if errors:
+            raise RuntimeError("assembler: " + "; ".join(errors))
+        for name, text in objects.items():
+            files[os.path.join(obj_dir, f"{name}.json")] = text
+        files.update(interface.write(emitters, obj_dir))
+    return files
+
+def typecheck(tree: ParseTree, out_file: str) -> list[Class]:
+    """
+    Type check the classes and statements of a parsed program, in the current CompilationContext.
+    Returns the classes to generate, the class holding the statements last.
+    """
+    tracing.checker.info("Classes: %s", tree.classes)
+
+    ctx = current()
+    # method lookups in the checker all go through these
+    for c in tree.classes:
+        ctx.classes[c].get_method_table()
 
-    program = ""
-
-    with open(file, "r") as f:
-        lines = f.readlines()
-        for line in lines:
-            if (line == "\n"):
-                continue
-            else:
-                program += line
-
-    tree = ParseTree(program)
-    tree.Parse()
-
-    log.info("Walking ASTNode Tree:\n")
-    log.info(f"Classes: {ParseTree.classes}\n")
-
-    for c in ParseTree.classes:
-        Class.classes[c].evaluate()
+    classes = []
+    for c in tree.classes:
+        ctx.classes[c].typecheck()
+        classes.append(ctx.classes[c])
         if c == out_file:
             out_file = "Main"
 
-    Obj.ASM_FILE = f"{out_file}.asm"
-
-    try:
-        open(Obj.ASM_FILE, "x")
-    except FileExistsError:
-        os.remove(Obj.ASM_FILE)
-
-    # f = open(Obj.ASM_FILE, "w+")
-    # # write header information
-    # print(f".class {out_file}:Obj", file=f)
-    # print(".method $constructor", file=f, end="")
+    tracing.checker.info("Checking statements...")
+    main = Class(out_file, [], ClassBody(Block(tree.statements), []), "Obj", main=True)
+    main.typecheck()
+    classes.append(main)
+    return classes
+
+def pipeline(opt_level: int) -> list[tuple[str, callable]]:
+    """
+    The passes every generated method goes through (as a CFG, see ir.py) at an -O level.
+    """
+    passes = []
+    if opt_level >= 1:
+        passes += [("jumps", thread_jumps), ("unreachable", remove_unreachable)]
+    if opt_level >= 2:
+        passes.append(("inline", inline.inline))
+    if opt_level >= 1:
+        passes += [("licm", licm.hoist), ("cse", cse.eliminate)]
+    if opt_level >= 2:
+        passes += [("tail", tail_calls), ("devirt", cha.devirtualize)]
+    passes.append(("slots", slots.allocate))
+    return passes
+
+def codegen(tree: ParseTree, out_file: str, passes: PassManager = None) -> dict[str, ClassEmitter]:
+    """
+    Check and generate code for the classes and statements of a parsed program,
+    in the current CompilationContext.
+    """
+    classes = typecheck(tree, out_file)
+    for c in classes:
+        optimize.optimize(c, current().opt_level)
+
+    if passes is None:
+        passes = PassManager(pipeline(current().opt_level))
+
+    tracing.codegen.info("Walking ASTNode Tree:\n")
+    ctx = current()
+    for c in classes:
+        c.evaluate()
+    # every method is generated before any pass runs, so a pass can look at the others (see inline.py)
+    for name, cls in ctx.generated.items():
+        for m in cls.methods:
+            ctx.method_code[f"{name}:{m.name}"] = (m.args, m.locals, m.code)
+    for name, cls in ctx.generated.items():
+        for m in cls.methods:
+            passes.run(name, m)
+    for name, cls in ctx.generated.items():
+        if cls.interface is not None:
+            # what the passes took no later program to override
+            cls.interface["final"] = cha.assumed_final(name)
+
+    tracing.codegen.debug("done")
+    return current().generated
+
+def cli():
+    parser = argparse.ArgumentParser(description="Compile a Quack program into tiny_vm assembly (one .asm file per class)")
+    parser.add_argument("file", nargs="?", default="ex.qk")
+    parser.add_argument("-o", "--obj-dir", help="compile straight to object code in this directory (e.g. vm/OBJ) "
+                                                "instead of writing .asm files")
+    parser.add_argument("--dump-asm", action="store_true", help="with --obj-dir, also write the .asm files")
+    parser.add_argument("-O", "-O1", dest="opt_level", action="store_const", const=1, default=0,
+                           help="optimize: fold constants, remove dead code (see optimize.py)")
+    parser.add_argument("-O2", dest="opt_level", action="store_const", const=2, default=0,
+                           help="-O, drop + 0, * 1 and the like, inline small methods, call methods directly and reuse the frame for tail calls")
+    parser.add_argument("-O0", dest="opt_level", action="store_const", const=0, default=0,
+                           help="don't optimize (the default)")
+    parser.add_argument("--dump-ir", action="store_true", help="print the IR of every method after the passes (see ir.py)")
+    parser.add_argument("--pass-times", action="store_true", help="print the time each pass took to stderr")
+    parser.add_argument("--opt-report", action="store_true", help="print what the passes did to each method to stderr")
+    parser.add_argument("--no-cache", action="store_true", help="always recompile, don't read or write the compile cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_DIR, help=f"compile cache directory (default {DEFAULT_DIR})")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES, help="compile cache size cap in bytes")
+    parser.add_argument("--cache-stats", action="store_true", help="print compile cache counters to stderr")
+    parser.add_argument("--trace", metavar="SPEC", help=f"trace compiler subsystems, e.g. parser=debug,codegen=info "
+                                                       f"(subsystems: {', '.join(tracing.SUBSYSTEMS)})")
+    return parser.parse_args()
 
-    # locals = ASTNode.get_locals()
-    # if locals != f"":
-    #     print(f"\t.local {locals}", file=f, end="")
-    
-    # print("\n\tenter", file=f)
-    # f.close()
-
-    log.info("Parsing statements...")
-    b = Block(ParseTree.statements)
+def main():
+    args = cli()
+    if args.trace:
+        try:
+            tracing.configure(args.trace)
+        except ValueError as e:
+            sys.exit(f"quack.py: {e}")
+    file = args.file
+    # read quack
+    out_file = os.path.basename(file).split(".")[0]
+    out_file = out_file[0].upper() + out_file[1:]
 
-    c = Class(out_file, [], ClassBody(b, []), "Obj", main=True)
-    c.evaluate()
+    with open(file, "r") as f:
+        program = f.read()
+
+    if args.no_cache or args.dump_ir or args.pass_times or args.opt_report:
+        passes = PassManager(pipeline(args.opt_level), dump=sys.stdout if args.dump_ir else None,
+                             remarks=sys.stderr if args.opt_report else None)
+        compile_program(program, out_file, args.obj_dir, args.dump_asm, args.opt_level, passes)
+        if args.pass_times:
+            print(passes.report(), file=sys.stderr)
+        return
 
-    # log.debug(f"End of block\n{ASTNode.buffer}*")
+    compile_cache = CompileCache(args.cache_dir, args.cache_size)
+    # the program may import classes from the interfaces in the obj dir
+    imports = interface.fingerprint(args.obj_dir, program) if args.obj_dir is not None else None
+    key = compile_cache.key(program, out_file, (args.obj_dir, args.dump_asm, args.opt_level, imports))
+    files = compile_cache.get(key)
+    if files is not None:
+        # nothing changed - re-emit the cached classes without parsing or checking
+        tracing.cache.info("Cache hit for %s", file)
+        if args.obj_dir is not None:
+            library(args.obj_dir)
+        for path, text in files.items():
+            atomic_write(path, text)
+    else:
+        files = compile_program(program, out_file, args.obj_dir, args.dump_asm, args.opt_level)
+        compile_cache.put(key, files)
 
-    log.debug("done")
+    compile_cache.save_stats()
+    if args.cache_stats:
+        print(compile_cache, file=sys.stderr)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
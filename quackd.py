@@ -0,0 +1,320 @@
+"""
+quackd, a compile server that keeps the compiler warm.
+
+Every ./quack run starts python twice, once to import the compiler and once more for
+vm/assemble.py, which re-reads opdefs.txt, asm.conf and the builtin object files each
+time. quackd does all of that once. It then serves compile and assemble requests over a
+Unix socket, and the scripts (quack, quackc, compile, assemble) send their work to it
+whenever its socket exists:
+
+    python quackd.py serve &                        start the server
+    python quackd.py compile tests/Pt.qk            write Pt.asm, Test.asm to the cwd, like quack.py
+    python quackd.py compile tests/Pt.qk --obj-dir vm/OBJ    object code in vm/OBJ instead
+    python quackd.py assemble Pt.asm --obj-dir vm/OBJ
+    python quackd.py stats                          request counts and latencies
+    python quackd.py stop
+
+The socket is $QUACKD_SOCKET, or /tmp/quackd-<uid>.sock.
+
+The protocol is one JSON object per line in each direction, any number of requests per
+connection:
+
+    {"op": "compile", "file": path, "source": text?, "name": main class?,
+     "asm_dir": dir?, "assemble": bool?, "obj_dir": dir?, "opt_level": n?}
+    {"op": "assemble", "asm": {class name: asm}, "obj_dir": dir?}
+    {"op": "stats"}  {"op": "ping"}  {"op": "shutdown"}
+
+A compile reads the file unless its source is given. When it assembles (assemble, or
+an obj_dir), the classes go straight to object code (backend.py), and the .asm text is
+only generated for asm_dir. Files are written to asm_dir and obj_dir when those are
+given, and returned either way. The class interfaces (interface.py) go to obj_dir, and
+classes the program doesn't define are imported from there. The response is
+
+    {"ok": bool, "error": str?, "warnings": [...], "asm": {...}, "objects": {...},
+     "seconds": {"compile": s, "assemble": s, "total": s}}
+
+The client half of this file only imports the standard library, so starting it is as
+cheap as python itself gets.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+
+DEFAULT_SOCKET = os.environ.get("QUACKD_SOCKET") or f"/tmp/quackd-{os.getuid()}.sock"
+
+# ----------------
+#  Client
+#
+
+def request(message: dict, path: str = DEFAULT_SOCKET) -> dict:
+    """
+    Send one request to the server at path and wait for its response.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall((json.dumps(message) + "\n").encode())
+        with s.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f"quackd at {path} closed the connection")
+    return json.loads(line)
+
+def running(path: str = DEFAULT_SOCKET) -> bool:
+    try:
+        return request({"op": "ping"}, path)["ok"]
+    except (OSError, ValueError):
+        return False
+
+# ----------------
+#  Server
+#
+
+class Latency():
+    """
+    Request count and latency of one kind of request; percentiles are over the last 1000.
+    """
+    def __init__(self):
+        from collections import deque
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=1000)
+
+    def add(self, seconds: float, ok: bool) -> None:
+        self.count += 1
+        self.errors += not ok
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self) -> dict:
+        recent = sorted(self.recent)
+        def pct(p):
+            return recent[min(len(recent) - 1, int(p * len(recent)))] if recent else None
+        return {"count": self.count, "errors": self.errors, "total": self.total,
+                "mean": self.total / self.count if self.count else None,
+                "p50": pct(0.5), "p95": pct(0.95), "max": self.max}
+
+def serve(path: str = DEFAULT_SOCKET) -> None:
+    """
+    Run the server on path until a shutdown request (or ^C).
+    """
+    import shutil
+    import tempfile
+    import threading
+    import warnings
+    import socketserver
+
+    # everything the per-file scripts paid for on every run, paid once here
+    import tracing
+    import interface
+    from cache import atomic_write
+    from quack import compile_emitters
+    from backend import assembler, assemble_emitters
+    from batch import assemble_classes, main_class_name
+    assembler()
+
+    if os.path.exists(path):
+        if running(path):
+            sys.exit(f"quackd.py: already running on {path}")
+        os.unlink(path)
+
+    # assembling without an obj_dir still needs a library directory to import from
+    scratch = tempfile.mkdtemp(prefix="quackd-")
+    started = time.time()
+    metrics: dict[str, Latency] = {}
+    # the assembler keeps its import table in globals, and warnings are captured process-wide
+    lock = threading.Lock()
+
+    def compile_request(req: dict, response: dict) -> None:
+        source = req.get("source")
+        if source is None:
+            with open(req["file"], "r") as f:
+                source = f.read()
+        name = req.get("name") or main_class_name(req["file"])
+
+        start = time.perf_counter()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            emitters = compile_emitters(source, name, req.get("opt_level", 0), interface_dir=req.get("obj_dir"))
+        response["warnings"] = [str(w.message) for w in caught]
+        response["seconds"]["compile"] = time.perf_counter() - start
+
+        assembling = req.get("assemble") or req.get("obj_dir")
+        if req.get("asm_dir") or not assembling:
+            response["asm"] = {cls: e.text() for cls, e in emitters.items()}
+        if req.get("asm_dir"):
+            for cls, text in response["asm"].items():
+                atomic_write(os.path.join(req["asm_dir"], f"{cls}.asm"), text)
+        if assembling:
+            # straight from the emitters to object code, no .asm text in between
+            make_objects(assemble_emitters, emitters, req.get("obj_dir"), response)
+        if req.get("obj_dir"):
+            interface.write(emitters, req["obj_dir"])
+
+    def assemble_request(req: dict, response: dict) -> None:
+        make_objects(assemble_classes, req["asm"], req.get("obj_dir"), response)
+
+    def make_objects(assemble, classes: dict, obj_dir: str | None, response: dict) -> None:
+        start = time.perf_counter()
+        obj_dir = obj_dir or scratch
+        objects, errors = assemble(classes, obj_dir)
+        if obj_dir == scratch:
+            # only the builtins stay, so the next program can't import this one's classes
+            for cls in objects:
+                os.unlink(os.path.join(scratch, f"{cls}.json"))
+        response["objects"] = objects
+        response["seconds"]["assemble"] = time.perf_counter() - start
+        if errors:
+            raise RuntimeError("assembler: " + "; ".join(errors))
+
+    def stats() -> dict:
+        return {"pid": os.getpid(), "uptime": time.time() - started,
+                "requests": {op: m.summary() for op, m in metrics.items()}}
+
+    ops = {"compile": compile_request, "assemble": assemble_request}
+
+    def dispatch(req: dict) -> dict:
+        op = req.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "stats":
+            return {"ok": True, "stats": stats()}
+        if op == "shutdown":
+            threading.Thread(target=server.shutdown).start()
+            return {"ok": True}
+        if op not in ops:
+            return {"ok": False, "error": f"unknown op {op!r}, expected one of ping, stats, shutdown, "
+                                          f"{', '.join(ops)}"}
+
+        response = {"ok": False, "error": None, "warnings": [], "seconds": {}}
+        start = time.perf_counter()
+        with lock:
+            try:
+                ops[op](req, response)
+                response["ok"] = True
+            except Exception as e:
+                response["error"] = f"{type(e).__name__}: {e}"
+        response["seconds"]["total"] = time.perf_counter() - start
+
+        metrics.setdefault(op, Latency()).add(response["seconds"]["total"], response["ok"])
+        tracing.daemon.info("%s %s %s in %.1fms", op, req.get("file", ""),
+                            "ok" if response["ok"] else "failed", response["seconds"]["total"] * 1000)
+        return response
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    response = dispatch(json.loads(line))
+                except (ValueError, AttributeError) as e:
+                    response = {"ok": False, "error": f"bad request: {e}"}
+                self.wfile.write((json.dumps(response) + "\n").encode())
+                self.wfile.flush()
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    server = Server(path, Handler)
+    tracing.daemon.info("listening on %s (pid %d)", path, os.getpid())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+        shutil.rmtree(scratch, ignore_errors=True)
+        tracing.daemon.info("stopped")
+
+# ----------------
+#  Command line
+#
+
+def cli():
+    parser = argparse.ArgumentParser(description="Quack compile server, and a client for it")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"server socket (default {DEFAULT_SOCKET})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = commands.add_parser("serve", help="run the server in the foreground")
+    serve_cmd.add_argument("--trace", metavar="SPEC", default="daemon=info",
+                           help="trace compiler subsystems (default daemon=info: one line per request)")
+
+    compile_cmd = commands.add_parser("compile", help="compile a .qk file")
+    compile_cmd.add_argument("file")
+    compile_cmd.add_argument("--obj-dir", help="compile straight to object code in this directory")
+    compile_cmd.add_argument("--asm-dir", help="where to write the .asm files (default: cwd, unless --obj-dir is given)")
+    compile_cmd.add_argument("-O", "-O1", dest="opt_level", action="store_const", const=1, default=0,
+                                help="optimize: fold constants, remove dead code (see optimize.py)")
+    compile_cmd.add_argument("-O2", dest="opt_level", action="store_const", const=2, default=0,
+                                help="-O, drop + 0, * 1 and the like, inline small methods, call methods directly and reuse the frame for tail calls")
+    compile_cmd.add_argument("-O0", dest="opt_level", action="store_const", const=0, default=0,
+                                help="don't optimize (the default)")
+
+    assemble_cmd = commands.add_parser("assemble", help="assemble .asm files")
+    assemble_cmd.add_argument("files", nargs="+")
+    assemble_cmd.add_argument("--obj-dir", default="OBJ", help="where to write the object code (default OBJ/)")
+
+    for cmd in (compile_cmd, assemble_cmd):
+        cmd.add_argument("--json", action="store_true", help="print the whole response")
+        cmd.add_argument("--timings", action="store_true", help="print the server-side latency to stderr")
+
+    commands.add_parser("stats", help="print request counts and latencies")
+    commands.add_parser("stop", help="shut the server down")
+    return parser.parse_args()
+
+def main():
+    args = cli()
+    if args.command == "serve":
+        import tracing
+        try:
+            tracing.configure(args.trace)
+        except ValueError as e:
+            sys.exit(f"quackd.py: {e}")
+        serve(args.socket)
+        return
+
+    if args.command == "compile":
+        message = {"op": "compile", "file": os.path.abspath(args.file), "opt_level": args.opt_level}
+        if args.obj_dir:
+            message["obj_dir"] = os.path.abspath(args.obj_dir)
+        if args.asm_dir or not args.obj_dir:
+            message["asm_dir"] = os.path.abspath(args.asm_dir or ".")
+    elif args.command == "assemble":
+        asm = {}
+        for file in args.files:
+            with open(file, "r") as f:
+                asm[os.path.basename(file).split(".")[0]] = f.read()
+        message = {"op": "assemble", "asm": asm, "obj_dir": os.path.abspath(args.obj_dir)}
+    else:
+        message = {"op": {"stats": "stats", "stop": "shutdown"}[args.command]}
+
+    try:
+        response = request(message, args.socket)
+    except OSError as e:
+        sys.exit(f"quackd.py: no server on {args.socket} ({e}), start one with `python quackd.py serve &`")
+
+    if args.command == "stats":
+        print(json.dumps(response["stats"], indent=2))
+        return
+    if args.command == "stop":
+        return
+
+    if args.json:
+        print(json.dumps(response, indent=2))
+    for w in response["warnings"]:
+        print(f"warning: {w}", file=sys.stderr)
+    if args.timings:
+        print(" ".join(f"{phase} {s * 1000:.1f}ms" for phase, s in response["seconds"].items()), file=sys.stderr)
+    if not response["ok"]:
+        print(response["error"], file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Builtin class registry.
+
+vm/builtins.json describes the builtin classes (Obj, Int, String, Bool, Nothing): their
+parent, fields and vtable, and for each method its slot, argument types, return type and
+whether the vm implements it. vm/build_builtin_registry.py generates it from the stub
+object code in vm/OBJ and the vtables in vm/builtins.c; regenerate it when either changes.
+
+It is read once, when this module is imported, into read-only mappings:
+
+    CLASSES["Int"]["methods"]["plus"]   ->  {"name": "plus", "slot": 5, "params": ("Int",),
+                                              "returns": "Int", "native": "method_Int_plus"}
+    CLASSES["Int"]["vtable"]            ->  ("$constructor", "string", ...)
+"""
+import os
+import json
+from types import MappingProxyType
+
+REGISTRY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vm", "builtins.json")
+
+def load(path: str = REGISTRY) -> MappingProxyType:
+    with open(path, "r") as f:
+        classes = json.load(f)["classes"]
+
+    frozen = {}
+    for name, record in classes.items():
+        methods = {m["name"]: MappingProxyType({**m, "params": tuple(m["params"])}) for m in record["methods"]}
+        frozen[name] = MappingProxyType({
+            "super": record["super"],
+            "fields": tuple(record["fields"]),
+            "methods": MappingProxyType(methods),
+            "vtable": tuple(m["name"] for m in record["methods"]),
+        })
+    return MappingProxyType(frozen)
+
+CLASSES = load()
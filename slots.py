@@ -0,0 +1,113 @@
+"""
+Frame slot allocation.
+
+Code generation emits loads and stores by name and collects a method's locals in a
+.local list; the assembler then looks every name up in the argument and local lists
+(list.index per instruction), and every local gets a slot of its own. This pass runs
+on the CFG of a finished method instead (see ir.py), as the last pass:
+
+    PassManager([..., ("slots", allocate)]).run(class_name, method)
+
+It computes which locals are live at each instruction, gives locals whose lifetimes
+never overlap the same slot (greedy colouring of the interference graph, in the order
+the locals were declared), and rewrites every load and store to the frame offset the
+assembler would have computed: 0 for $, -n..-1 for the arguments, 3.. for the local
+slots. The method's frame is then the number of slots, not the number of names.
+
+A local read before it is written on some path is live from the method entry, so it
+interferes with every local written before that read and keeps the nothing that alloc
+put in its slot.
+"""
+from ir import CFG, Block
+
+# offset of the first local slot from the frame pointer ($, return address, saved fp come first)
+FIRST_LOCAL = 3
+
+# ops that name a local: a counted loop's counter (see AST.For) is written by unbox and
+# read by the others (incr writes it as well, but it is live across the whole loop anyway)
+READS = ("load", "box", "incr", "below")
+WRITES = ("store", "unbox")
+
+def liveness(cfg: CFG, local: set[str]) -> dict[Block, set[str]]:
+    """
+    The locals live at the end of each block (backwards dataflow to a fixed point).
+    """
+    uses, defs = {}, {}
+    for b in cfg.blocks:
+        use, kill = set(), set()
+        for _, op, operand in reversed(b.instrs):
+            if operand in local:
+                if op in READS:
+                    use.add(operand)
+                elif op in WRITES:
+                    use.discard(operand)
+                    kill.add(operand)
+        uses[b] = use
+        defs[b] = kill
+
+    # a block's own uses are live into it whatever follows it
+    live_in = {b: set(uses[b]) for b in cfg.blocks}
+    live_out = {b: set() for b in cfg.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for b in reversed(cfg.blocks):
+            out = set()
+            for s in b.succ:
+                out |= live_in[s]
+            if out != live_out[b]:
+                live_out[b] = out
+                live_in[b] = uses[b] | (out - defs[b])
+                changed = True
+    return live_out
+
+def interference(cfg: CFG, local: set[str], live_out: dict[Block, set[str]]) -> dict[str, set[str]]:
+    """
+    For each local, the locals live across a store to it (which may not share its slot).
+    """
+    interferes = {l: set() for l in local}
+    for b in cfg.blocks:
+        live = set(live_out[b])
+        for _, op, operand in reversed(b.instrs):
+            if operand not in local:
+                continue
+            if op in WRITES:
+                # a store clobbers its slot, so it may not be shared with anything live across it
+                for other in live:
+                    if other != operand:
+                        interferes[operand].add(other)
+                        interferes[other].add(operand)
+                live.discard(operand)
+            elif op in READS:
+                live.add(operand)
+    return interferes
+
+def colour(locals: list[str], interferes: dict[str, set[str]]) -> dict[str, int]:
+    """
+    Slot number (from 0) of each local, lowest free slot first, in declaration order.
+    """
+    slots = {}
+    for l in locals:
+        taken = {slots[o] for o in interferes[l] if o in slots}
+        slot = 0
+        while slot in taken:
+            slot += 1
+        slots[l] = slot
+    return slots
+
+def allocate(cfg: CFG) -> None:
+    """
+    Give the method's locals frame slots and rewrite its loads and stores to frame offsets.
+    """
+    local = set(cfg.locals)
+    slots = colour(cfg.locals, interference(cfg, local, liveness(cfg, local)))
+
+    offsets = {"$": 0}
+    offsets.update({a: i - len(cfg.args) for i, a in enumerate(cfg.args)})
+    offsets.update({l: FIRST_LOCAL + s for l, s in slots.items()})
+
+    for b in cfg.blocks:
+        b.instrs = [(None, op, offsets.get(operand, operand)) if op in READS + WRITES else (label, op, operand)
+                    for label, op, operand in b.instrs]
+    cfg.slots = {l: offsets[l] for l in slots}
+    cfg.frame = len(set(slots.values()))
@@ -0,0 +1,28 @@
+# compile programs with long chains of and, or and + at -O0, -O1 and -O2, which must not run
+# out of Python stack (they are too long for the vm's code space to run, so only compile them)
+# usage: sh tests/chains.sh [terms]    (default 5000); run from the repository root
+n="${1:-5000}"
+out=$(mktemp -d)
+failed=0
+for op in and or +; do
+    case $op in
+        and) term="x < 2" ;;
+        or) term="x > 2" ;;
+        +) term="x" ;;
+    esac
+    chain=$(seq "$n" | sed "s/.*/$term/" | paste -s -d '~' | sed "s/~/ $op /g")
+    f="$out/Chain.qk"
+    if [ "$op" = "+" ]; then
+        printf 'x = 1;\ny = %s;\ny.print();\n' "$chain" > "$f"
+    else
+        printf 'x = 1;\nif (%s) {\n    "yes".print();\n}\nb = %s;\n' "$chain" "$chain" > "$f"
+    fi
+    for level in 0 1 2; do
+        if ! python quack.py --no-cache -O$level --obj-dir "$out/obj-O$level" "$f" > /dev/null 2> "$out/err"; then
+            echo "a chain of $n '$op' does not compile at -O$level: $(tail -1 "$out/err")"
+            failed=1
+        fi
+    done
+done
+rm -rf "$out"
+exit $failed
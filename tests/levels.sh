@@ -0,0 +1,36 @@
+# compile and run programs at -O0, -O1 and -O2 and check that they print the same at every level
+# usage: sh tests/levels.sh [file.qk ...]    (default: every tests/*.qk but the bad_ ones)
+# run from the repository root; TINY_VM names the vm to run (default vm/bin/tiny_vm)
+vm="${TINY_VM:-vm/bin/tiny_vm}"
+files="$*"
+[ -z "$files" ] && files=$(ls tests/*.qk | grep -v "/bad_")
+
+out=$(mktemp -d)
+failed=0
+for f in $files; do
+    filename=$(basename -- "$f")
+    filename="${filename%.*}"
+    main="$(echo "$filename" | cut -c1 | tr a-z A-Z)$(echo "$filename" | cut -c2-)"
+    for level in 0 1 2; do
+        obj="$out/$filename-O$level"
+        if ! python quack.py --no-cache -O$level --obj-dir "$obj" "$f" > /dev/null 2> "$obj.err"; then
+            echo "$f: does not compile at -O$level"
+            failed=1
+            continue
+        fi
+        # a class named like the file moves the statements to Main
+        class=$main
+        [ -f "$obj/Main.json" ] && class=Main
+        timeout 10 "$vm" -L "$obj" "$class" 2> /dev/null > "$obj.out"
+        echo "exit $?" >> "$obj.out"
+    done
+    for level in 1 2; do
+        if [ -f "$out/$filename-O$level.out" ] && ! cmp -s "$out/$filename-O0.out" "$out/$filename-O$level.out"; then
+            echo "$f: -O$level prints something else than -O0"
+            diff "$out/$filename-O0.out" "$out/$filename-O$level.out"
+            failed=1
+        fi
+    done
+done
+rm -rf "$out"
+exit $failed
@@ -0,0 +1,58 @@
+"""
+Tracing for the compiler.
+
+Every subsystem logs to its own logger (quack.parser, quack.checker, quack.codegen,
+quack.ir, quack.cache, quack.daemon), and all of them are silent unless turned on with configure() / --trace.
+
+Messages use logging's %-style arguments, never f-strings: a node's __str__ formats its
+whole subtree, so it must only run when the message is actually emitted. A disabled
+call costs one level check.
+
+    python quack.py --trace parser=debug,codegen=info prog.qk
+    python quack.py --trace debug prog.qk        (every subsystem)
+"""
+import sys
+import logging
+
+SUBSYSTEMS = ["parser", "checker", "codegen", "ir", "cache", "daemon"]
+
+LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING,
+          "error": logging.ERROR, "off": logging.CRITICAL + 1}
+
+root = logging.getLogger("quack")
+# no handler means python's last resort handler prints warnings to stderr - stay silent instead
+root.addHandler(logging.NullHandler())
+root.propagate = False
+root.setLevel(logging.WARNING)
+
+parser = logging.getLogger("quack.parser")
+checker = logging.getLogger("quack.checker")
+codegen = logging.getLogger("quack.codegen")
+ir = logging.getLogger("quack.ir")
+cache = logging.getLogger("quack.cache")
+daemon = logging.getLogger("quack.daemon")
+
+_handler = None
+
+def configure(spec: str, stream=sys.stderr) -> None:
+    """
+    Turn tracing on from a spec like "parser=debug,codegen=info".
+    A bare level ("debug") applies to every subsystem.
+    """
+    global _handler
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, level = item.rpartition("=")
+        if level.lower() not in LEVELS:
+            raise ValueError(f"Unknown trace level '{level}', expected one of {', '.join(LEVELS)}")
+        if name and name not in SUBSYSTEMS:
+            raise ValueError(f"Unknown trace subsystem '{name}', expected one of {', '.join(SUBSYSTEMS)}")
+        logger = logging.getLogger(f"quack.{name}") if name else root
+        logger.setLevel(LEVELS[level.lower()])
+
+    if _handler is None:
+        _handler = logging.StreamHandler(stream)
+        _handler.setFormatter(logging.Formatter("%(name)s: %(message)s"))
+        root.addHandler(_handler)
@@ -31,7 +31,7 @@ class Configuration:
         try:
             config.read("asm.conf")
             self.tvmlib = Path(config["DEFAULT"]["TVMLIB"])
-        except FileExistsError:
+        except KeyError:
             # If no configuration file is present, we will look in ./OBJ
             self.tvmlib = Path("./OBJ")
 
@@ -58,19 +58,19 @@ def cli() -> object:
 #
 class ImportedModule:
     """Imported module uses information from
-    json file
+    json file (or from the builtin registry)
     """
-    def __init__(self, path: Path):
-        with open(path, "r") as source:
-            self.json = json.load(source)
-        # Dict from name to position would be faster, but
-        # number of lookups is very small
+    def __init__(self, record: dict):
+        self.json = record
         self.methods: List[str] = self.json["methods"]
         self.fields:  List[str] = self.json["fields"]
+        # name -> slot, so lookups do not scan the lists
+        self.method_slots = {name: i for i, name in enumerate(self.methods)}
+        self.field_slots = {name: i for i, name in enumerate(self.fields)}
 
     def method_slot(self, name: str) -> int:
-        if name in self.methods:
-            return self.methods.index(name)
+        if name in self.method_slots:
+            return self.method_slots[name]
         log.error(f"Method {name} not defined")
         return 0
 
@@ -78,17 +78,61 @@ class ImportedModule:
         return len(self.methods)
 
     def field_slot(self, name: str) -> int:
-        return self.fields.index(name)
+        try:
+            return self.field_slots[name]
+        except KeyError:
+            raise ValueError(f"{name} is not a field") from None
 
 
 IMPORTS: Dict[str, Optional[ImportedModule]] = { "$": None }
 # $ will be replaced by current class name in output .json file
 
 
+# Parsed object files by path, with the (mtime, size) they were read at.
+# A long-lived process (quackd, batch workers) parses each one only once
+# instead of once per translate, and re-reads it when the file changes.
+MODULE_CACHE: Dict[Path, Tuple[Tuple[int, int], ImportedModule]] = {}
+
+
+def load_module(path: Path) -> ImportedModule:
+    stat = path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = MODULE_CACHE.get(path)
+    if cached is None or cached[0] != stamp:
+        with open(path, "r") as source:
+            cached = (stamp, ImportedModule(json.load(source)))
+        MODULE_CACHE[path] = cached
+    return cached[1]
+
+
+# The builtin classes, from the registry that
+# build_builtin_registry.py generates from OBJ/
+# and builtins.c; read once, instead of a stub
+# object file per builtin class per translation
+BUILTIN_REGISTRY = Path(__file__).parent / "builtins.json"
+
+
+def load_builtins(path: Path) -> Dict[str, ImportedModule]:
+    try:
+        with open(path, "r") as source:
+            classes = json.load(source)["classes"]
+    except OSError:
+        log.warning(f"No builtin registry {path}, importing builtins from object files")
+        return {}
+    return {name: ImportedModule({"methods": [m["name"] for m in record["methods"]],
+                                  "fields": record["fields"]})
+            for name, record in classes.items()}
+
+
+BUILTINS = load_builtins(BUILTIN_REGISTRY)
+
+
 def import_module(module: str) -> ImportedModule:
+    if module not in IMPORTS and module in BUILTINS:
+        IMPORTS[module] = BUILTINS[module]
     if module not in IMPORTS:
         path = CONFIG.tvmlib.joinpath(module).with_suffix(".json")
-        IMPORTS[module] = ImportedModule(path)
+        IMPORTS[module] = load_module(path)
     return IMPORTS[module]
 
 
@@ -98,6 +142,11 @@ def import_module(module: str) -> ImportedModule:
 # #define CODE_FALSE (-2)
 # #define CODE_TRUE (-3)
 #
+# call_direct operands: bits of the class index (as in vm_loader.c)
+DIRECT_CLASS_BITS = 5
+# tail_call operands: bits of each argument count (as in vm_ops.c)
+TAIL_ARITY_BITS = 4
+
 NAMED_LITERALS = {
     "nothing": -1,
     "false": -2,
@@ -163,7 +212,8 @@ class InstructionSet:
 
 
 # Instruction set is global
-INSTRS = InstructionSet("opdefs.txt")
+# (opdefs.txt sits next to this file, so the assembler can be imported from anywhere)
+INSTRS = InstructionSet(Path(__file__).parent / "opdefs.txt")
 
 
 class Instruction:
@@ -230,10 +280,11 @@ class ObjectCode:
         super_module = import_module(super_name)
         # Methods and field list are initially those
         # we inherit, but may be extended elsewhere
-        # in the assembly code
-        self.method_list = super_module.methods
+        # in the assembly code (copies: the module
+        # record is shared through MODULE_CACHE)
+        self.method_list = list(super_module.methods)
         self.n_inherited = len(super_module.methods)
-        self.field_list = super_module.fields
+        self.field_list = list(super_module.fields)
         # AND we need to be able to refer to this class in NEW
 
     def declare_field(self, name: str):
@@ -269,6 +320,7 @@ class ObjectCode:
         method_slot = self.method_list.index(method_name)
         # Initialize code block
         self.method_locals = []
+        self.method_args = []
         self.code = []  # We will append instructions to this list
         self.method_code.append({"name": method_name, "slot": method_slot,
                                  "code": self.code})
@@ -288,7 +340,11 @@ class ObjectCode:
         fp+2 is saved frame pointer;
         local variables start at fp+3
         arguments start at fp-1
+        A compiler that allocates frame slots itself
+        gives the offset directly (load 3, load -1).
         """
+        if re.fullmatch("-?[0-9]+", var):
+            return int(var)
         if var == "$":
             # Special case for the "this" variable
             return 0
@@ -305,8 +361,9 @@ class ObjectCode:
         """Resolve "Class:method" to slot number"""
         class_name, method_name = full_name.split(":")
         try:
-            if class_name == "$":
-                # This class
+            if class_name in ("$", self.class_name):
+                # This class (by name: a method called on another
+                # object of the class, as in recursion)
                 method_slot = self.method_list.index(method_name)
             else:
                 # Imported class
@@ -321,7 +378,7 @@ class ObjectCode:
         """Resolve Class:field to slot number"""
         class_name, field_name = full_name.split(":")
         try:
-            if class_name == "$":
+            if class_name in ("$", self.class_name):
                 # This class
                 field_slot = self.field_list.index(field_name)
             else:
@@ -391,7 +448,7 @@ class ObjectCode:
             # in the loader.
             if operand in NAMED_LITERALS:
                 return NAMED_LITERALS[operand]
-            if re.match("[0-9]+", operand):
+            if re.match("-?[0-9]+", operand):
                 kind = "i"
             elif re.match('["][^"]*["]', operand):
                 kind = "s"
@@ -405,6 +462,28 @@ class ObjectCode:
         if op == "call":
             slot = self.resolve_call(operand)
             return slot
+        if op == "call_direct":
+            # The class (index into the list of modules) in the low bits and the
+            # method's slot above them; the loader puts the method's address in
+            class_name = operand.split(":")[0]
+            index = self.resolve_class(class_name)
+            if index >= 1 << DIRECT_CLASS_BITS:
+                log.error(f"call_direct '{operand}': {class_name} is import {index}, "
+                          f"at most {(1 << DIRECT_CLASS_BITS) - 1} fit")
+                return 0
+            return index | self.resolve_call(operand) << DIRECT_CLASS_BITS
+        if op == "tail_call":
+            # Class:method:arity.  The current method's argument count, then the
+            # callee's, in the low bits (the vm moves that many words) and the
+            # method's slot above them
+            class_name, method_name, arity = operand.split(":")
+            limit = 1 << TAIL_ARITY_BITS
+            if len(self.method_args) >= limit or int(arity) >= limit:
+                log.error(f"tail_call '{operand}' from a method of {len(self.method_args)} arguments: "
+                          f"at most {limit - 1} fit")
+                return 0
+            slot = self.resolve_call(f"{class_name}:{method_name}")
+            return len(self.method_args) | int(arity) << TAIL_ARITY_BITS | slot << 2 * TAIL_ARITY_BITS
         if op in ["load_field", "store_field"]:
             # These operations use indexes into the fields of an object
             slot = self.resolve_field(operand)
@@ -413,7 +492,7 @@ class ObjectCode:
             # We use an index into the list of modules
             slot = self.resolve_class(operand)
             return slot
-        if op in ["load", "store"]:
+        if op in ["load", "store", "unbox", "box", "incr", "below"]:
             return self.resolve_local(operand)
         if op in ["return",  "alloc", "roll"]:
             # These operations have integer operands that should be
@@ -467,7 +546,7 @@ INSTR_PAT = re.compile(r"""
     \s*
     (?P<opname> [a-zA-Z_]+)      # Operation name is required
     (\s+ (?P<operand>     # Operands are integers, quoted strings, or names
-             [0-9]+           # Integers are strings of digits
+             -?[0-9]+         # Integers are strings of digits (frame offsets may be negative)
            |
              ["](             # String begins and ends with quote 
                ([\\].)  |           # Anything escaped
@@ -0,0 +1,126 @@
+"""Build the registry of builtin classes (builtins.json).
+
+The method slots and fields of each builtin class come from its
+stub object code in OBJ/ (what the assembler links against).  Each
+slot is checked against the class's vtable in builtins.c: a method
+the VM does not implement is recorded with no native code, and the
+number of arguments a native method pops on return is its arity.
+Argument and return types are not in either file; they are given
+in SIGNATURES below and must agree with that arity.
+
+    python build_builtin_registry.py            (writes builtins.json)
+
+Regenerate it whenever OBJ/ or builtins.c change.  The compiler
+(registry.py) and the assembler load it once at startup.
+"""
+import re
+import sys
+import json
+import argparse
+import datetime
+from pathlib import Path
+
+import logging
+logging.basicConfig()
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+BUILTIN_CLASSES = ["Obj", "Int", "String", "Bool", "Nothing"]
+
+# Class names in builtins.c that differ from the object code names
+C_NAMES = {"Bool": "Boolean"}
+
+# (argument types, return type) of each builtin method;
+# "$" is the class the method is called on
+SIGNATURES = {
+    "$constructor": ([], "$"),
+    "string": ([], "String"),
+    "print": ([], "Nothing"),
+    "equals": (["$"], "Bool"),
+    "less": (["$"], "Bool"),
+    "plus": (["$"], "$"),
+    "minus": (["$"], "$"),
+    "multiply": (["$"], "$"),
+    "divide": (["$"], "$"),
+    "negate": ([], "$"),
+}
+
+METHOD_PAT = re.compile(r"vm_Word\s+(?P<name>method_\w+)\s*\[\]\s*=\s*\{(?P<body>.*?)\};", re.DOTALL)
+RETURN_PAT = re.compile(r"vm_op_return\s*\}\s*,\s*\{\s*\.intval\s*=\s*(?P<n>[0-9]+)")
+CLASS_PAT = re.compile(r"struct\s+class_struct\s+the_class_(?P<name>\w+)_struct\s*=\s*\{(?P<body>.*?)\n\s*\};", re.DOTALL)
+VTABLE_ENTRY_PAT = re.compile(r"\bmethod_\w+")
+
+
+def cli() -> object:
+    """Command line interface"""
+    here = Path(__file__).parent
+    parser = argparse.ArgumentParser(prog="build_builtin_registry.py",
+                     description="Build the builtin class registry")
+    parser.add_argument("--obj", type=Path, default=here / "OBJ",
+                        help="Directory with the builtin classes' object code")
+    parser.add_argument("--source", type=Path, default=here / "builtins.c",
+                        help="VM source defining the builtin vtables")
+    parser.add_argument("outfile", type=Path, nargs="?", default=here / "builtins.json",
+                        help="Put the registry here")
+    return parser.parse_args()
+
+
+def native_tables(source: str) -> tuple[dict, dict]:
+    """Arity of each native method (the operand of its return),
+    and the vtable (native method names by slot) of each class.
+    """
+    arity = {}
+    for m in METHOD_PAT.finditer(source):
+        returns = RETURN_PAT.findall(m.group("body"))
+        if returns:
+            arity[m.group("name")] = int(returns[-1])
+    vtables = {}
+    for c in CLASS_PAT.finditer(source):
+        vtables[c.group("name")] = VTABLE_ENTRY_PAT.findall(c.group("body"))
+    return arity, vtables
+
+
+def build(obj_dir: Path, source: str) -> dict:
+    arity, vtables = native_tables(source)
+    ok = True
+    classes = {}
+    for name in BUILTIN_CLASSES:
+        with open(obj_dir / f"{name}.json", "r") as f:
+            obj = json.load(f)
+        vtable = vtables[C_NAMES.get(name, name)]
+        methods = []
+        for slot, method in enumerate(obj["methods"]):
+            native = vtable[slot] if slot < len(vtable) else None
+            params, returns = SIGNATURES[method]
+            params = [name if p == "$" else p for p in params]
+            returns = name if returns == "$" else returns
+            if native is None:
+                log.warning(f"{name}:{method} (slot {slot}) has no native code in the vm")
+            elif method != "$constructor" and arity.get(native) != len(params):
+                log.error(f"{name}:{method} pops {arity.get(native)} arguments, "
+                          f"its signature has {len(params)}")
+                ok = False
+            methods.append({"name": method, "slot": slot, "params": params,
+                            "returns": returns, "native": native})
+        classes[name] = {"super": obj["super"], "fields": obj["fields"], "methods": methods}
+    if not ok:
+        sys.exit(1)
+    return classes
+
+
+def main():
+    args = cli()
+    with open(args.source, "r") as f:
+        source = f.read()
+    registry = {
+        "generated": f"{datetime.datetime.now()} by build_builtin_registry.py "
+                     f"from {args.obj.name}/ and {args.source.name}, do not edit",
+        "classes": build(args.obj, source),
+    }
+    with open(args.outfile, "w") as f:
+        json.dump(registry, f, indent=2)
+        f.write("\n")
+    log.info(f"Wrote {args.outfile}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 
 /**
  * GENERATED CODE, DO NOT EDIT
- * Generated 2024-04-08 18:36:26.194395 by build_bytecode_table.py
+ * Generated 2026-10-18 08:41:08.425844 by build_bytecode_table.py
  * 
  * Integer encoding of VM operations ---
  * Map those integer encodings to function pointers (for executing)
@@ -29,6 +29,12 @@ op_tbl_entry vm_op_bytecodes[] = {
 	 { "jump_if", vm_op_jump_if, 1 }, //15  Conditional relative jump, if true
 	 { "jump_ifnot", vm_op_jump_ifnot, 1 }, //16  Conditional relative jump, if false
 	 { "is_instance", vm_op_is_instance, 1 }, //17  Test membership in class (for typecase)
+	 { "call_direct", vm_op_call_direct, 1 }, //18  Call a method whose code is known when loading
+	 { "tail_call", vm_op_tail_call, 1 }, //19  Call a method in place of the current one (reusing its frame)
+	 { "unbox", vm_op_unbox, 1 }, //20  Store an Int's value (a C int) to a local, for counted loops
+	 { "box", vm_op_box, 1 }, //21  Push an Int made from such a local
+	 { "incr", vm_op_incr, 1 }, //22  Add 1 to such a local
+	 { "below", vm_op_below, 1 }, //23  Compare such a local with an Int: push true if less
 
     { 0, 0, 0}  // SENTRY
 };
@@ -45,6 +45,34 @@ static void set_loaded(class_ref c) {
     return;
 }
 
+/* A call_direct operand names a class (index in the imports, low
+ * DIRECT_CLASS_BITS bits) and a vtable slot (the rest).  That class may
+ * not have its methods yet (it may be the one being loaded, or import
+ * it), so the code addresses are filled in once the outermost load is
+ * done.
+ */
+#define DIRECT_CLASS_BITS 5
+static struct direct_call {
+    int code_index;
+    class_ref clazz;
+    int slot;
+} *direct_calls;
+static int n_direct_calls;
+static int direct_calls_capacity;
+static int load_depth;
+
+static void resolve_direct_calls(void) {
+    for (int i = 0; i < n_direct_calls; ++i) {
+        vm_addr method_addr = direct_calls[i].clazz->vtable[direct_calls[i].slot];
+        log_debug("Direct call at %d to %s slot %d",
+                  direct_calls[i].code_index,
+                  direct_calls[i].clazz->header.class_name,
+                  direct_calls[i].slot);
+        vm_code_block[direct_calls[i].code_index] = (vm_Word) {.code_addr = method_addr};
+    }
+    n_direct_calls = 0;
+}
+
 /* Initialize loader
  * (loads built-in classes, dummy main program,
  * special named constants)
@@ -226,6 +254,7 @@ static int load_json(char buf[]) {
         perror("load_json in vm_loader.c: Failed to parse buffer. ");
         assert(tree);  // Will definitely abort
     }
+    ++load_depth;
 
     /* module constant index -> global constant index */
     int constant_renumber_map[30];
@@ -301,6 +330,9 @@ static int load_json(char buf[]) {
         the_class->vtable[method_slot] = method_start_addr;
     }
     cJSON_Delete(tree);
+    if (--load_depth == 0) {
+        resolve_direct_calls();
+    }
     return 1;
 }
 
@@ -349,6 +381,19 @@ vm_Word *translate_method_code(cJSON *ops, int const_map[], class_ref class_map[
                           clazz->header.class_name);
                 vm_code_block[vm_code_index++] = (vm_Word)
                         {.clazz = clazz};
+            } else if (vm_op_bytecodes[opcode].instr == vm_op_call_direct) {
+                if (n_direct_calls == direct_calls_capacity) {
+                    // the sites of every class the outermost load brings in wait here
+                    direct_calls_capacity = direct_calls_capacity ? 2 * direct_calls_capacity : 256;
+                    direct_calls = realloc(direct_calls, direct_calls_capacity * sizeof(struct direct_call));
+                    assert(direct_calls != NULL);
+                }
+                direct_calls[n_direct_calls].code_index = vm_code_index;
+                direct_calls[n_direct_calls].clazz =
+                        class_map[operand & ((1 << DIRECT_CLASS_BITS) - 1)];
+                direct_calls[n_direct_calls].slot = operand >> DIRECT_CLASS_BITS;
+                ++n_direct_calls;
+                vm_code_block[vm_code_index++] = (vm_Word) {.intval = 0};
             } else {
                 vm_code_block[vm_code_index++] = (vm_Word)
                         {.intval = operand};
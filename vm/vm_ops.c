@@ -88,6 +88,48 @@ extern void vm_op_methodcall(void) {
     return;
 }
 
+/* Call a method whose code address follows, without
+ * looking it up in the receiver's vtable.  The frame is
+ * the one vm_op_methodcall builds.
+ */
+extern void vm_op_call_direct(void) {
+    vm_addr method_addr = vm_fetch_next().code_addr;
+    vm_addr new_fp = vm_sp;
+    vm_frame_push_word((vm_Word) {.code_addr = vm_pc});
+    vm_frame_push_word((vm_Word) {.frame_addr = vm_fp});
+    vm_fp = new_fp;
+    vm_pc = method_addr;
+}
+
+/* Call a method in place of the current one: move its
+ * arguments and receiver down over the current frame, then
+ * build the frame vm_op_methodcall would, returning where the
+ * current method would have.
+ */
+extern void vm_op_tail_call(void) {
+    int operand = vm_fetch_next().intval;
+    int caller_arity = operand & 15;
+    int callee_arity = (operand >> 4) & 15;
+    int method_index = operand >> 8;
+    vm_Word return_addr = *(vm_fp + 1);
+    vm_Word saved_fp = *(vm_fp + 2);
+    vm_addr base = vm_fp - caller_arity;
+    vm_addr args = vm_sp - callee_arity;
+    for (int i = 0; i <= callee_arity; ++i) {
+        base[i] = args[i];
+    }
+    vm_sp = base + callee_arity;
+    vm_addr new_fp = vm_sp;
+    vm_frame_push_word(return_addr);
+    vm_frame_push_word(saved_fp);
+    vm_fp = new_fp;
+    obj_ref receiver = (*vm_fp).obj;
+    check_health_object(receiver);
+    class_ref clazz = receiver->header.clazz;
+    check_health_class(clazz);
+    vm_pc = clazz->vtable[method_index];
+}
+
 /* Trampoline to a native method.
  * Wrap this inside an interpreted method
  * to handle the frame layout properly.
@@ -261,6 +303,43 @@ extern void vm_op_store() {
     return;
 }
 
+/* Counted loops keep their counter in a frame slot as a C int,
+ * not an Int object, so an iteration allocates nothing unless
+ * the loop body uses the counter (box).  The compiler never
+ * loads or stores such a slot.
+ *
+ * unbox n: [i] -> [], fp+n holds the value of Int i
+ */
+extern void vm_op_unbox() {
+    int variable_frame_index = vm_fetch_next().intval;
+    obj_ref value = vm_eval_pop();
+    assert_is_type(value, the_class_Int);
+    (vm_fp + variable_frame_index)->intval = ((obj_Int) value)->value;
+}
+
+/* box n: [] -> [i], i a new Int with the value at fp+n */
+extern void vm_op_box() {
+    int variable_frame_index = vm_fetch_next().intval;
+    vm_eval_push(new_int((vm_fp + variable_frame_index)->intval));
+}
+
+/* incr n: [] -> [], the value at fp+n is one more */
+extern void vm_op_incr() {
+    int variable_frame_index = vm_fetch_next().intval;
+    (vm_fp + variable_frame_index)->intval += 1;
+}
+
+/* below n: [bound] -> [b], b whether the value at fp+n is less
+ * than Int bound
+ */
+extern void vm_op_below() {
+    int variable_frame_index = vm_fetch_next().intval;
+    obj_ref bound = vm_eval_pop();
+    assert_is_type(bound, the_class_Int);
+    int below = (vm_fp + variable_frame_index)->intval < ((obj_Int) bound)->value;
+    vm_eval_push(below ? lit_true : lit_false);
+}
+
 /* Allocate stack space for local variables.
  * (i) [] -> [ n1, n2, ..., ni ]   (As many nothing objects as allocated)
  */
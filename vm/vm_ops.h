@@ -25,6 +25,27 @@ extern void vm_op_halt(void);
  */
 extern void vm_op_methodcall(void);
 
+/* Call a method whose code the compiler determined (no
+ * class can override it), without going through the vtable.
+ * Next word is the address of the method's code, filled in
+ * by the loader.
+ *
+ * vm_op_call_direct(code_addr): [arg, arg, ...,  receiver] -> [result]
+ */
+extern void vm_op_call_direct(void);
+
+/* Call a method in tail position (its result is returned at
+ * once): the callee's arguments and receiver take the place of
+ * the caller's, and it returns straight to the caller's caller,
+ * so the frame stack does not grow.  Next word holds the
+ * caller's arity (low 4 bits), the callee's arity (next 4
+ * bits) and the method index in the vtable (the rest).
+ *
+ * vm_op_tail_call(arities, m_index):
+ *    [arg, ..., this, ret, fp, locals ..., arg, ..., receiver] -> [arg, ..., receiver]
+ */
+extern void vm_op_tail_call(void);
+
 /* Trampoline to a native method.
  * Wrap this inside an interpreted method
  * to handle the frame layout properly.
@@ -102,6 +123,14 @@ extern void vm_op_roll();  // Roll suffix of stack
 extern void vm_op_store();  // Store into local variable at fp+n
 extern void vm_op_load();   // Load from local variable at fp+n
 
+/* Counters of counted loops (for i in a..b), kept in a frame
+ * slot as a C int instead of an Int object
+ */
+extern void vm_op_unbox();  // [Int] -> [], fp+n holds its value
+extern void vm_op_box();    // [] -> [Int], the value at fp+n
+extern void vm_op_incr();   // [] -> [], add 1 to the value at fp+n
+extern void vm_op_below();  // [Int] -> [Bool], whether the value at fp+n is less
+
 /* Fields of objects */
 extern void vm_op_load_field();  // Load from field of object
 // store_field n: [value target] -> [], target.fields[n] = value
@@ -26,7 +26,11 @@ char *guess_description(vm_Word w);
  */
 vm_Word vm_fetch_next(void) {
     vm_Word cur = (*vm_pc);
-    if (vm_pc >= vm_code_block && vm_pc < vm_code_block + CODE_CAPACITY) {
+    // guess_description is costly, and not safe on every word:
+    // only call it when the description will be logged
+    if (LOGGING > DEBUG) {
+        // not logging
+    } else if (vm_pc >= vm_code_block && vm_pc < vm_code_block + CODE_CAPACITY) {
         // Looks like we are executing an instruction in the main
         // code memory
         int word_number = vm_pc - vm_code_block;
@@ -218,8 +222,10 @@ char *guess_description(vm_Word w) {
             return name;
         }
     }
-    /*  A small integer constant? */
-    if (w.intval >= -1000 && w.intval <= 1000) {
+    /*  A small integer constant?  (Or an operand: tail_call
+     *  packs two arities and a method index into one.)
+     */
+    if (w.intval >= -(1 << 20) && w.intval <= 1 << 20) {
         sprintf(buff, "(int) %d", w.intval);
         return buff;
     }
@@ -255,6 +261,9 @@ char *guess_description(vm_Word w) {
 void stack_dump(int n_words) {
     const char* fp_ind = "-fp->";
     const char* not_fp = "     ";
+    if (LOGGING > DEBUG) {
+        return;
+    }
     log_debug("===");
     vm_addr top = vm_sp;
     int depth = top - vm_frame_stack;
@@ -283,8 +292,9 @@ void stack_dump(int n_words) {
 /* One execution step, at current PC */
 void vm_step() {
     vm_Instr instr = vm_fetch_next().instr;
-    char *name = guess_description((vm_Word) instr);
-    log_debug("Step:  %s",name );
+    if (LOGGING <= DEBUG) {
+        log_debug("Step:  %s", guess_description((vm_Word) instr));
+    }
     (*instr)();
     health_check_builtins();
     stack_dump(8);